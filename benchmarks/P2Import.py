@@ -41,6 +41,8 @@ class P2Import(object):
         print(f'--- file size:', bytes2str(file_size))
 
         def import_one() -> int:
+            # Runs within `bulk_load`, so the time of
+            # rebuilding the indexes is also measured.
             import_texts(tdb, dataset_path)
             return tdb.count_texts()
 
@@ -20,9 +20,10 @@ class P3Bench(object):
         5. Clearing all the data (if needed).
     """
 
-    def __init__(self, max_seconds_per_query=30):
+    def __init__(self, max_seconds_per_query=30, queries_per_batch=100):
         self.conf = P0Config.shared()
         self.max_seconds_per_query = max_seconds_per_query
+        self.queries_per_batch = queries_per_batch
         self.tasks = P3TasksSampler()
         allow_big_csv_fields()
 
@@ -54,6 +55,10 @@ class P3Bench(object):
             name='Random Reads: Lookup Doc by ID',
             func=self.get
         )
+        self.bench_task(
+            name='Random Reads: Lookup Docs Batch',
+            func=self.get_many
+        )
 
         # Queries returning collections.
         self.bench_task(
@@ -81,15 +86,44 @@ class P3Bench(object):
             func=lambda: self.find_substrings(
                 max_matches=20, queries=self.tasks.long_phrases_to_search)
         )
-        # for regex_template in self.tasks.regexs_to_search:
-        #     name = 'Random Reads: Find up to 20 RegEx Matches ({})'.format(
-        #         regex_template['Name'])
-        #     regexs = regex_template['Tasks']
-        #     self.bench_task(
-        #         name=name,
-        #         func=lambda: self.find_regex(
-        #             regexs=regexs, max_matches=20)
-        #     )
+
+        # Same queries, but submitted in batches.
+        self.bench_task(
+            name='Random Reads: Find up to 20 Docs containing a Short Word (Batched)',
+            func=lambda: self.find_substrings_batched(
+                max_matches=20, queries=self.tasks.short_words_to_search)
+        )
+        self.bench_task(
+            name='Random Reads: Find up to 20 Docs with Short Phrases (Batched)',
+            func=lambda: self.find_substrings_batched(
+                max_matches=20, queries=self.tasks.short_phrases_to_search)
+        )
+        self.bench_task(
+            name='Random Reads: Find up to 20 Docs containing a Long Word (Batched)',
+            func=lambda: self.find_substrings_batched(
+                max_matches=20, queries=self.tasks.long_words_to_search)
+        )
+        self.bench_task(
+            name='Random Reads: Find up to 20 Docs with Long Phrases (Batched)',
+            func=lambda: self.find_substrings_batched(
+                max_matches=20, queries=self.tasks.long_phrases_to_search)
+        )
+
+        # RegEx queries are translated for every backend by `plan_regex`.
+        for regex_template in self.tasks.regexs_to_search:
+            name = 'Random Reads: Find up to 20 RegEx Matches ({})'.format(
+                regex_template['Name'])
+            regexs = regex_template['Tasks']
+            self.bench_task(
+                name=name,
+                func=lambda regexs=regexs: self.find_regex(
+                    regexs=regexs, max_matches=20)
+            )
+            self.bench_task(
+                name=name.replace(')', ', Batched)'),
+                func=lambda regexs=regexs: self.find_regex_batched(
+                    regexs=regexs, max_matches=20)
+            )
 
         # Reversable write operations.
         self.bench_task(
@@ -154,6 +188,20 @@ class P3Bench(object):
         print(f'---- {cnt} ops: {cnt_found} ID matches')
         return cnt
 
+    def get_many(self) -> int:
+        cnt = 0
+        cnt_found = 0
+        t0 = time()
+        for doc_ids in chunks(self.tasks.doc_ids_to_query, self.queries_per_batch):
+            matches = self.tdb.get_many(doc_ids)
+            cnt += len(doc_ids)
+            cnt_found += sum(m is not None for m in matches)
+            dt = time() - t0
+            if dt > self.max_seconds_per_query:
+                break
+        print(f'---- {cnt} ops: {cnt_found} ID matches')
+        return cnt
+
     def find_substrings(self, max_matches: int, queries: list) -> int:
         cnt = 0
         cnt_found = 0
@@ -168,7 +216,39 @@ class P3Bench(object):
         print(f'---- {cnt} ops: {cnt_found} matches found')
         return cnt
 
+    def find_substrings_batched(self, max_matches: int, queries: list) -> int:
+        cnt = 0
+        cnt_found = 0
+        t0 = time()
+        for qs in chunks(queries, self.queries_per_batch):
+            results = self.tdb.find_substring_many(
+                queries=qs, max_matches=max_matches)
+            cnt += len(qs)
+            cnt_found += sum(map(len, results))
+            dt = time() - t0
+            if dt > self.max_seconds_per_query:
+                break
+        print(f'---- {cnt} ops: {cnt_found} matches found')
+        return cnt
+
+    def find_regex_batched(self, regexs, max_matches: int = None) -> int:
+        cnt = 0
+        cnt_found = 0
+        t0 = time()
+        for qs in chunks(regexs, self.queries_per_batch):
+            results = self.tdb.find_regex_many(
+                queries=qs, max_matches=max_matches)
+            cnt += len(qs)
+            cnt_found += sum(map(len, results))
+            dt = time() - t0
+            if dt > self.max_seconds_per_query:
+                break
+        print(f'---- {cnt} ops: {cnt_found} matches found')
+        return cnt
+
     def find_regex(self, regexs, max_matches: int = None) -> int:
+        if regexs:
+            print(self.tdb.explain(regexs[0]))
         cnt = 0
         cnt_found = 0
         t0 = time()
@@ -20,7 +20,7 @@ class P3TasksSampler(object):
         {
             "Name": "An Email at Random Domain",
             "Example": "employee@RANDOM.com",
-            "Template": r"[A-Za-z0-9\._]+@${RANDOM}\.[a-z]{2, 6}",
+            "Template": r"[A-Za-z0-9\._]+@${RANDOM}\.[a-z]{2,6}",
             "Tasks": [],
         },
         {
@@ -32,7 +32,7 @@ class P3TasksSampler(object):
         {
             "Name": "A Complex Date Pattern + Random Word",
             "Example": "23-02 234 BCE RANDOM",
-            "Template": r"\d{1, 2}[./:\-, ]\d{1, 2}[./:\-, ]\d{1, 4}[]?(CE|BCE|BC|AD)? ${RANDOM}",
+            "Template": r"\d{1,2}[./:\-, ]\d{1,2}[./:\-, ]\d{1,4} ?(CE|BCE|BC|AD)? ${RANDOM}",
             "Tasks": [],
         },
         {
@@ -100,7 +100,9 @@ class P3TasksSampler(object):
             chunks(self._buffer_texts[:self.count_changes], 500))
 
         # We add random words to avoid cache matches.
-        self.regexs_to_search = type(self).__regex_templates__
+        # Copies, so tasks don't pile up in the class-level templates.
+        self.regexs_to_search = [dict(family, Tasks=[])
+                                 for family in type(self).__regex_templates__]
         ws_regex = sample_reservoir(all_words, cnt_wanted)
         for family in self.regexs_to_search:
             template = family['Template']
@@ -28,7 +28,7 @@ class P4Print():
         out = Report()
         dbs = [
             'MongoDB', 'ElasticSearch',
-            'UnumDB',
+            'SuffixArray', 'SQLite', 'UnumDB',
         ]  # ins.subset().unique('database')
         dataset_names = [
             'Covid19',
@@ -0,0 +1,77 @@
+import os
+import sys
+import json
+import subprocess
+from typing import List, Optional, Dict, Generator, Set, Tuple, Sequence
+
+
+class P5ImportTime(object):
+    """
+        Measures the cold-start cost of every backend in fresh interpreters:
+        the time of importing it, the time of importing just its drivers,
+        and checks, that no drivers of other backends get loaded.
+        Fails, if the package adds more than `MAX_IMPORT_OVERHEAD_MS`
+        on top of the drivers, or if foreign drivers are imported.
+    """
+
+    # Modules of drivers, that every backend is allowed to load.
+    drivers = {
+        'PyStorageTexts': [],
+        'PyStorageTexts.ElasticSearch': ['elasticsearch'],
+        'PyStorageTexts.MongoDB': ['pymongo', 'bson'],
+        'PyStorageTexts.SQLite': ['sqlalchemy', 'sqlalchemy.orm'],
+        'PyStorageTexts.SuffixArray': ['numpy'],
+        'PyStorageTexts.TrigramIndex': [],
+    }
+    all_drivers = [
+        'elasticsearch', 'pymongo', 'bson', 'motor',
+        'sqlalchemy', 'sqlalchemy_utils', 'numpy',
+    ]
+
+    def __init__(self):
+        self.count_runs = int(os.getenv('COUNT_IMPORT_RUNS', '5'))
+        self.max_overhead_ms = float(os.getenv('MAX_IMPORT_OVERHEAD_MS', '100'))
+
+    def run(self) -> bool:
+        ok = True
+        print('| Module | Import, ms | Drivers, ms | Overhead, ms | Foreign Drivers |')
+        print('|:-------|-----------:|------------:|-------------:|:----------------|')
+        for module, drivers in self.drivers.items():
+            elapsed, loaded = self.measure([module])
+            elapsed_drivers, _ = self.measure(drivers) if drivers else (0.0, [])
+            overhead = elapsed - elapsed_drivers
+            foreign = [d for d in loaded if d not in drivers]
+            print(f'| {module} | {elapsed:.1f} | {elapsed_drivers:.1f} | {overhead:.1f} | {", ".join(foreign)} |')
+            if foreign or overhead > self.max_overhead_ms:
+                ok = False
+        return ok
+
+    def measure(self, modules: List[str]) -> Tuple[float, List[str]]:
+        """
+            Imports the `modules` in a new interpreter `count_runs` times,
+            returning the fastest time in milliseconds and the drivers,
+            that ended up in `sys.modules`.
+        """
+        script = f"""
+import sys, time, json
+start = time.perf_counter()
+for m in {modules!r}:
+    __import__(m)
+elapsed = (time.perf_counter() - start) * 1000
+loaded = [d for d in {self.all_drivers!r} if d in sys.modules]
+print(json.dumps([elapsed, loaded]))
+"""
+        results = list()
+        for _ in range(self.count_runs):
+            output = subprocess.run(
+                [sys.executable, '-c', script],
+                check=True,
+                stdout=subprocess.PIPE,
+            ).stdout
+            results.append(json.loads(output))
+        return min(r[0] for r in results), results[0][1]
+
+
+if __name__ == '__main__':
+    if not P5ImportTime().run():
+        sys.exit(1)
@@ -1,8 +1,11 @@
 import os
+import re
 from abc import ABC, abstractmethod
 from typing import List, Optional, Dict, Generator, Set, Tuple, Sequence
 import concurrent.futures
 import collections
+import contextlib
+from itertools import chain
 
 from PyStorageHelpers import *
 
@@ -13,8 +16,15 @@ class BaseAPI(object):
         It's designed with JSON files in mind.
     """
     __max_batch_size__ = 1000
+    __max_writers__ = 1
     __is_concurrent__ = True
     __in_memory__ = False
+    # RegEx queries are translated into this dialect of `plan_regex`.
+    __regex_dialect__ = 'python'
+    # Literal RegEx queries can be answered by `find_substring`, if it's exact.
+    __exact_substrings__ = True
+    # Anchored RegEx queries can scan a range of an ordered index of contents.
+    __prefix_scans__ = False
 
 # region Metadata
 
@@ -26,12 +36,23 @@ class BaseAPI(object):
     def count_texts(self) -> int:
         return 0
 
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
 
 # region Random Writes
 
     @abstractmethod
     def add(self, one_or_many_texts, upsert=True) -> int:
-        if isinstance(one_or_many_texts, collections.Sequence):
+        if isinstance(one_or_many_texts, TextBatch):
+            return self.add(list(one_or_many_texts), upsert=upsert)
+        elif isinstance(one_or_many_texts, collections.Sequence):
             return int(sum(map(self.add, one_or_many_texts)))
         elif isinstance(one_or_many_texts, Text):
             return self.add([one_or_many_texts])
@@ -53,14 +74,129 @@ class BaseAPI(object):
 # region Bulk Writes
 
     @abstractmethod
-    def add_stream(self, stream, upsert=False) -> int:
-        cnt_success = 0
-        for texts_batch in chunks(stream, type(self).__max_batch_size__):
-            try:
-                cnt_success += self.add(texts_batch, upsert=upsert)
-            except:
-                pass
-        return cnt_success
+    def add_stream(self, stream, upsert=False, writers: Optional[int] = None, processes: Optional[int] = None) -> int:
+        return int(sum(self.add_batches(
+            stream,
+            upsert=upsert,
+            writers=writers,
+            processes=processes,
+        )))
+
+    def add_batches(
+        self,
+        stream,
+        upsert=False,
+        writers: Optional[int] = None,
+        processes: Optional[int] = None,
+        ordered=False,
+        max_pending: Optional[int] = None,
+    ) -> Generator[int, None, None]:
+        """
+            Splits the stream into batches and writes them from a pool of
+            `writers` threads, while this thread keeps reading the stream.
+            Yields the number of imported documents per batch, in the
+            original order if `ordered`, otherwise as they complete.
+            At most `max_pending` batches are in flight at once, so memory
+            consumption doesn't depend on the size of the stream.
+
+            With `processes`, CPU-heavy serialization of every batch with
+            `batch_preparer()` is offloaded into a pool of processes.
+            Backends that aren't `__is_concurrent__` always get one writer.
+
+            Backends count partially failed batches on their own, so any
+            exception stops reading the stream. Batches already in flight
+            are drained and then the first exception is raised.
+        """
+        cls = type(self)
+        writers = writers or cls.__max_writers__
+        if not cls.__is_concurrent__:
+            writers = 1
+        max_pending = max_pending or (writers * 2)
+        preparer = self.batch_preparer() if processes else None
+        pending = collections.deque()
+        errors = list()
+
+        def write(batch) -> int:
+            return self.add_prepared(batch, upsert=upsert)
+
+        def write_when_prepared(prepared_future) -> int:
+            return write(prepared_future.result())
+
+        def completed(max_left: int) -> Generator[int, None, None]:
+            while len(pending) > max_left:
+                if ordered:
+                    done = [pending.popleft()]
+                else:
+                    done, _ = concurrent.futures.wait(
+                        pending, return_when=concurrent.futures.FIRST_COMPLETED)
+                    for f in done:
+                        pending.remove(f)
+                for f in done:
+                    if f.exception() is not None:
+                        errors.append(f.exception())
+                    else:
+                        yield f.result()
+
+        with contextlib.ExitStack() as stack:
+            threads = stack.enter_context(
+                concurrent.futures.ThreadPoolExecutor(max_workers=writers))
+            if preparer:
+                procs = stack.enter_context(
+                    concurrent.futures.ProcessPoolExecutor(max_workers=processes))
+
+            for texts_batch in self.split_stream(stream):
+                if preparer:
+                    prepared = procs.submit(preparer, texts_batch)
+                    pending.append(threads.submit(
+                        write_when_prepared, prepared))
+                else:
+                    pending.append(threads.submit(write, texts_batch))
+                yield from completed(max_pending - 1)
+                if errors:
+                    break
+            yield from completed(0)
+        if errors:
+            raise errors[0]
+
+    def split_stream(self, stream) -> Generator[object, None, None]:
+        """
+            Slices a `TextBatch`, a stream of `TextBatch`es or a stream of
+            `Text`s into batches of `__max_batch_size__` of the same kind.
+        """
+        size = type(self).__max_batch_size__
+        if isinstance(stream, TextBatch):
+            return stream.split(size)
+        stream = iter(stream)
+        first = next(stream, None)
+        if first is None:
+            return iter(())
+        stream = chain([first], stream)
+        if isinstance(first, TextBatch):
+            return rechunk_batches(stream, size)
+        return chunks(stream, size)
+
+    def batch_preparer(self):
+        """
+            Returns a picklable function, that converts a list of texts
+            into the payload accepted by `add_prepared`, or `None`,
+            if there is nothing worth offloading into other processes.
+        """
+        return None
+
+    def add_prepared(self, batch, upsert=False) -> int:
+        return self.add(batch, upsert=upsert)
+
+    @contextlib.contextmanager
+    def bulk_load(self):
+        """
+            Wraps a bulk import, during which backends may drop or postpone
+            their secondary indexes, rebuilding them once the data is loaded.
+            Everything is restored on exit, even if the load fails:
+
+                with db.bulk_load():
+                    db.add_stream(texts)
+        """
+        yield self
 
     @abstractmethod
     def clear(self):
@@ -79,7 +215,13 @@ class BaseAPI(object):
         case_sensitive: bool = True,
         max_matches: Optional[int] = None,
         include_text=True,
+        snippet_length: Optional[int] = None,
     ) -> Sequence[Text]:
+        """
+            With `snippet_length` the matches carry no `content`, only
+            `snippets` of that many characters around the first occurrence
+            and, if the backend reports them, its `spans`.
+        """
         return []
 
     @abstractmethod
@@ -89,9 +231,138 @@ class BaseAPI(object):
         case_sensitive: bool = True,
         max_matches: Optional[int] = None,
         include_text=True,
+        snippet_length: Optional[int] = None,
     ) -> Sequence[Text]:
         return []
 
+    def get_many(
+        self,
+        ids: Sequence[int],
+        include_text=True,
+        max_length: Optional[int] = None,
+    ) -> List[Optional[Text]]:
+        """
+            Returns the texts in the order of `ids`, with `None` for missing ones.
+            To reduce the payload, contents can be skipped with `include_text=False`
+            or truncated to the first `max_length` characters. Backends should
+            override it to fetch many documents per round trip and to trim
+            them on the server side.
+        """
+        return [trim_text(self.get(_id), include_text=include_text, max_length=max_length)
+                for _id in ids]
+
+    def find_substring_many(
+        self,
+        queries: Sequence[str],
+        case_sensitive: bool = True,
+        max_matches: Optional[int] = None,
+        include_text=True,
+    ) -> List[Sequence[TextMatch]]:
+        """
+            Answers a batch of queries, returning a list of matches per query.
+            Runs them one by one, but backends, that can pipeline requests
+            or share one round trip between queries, should override it.
+        """
+        return [self.find_substring(
+            q,
+            case_sensitive=case_sensitive,
+            max_matches=max_matches,
+            include_text=include_text,
+        ) for q in queries]
+
+    def find_regex_many(
+        self,
+        queries: Sequence[str],
+        case_sensitive: bool = True,
+        max_matches: Optional[int] = None,
+        include_text=True,
+    ) -> List[Sequence[TextMatch]]:
+        return [self.find_regex(
+            q,
+            case_sensitive=case_sensitive,
+            max_matches=max_matches,
+            include_text=include_text,
+        ) for q in queries]
+
+    def explain(self, query: str, case_sensitive: bool = True) -> QueryPlan:
+        """ Shows, how `find_regex` would execute the `query` on this backend. """
+        return plan_regex(
+            query,
+            dialect=type(self).__regex_dialect__,
+            case_sensitive=case_sensitive,
+            exact_substrings=type(self).__exact_substrings__,
+            prefix_scans=type(self).__prefix_scans__,
+        )
+
+# region Streaming Reads
+
+    def iter_substring(
+        self,
+        query: str,
+        case_sensitive: bool = True,
+        max_matches: Optional[int] = None,
+        include_text=True,
+    ) -> Generator[TextMatch, None, None]:
+        """
+            Lazy version of `find_substring`. Backends, that can keep a cursor
+            open, should override it to avoid materializing all the matches.
+        """
+        yield from self.find_substring(
+            query,
+            case_sensitive=case_sensitive,
+            max_matches=max_matches,
+            include_text=include_text,
+        )
+
+    def iter_regex(
+        self,
+        query: str,
+        case_sensitive: bool = True,
+        max_matches: Optional[int] = None,
+        include_text=True,
+    ) -> Generator[TextMatch, None, None]:
+        yield from self.find_regex(
+            query,
+            case_sensitive=case_sensitive,
+            max_matches=max_matches,
+            include_text=include_text,
+        )
+
+    def indexes(
+        self,
+        pattern,
+        case_sensitive: bool = True,
+        max_matches: Optional[int] = None,
+        include_text=True,
+    ) -> Generator[TextMatch, None, None]:
+        """
+            Streams all the matches of either a plain substring
+            or a compiled `re.compile(...)` pattern.
+        """
+        if isinstance(pattern, type(re.compile(''))):
+            return self.iter_regex(
+                pattern.pattern,
+                case_sensitive=case_sensitive and not (
+                    pattern.flags & re.IGNORECASE),
+                max_matches=max_matches,
+                include_text=include_text,
+            )
+        return self.iter_substring(
+            pattern,
+            case_sensitive=case_sensitive,
+            max_matches=max_matches,
+            include_text=include_text,
+        )
+
+    def index(self, pattern, case_sensitive: bool = True, include_text=True) -> Optional[TextMatch]:
+        matches = self.indexes(
+            pattern,
+            case_sensitive=case_sensitive,
+            max_matches=1,
+            include_text=include_text,
+        )
+        return next(iter(matches), None)
+
 # region Bulk Reads
 
     @property
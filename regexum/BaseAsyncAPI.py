@@ -0,0 +1,261 @@
+import re
+import asyncio
+import collections
+import contextlib
+from abc import abstractmethod
+from typing import List, Optional, Dict, Generator, Set, Tuple, Sequence, AsyncGenerator
+
+from PyStorageTexts.BaseAPI import BaseAPI
+from PyStorageHelpers import *
+
+
+class BaseAsyncAPI(BaseAPI):
+    """
+        Abstract base class for `asyncio`-native backends.
+        Mirrors `BaseAPI`, but every call is a coroutine and streaming reads
+        are async generators, so they never block the event loop:
+
+            async for match in db.iter_regex('fox|dog'):
+                ...
+
+        Writes of one `add_stream` call keep up to `__max_in_flight__`
+        bulk requests running at once.
+
+        Synchronous helpers of `BaseAPI`, that would call the coroutines
+        without awaiting them, are either ported or raise `TypeError`.
+    """
+    __max_in_flight__ = 4
+
+# region Metadata
+
+    @abstractmethod
+    async def count_texts(self) -> int:
+        return 0
+
+    async def close(self):
+        pass
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *args):
+        await self.close()
+
+# region Random Writes
+
+    @abstractmethod
+    async def add(self, one_or_many_texts, upsert=True) -> int:
+        if isinstance(one_or_many_texts, TextBatch):
+            return await self.add(list(one_or_many_texts), upsert=upsert)
+        elif isinstance(one_or_many_texts, collections.Sequence):
+            results = [await self.add(t, upsert=upsert) for t in one_or_many_texts]
+            return int(sum(results))
+        elif isinstance(one_or_many_texts, dict):
+            return await self.add(Text(**one_or_many_texts), upsert=upsert)
+        return False
+
+    @abstractmethod
+    async def remove(self, one_or_many_texts) -> int:
+        if isinstance(one_or_many_texts, collections.Sequence):
+            results = [await self.remove(t) for t in one_or_many_texts]
+            return int(sum(results))
+        elif isinstance(one_or_many_texts, Text):
+            return await self.remove(one_or_many_texts._id)
+        elif isinstance(one_or_many_texts, dict):
+            return await self.remove(one_or_many_texts.pop('_id', None))
+        return False
+
+# region Bulk Writes
+
+    async def add_stream(self, stream, upsert=False, in_flight: Optional[int] = None) -> int:
+        """
+            Accepts both regular and async iterables of texts or `TextBatch`es.
+            The next batch is read from the stream, while the previous
+            `in_flight` ones are being written. Like in `BaseAPI.add_batches`,
+            the first exception stops the import, once the batches already
+            in flight are finished.
+        """
+        in_flight = in_flight or type(self).__max_in_flight__
+        if not type(self).__is_concurrent__:
+            in_flight = 1
+        slots = asyncio.Semaphore(in_flight)
+        pending = set()
+        errors = list()
+        cnt_success = 0
+
+        async def write(batch) -> int:
+            try:
+                return await self.add_prepared(batch, upsert=upsert)
+            finally:
+                slots.release()
+
+        def collect(done) -> int:
+            cnt = 0
+            for f in done:
+                if f.exception() is not None:
+                    errors.append(f.exception())
+                else:
+                    cnt += f.result()
+            return cnt
+
+        async for batch in self.split_stream_async(stream):
+            await slots.acquire()
+            pending.add(asyncio.ensure_future(write(batch)))
+            done = {f for f in pending if f.done()}
+            cnt_success += collect(done)
+            pending -= done
+            if errors:
+                break
+        if pending:
+            await asyncio.wait(pending)
+            cnt_success += collect(pending)
+        if errors:
+            raise errors[0]
+        return int(cnt_success)
+
+    async def split_stream_async(self, stream) -> AsyncGenerator[object, None]:
+        if not hasattr(stream, '__aiter__'):
+            for batch in self.split_stream(stream):
+                yield batch
+            return
+        async for batch in chunks_async(stream, type(self).__max_batch_size__):
+            if batch and isinstance(batch[0], TextBatch):
+                for part in rechunk_batches(batch, type(self).__max_batch_size__):
+                    yield part
+            else:
+                yield batch
+
+    def add_batches(self, stream, upsert=False, **kwargs):
+        raise TypeError(f'{type(self).__name__} writes with `await add_stream(...)`')
+
+    async def add_prepared(self, batch, upsert=False) -> int:
+        return await self.add(batch, upsert=upsert)
+
+    @contextlib.asynccontextmanager
+    async def bulk_load(self):
+        """ Same as `BaseAPI.bulk_load`, but entered with `async with`. """
+        yield self
+
+    @abstractmethod
+    async def clear(self):
+        pass
+
+# region Random Reads
+
+    @abstractmethod
+    async def get(self, id: int) -> Optional[Text]:
+        return None
+
+    @abstractmethod
+    async def find_substring(
+        self,
+        query: str,
+        case_sensitive: bool = True,
+        max_matches: Optional[int] = None,
+        include_text=True,
+    ) -> Sequence[TextMatch]:
+        return []
+
+    @abstractmethod
+    async def find_regex(
+        self,
+        query: str,
+        case_sensitive: bool = True,
+        max_matches: Optional[int] = None,
+        include_text=True,
+    ) -> Sequence[TextMatch]:
+        return []
+
+    async def get_many(
+        self,
+        ids: Sequence[int],
+        include_text=True,
+        max_length: Optional[int] = None,
+    ) -> List[Optional[Text]]:
+        texts = await asyncio.gather(*[self.get(_id) for _id in ids])
+        return [trim_text(t, include_text=include_text, max_length=max_length)
+                for t in texts]
+
+    async def find_substring_many(
+        self,
+        queries: Sequence[str],
+        case_sensitive: bool = True,
+        max_matches: Optional[int] = None,
+        include_text=True,
+    ) -> List[Sequence[TextMatch]]:
+        """ Awaits all the queries at once, instead of one by one. """
+        return list(await asyncio.gather(*[self.find_substring(
+            q,
+            case_sensitive=case_sensitive,
+            max_matches=max_matches,
+            include_text=include_text,
+        ) for q in queries]))
+
+    async def find_regex_many(
+        self,
+        queries: Sequence[str],
+        case_sensitive: bool = True,
+        max_matches: Optional[int] = None,
+        include_text=True,
+    ) -> List[Sequence[TextMatch]]:
+        return list(await asyncio.gather(*[self.find_regex(
+            q,
+            case_sensitive=case_sensitive,
+            max_matches=max_matches,
+            include_text=include_text,
+        ) for q in queries]))
+
+# region Streaming Reads
+
+    async def iter_substring(
+        self,
+        query: str,
+        case_sensitive: bool = True,
+        max_matches: Optional[int] = None,
+        include_text=True,
+    ) -> AsyncGenerator[TextMatch, None]:
+        matches = await self.find_substring(
+            query,
+            case_sensitive=case_sensitive,
+            max_matches=max_matches,
+            include_text=include_text,
+        )
+        for m in matches:
+            yield m
+
+    async def iter_regex(
+        self,
+        query: str,
+        case_sensitive: bool = True,
+        max_matches: Optional[int] = None,
+        include_text=True,
+    ) -> AsyncGenerator[TextMatch, None]:
+        matches = await self.find_regex(
+            query,
+            case_sensitive=case_sensitive,
+            max_matches=max_matches,
+            include_text=include_text,
+        )
+        for m in matches:
+            yield m
+
+    async def index(self, pattern, case_sensitive: bool = True, include_text=True) -> Optional[TextMatch]:
+        matches = self.indexes(
+            pattern,
+            case_sensitive=case_sensitive,
+            max_matches=1,
+            include_text=include_text,
+        )
+        try:
+            async for m in matches:
+                return m
+        finally:
+            await matches.aclose()
+        return None
+
+# region Bulk Reads
+
+    @property
+    @abstractmethod
+    def texts(self) -> AsyncGenerator[Text, None]:
+        pass
@@ -1,18 +1,21 @@
+import importlib
 from abc import ABC, abstractmethod
 from contextlib import contextmanager
 from typing import List
 
 import sqlalchemy as sa
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, scoped_session
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy import Column, Integer, BigInteger, Text, Float, Boolean
+from sqlalchemy import Column, Integer, BigInteger, Float, Boolean
+# Imported under another name, not to be shadowed by our own `Text`.
+from sqlalchemy import Text as SQLText
 from sqlalchemy.sql import func
 from sqlalchemy import or_, and_
-from sqlalchemy_utils import create_database, database_exists
 from sqlalchemy import text
 from sqlalchemy import Index, Table
 
 from PyStorageTexts.BaseAPI import BaseAPI
+from PyStorageTexts.Registry import reconnect_after_fork
 from PyStorageHelpers import *
 
 DeclarativeDocsSQL = declarative_base()
@@ -20,12 +23,20 @@ DeclarativeDocsSQL = declarative_base()
 
 class TextSQL(DeclarativeDocsSQL):
     __tablename__ = 'table_texts'
-    _id = Column(BigInteger, primary_key=True)
-    content = Column(Text)
-    content_index = Index('content_index', TextSQL.content, unique=False)
+    # In SQLite only `INTEGER PRIMARY KEY` aliases the `rowid`,
+    # which is 64-bit anyway and is needed for external FTS indexes.
+    _id = Column(BigInteger().with_variant(Integer, 'sqlite'), primary_key=True)
+    content = Column(SQLText)
+    __table_args__ = (
+        Index('content_index', 'content', unique=False),
+    )
 
-    def __init__(self, *args, **kwargs):
-        DeclarativeDocsSQL.__init__(self)
+    @staticmethod
+    def from_text(t: Text):
+        return TextSQL(_id=t._id, content=t.content)
+
+    def to_text(self) -> Text:
+        return Text(self._id, self.content)
 
 
 class BaseSQL(BaseAPI):
@@ -40,8 +51,12 @@ class BaseSQL(BaseAPI):
         *   Firebird,
         *   Sybase.
     """
+    __max_batch_size__ = 10000
+    __max_writers__ = 4
     __is_concurrent__ = True
     __in_memory__ = False
+    # The `content_index` B-Tree keeps contents in binary order.
+    __prefix_scans__ = True
 
     # --------------------------------
     # region Initialization and Metadata.
@@ -49,16 +64,47 @@ class BaseSQL(BaseAPI):
 
     def __init__(self, url='sqlite:///:memory:', **kwargs):
         BaseAPI.__init__(self, **kwargs)
+        # Takes longer to import, than the rest of SQLAlchemy.
+        from sqlalchemy_utils import create_database, database_exists
         # https://stackoverflow.com/a/51184173
         if not database_exists(url):
             create_database(url)
-        self.engine = sa.create_engine(url)
+        self.engine = sa.create_engine(url, **self.engine_options(url))
+        sa.event.listen(self.engine, 'connect', self.on_connect)
         DeclarativeDocsSQL.metadata.create_all(self.engine)
-        self.session_maker = sessionmaker(bind=self.engine)
+        self.create_search_index()
+        # Every thread gets its own session, reused between the calls.
+        # https://docs.sqlalchemy.org/en/14/orm/contextual.html
+        self.session_maker = scoped_session(sessionmaker(bind=self.engine))
+        reconnect_after_fork(self)
+
+    def engine_options(self, url: str) -> dict:
+        return {}
+
+    def on_connect(self, dbapi_connection, connection_record):
+        """
+            Called for every new DBAPI connection, for example,
+            to register custom SQL functions.
+            https://docs.sqlalchemy.org/en/14/core/events.html#sqlalchemy.events.PoolEvents.connect
+        """
+        pass
+
+    def create_search_index(self):
+        """
+            Creates the engine-specific full-text structures,
+            if the generic B-Tree isn't enough.
+        """
+        pass
 
     @contextmanager
     def get_session(self):
+        """
+            Reuses the session of the current thread, unless it is busy,
+            like while streaming `texts`, then a separate one is opened.
+        """
         session = self.session_maker()
+        if session.in_transaction():
+            session = self.session_maker.session_factory()
         session.expire_on_commit = False
         try:
             yield session
@@ -70,6 +116,15 @@ class BaseSQL(BaseAPI):
         finally:
             session.close()
 
+    def disconnect(self):
+        """
+            Pooled connections of the parent process are abandoned
+            after `fork`, without closing them. New ones are opened on demand.
+            https://docs.sqlalchemy.org/en/14/core/pooling.html#using-connection-pools-with-multiprocessing-or-os-fork
+        """
+        self.session_maker.remove()
+        self.engine.dispose(close=False)
+
     def count_texts(self) -> int:
         result = 0
         with self.get_session() as s:
@@ -82,6 +137,80 @@ class BaseSQL(BaseAPI):
     # region Adding and removing documents.
     # --------------------------------
 
+    def add(self, one_or_many_texts, upsert=True) -> int:
+        if isinstance(one_or_many_texts, Text):
+            return self.insert_rows([one_or_many_texts.to_dict()], upsert=upsert) > 0
+        elif is_sequence_of(one_or_many_texts, Text):
+            return self.insert_rows([t.to_dict() for t in one_or_many_texts], upsert=upsert)
+        elif isinstance(one_or_many_texts, TextBatch):
+            return self.insert_rows([{'_id': _id, 'content': content}
+                                     for _id, content in one_or_many_texts.items()], upsert=upsert)
+
+        return super().add(one_or_many_texts, upsert=upsert)
+
+    def insert_rows(self, rows: List[dict], upsert=True) -> int:
+        """
+            Bypasses the ORM and sends every `__max_batch_size__` rows
+            as one `executemany` within a single transaction.
+            Without upserts, existing rows are skipped instead of failing the batch.
+            https://docs.sqlalchemy.org/en/14/core/tutorial.html#executing-multiple-statements
+        """
+        statement = self.insert_statement(upsert)
+        if statement is None:
+            return self.upsert_texts([TextSQL(**row) for row in rows])
+        cnt = 0
+        for part in chunks(rows, type(self).__max_batch_size__):
+            with self.engine.begin() as connection:
+                result = connection.execute(statement, part)
+            # Upserts may count updated rows twice, like in MySQL,
+            # and some drivers don't count `executemany` rows at all.
+            if upsert or result.rowcount < 0:
+                cnt += len(part)
+            else:
+                cnt += result.rowcount
+        return cnt
+
+    def insert_statement(self, upsert=True):
+        """
+            Returns the dialect-specific bulk insert or `None`, if only
+            the generic ORM `merge` can emulate upserts on this engine.
+            https://docs.sqlalchemy.org/en/14/dialects/sqlite.html#insert-on-conflict-upsert
+            https://docs.sqlalchemy.org/en/14/dialects/postgresql.html#insert-on-conflict-upsert
+            https://docs.sqlalchemy.org/en/14/dialects/mysql.html#insert-on-duplicate-key-update-upsert
+        """
+        table = TextSQL.__table__
+        dialect = self.engine.dialect.name
+        # Only the module of the current dialect is imported,
+        # which the engine has already loaded anyway.
+        if dialect in ('sqlite', 'postgresql'):
+            insert = importlib.import_module(f'sqlalchemy.dialects.{dialect}').insert
+            statement = insert(table)
+            if upsert:
+                return statement.on_conflict_do_update(
+                    index_elements=['_id'],
+                    set_={'content': statement.excluded.content},
+                )
+            return statement.on_conflict_do_nothing(index_elements=['_id'])
+        elif dialect == 'mysql':
+            statement = importlib.import_module('sqlalchemy.dialects.mysql').insert(table)
+            if upsert:
+                return statement.on_duplicate_key_update(content=statement.inserted.content)
+            return statement.prefix_with('IGNORE')
+        return None if upsert else table.insert()
+
+    def remove(self, one_or_many_texts) -> int:
+        if isinstance(one_or_many_texts, int):
+            return self.remove_text(TextSQL(_id=one_or_many_texts))
+        elif is_sequence_of(one_or_many_texts, int):
+            result = 0
+            with self.get_session() as s:
+                result = s.query(TextSQL).filter(
+                    TextSQL._id.in_(one_or_many_texts)
+                ).delete(synchronize_session=False)
+            return result
+
+        return super().remove(one_or_many_texts)
+
     def upsert_text(self, doc: TextSQL) -> bool:
         result = False
         with self.get_session() as s:
@@ -92,13 +221,12 @@ class BaseSQL(BaseAPI):
     def remove_text(self, doc: TextSQL) -> bool:
         result = False
         with self.get_session() as s:
-            s.query(TextSQL).filter_by(
+            result = s.query(TextSQL).filter_by(
                 _id=doc._id
-            ).delete()
-            result = True
+            ).delete() > 0
         return result
 
-    def upsert_texts(self, docs: List[Edge]) -> int:
+    def upsert_texts(self, docs: List[TextSQL]) -> int:
         result = 0
         with self.get_session() as s:
             docs = list(map(s.merge, docs))
@@ -111,6 +239,44 @@ class BaseSQL(BaseAPI):
             result += s.query(TextSQL).delete()
         return result
 
+    def add_stream(
+        self,
+        stream,
+        upsert=False,
+        writers: Optional[int] = None,
+        processes: Optional[int] = None,
+        defer_indexes=False,
+    ) -> int:
+        """
+            With `defer_indexes` the import runs within `bulk_load`.
+        """
+        if not defer_indexes:
+            return super().add_stream(stream, upsert=upsert, writers=writers, processes=processes)
+        with self.bulk_load():
+            return super().add_stream(stream, upsert=upsert, writers=writers, processes=processes)
+
+    @contextmanager
+    def bulk_load(self):
+        """
+            Drops the secondary indexes for the duration of the import
+            and rebuilds them once in the end, which is much cheaper,
+            than updating them row by row.
+        """
+        self.drop_indexes()
+        try:
+            yield self
+        finally:
+            self.create_indexes()
+
+    def drop_indexes(self):
+        for index in TextSQL.__table__.indexes:
+            index.drop(self.engine, checkfirst=True)
+
+    def create_indexes(self):
+        for index in TextSQL.__table__.indexes:
+            index.create(self.engine, checkfirst=True)
+        self.create_search_index()
+
     # endregion
 
     # --------------------------------
@@ -118,14 +284,56 @@ class BaseSQL(BaseAPI):
     # --------------------------------
 
     @abstractmethod
-    def find_substring(self, field: str, query: str) -> Sequence[Text]:
+    def find_substring(
+        self,
+        query: str,
+        case_sensitive: bool = True,
+        max_matches: Optional[int] = None,
+        include_text=True,
+        snippet_length: Optional[int] = None,
+    ) -> Sequence[TextMatch]:
         pass
 
     @abstractmethod
-    def find_regex(self, field: str, query: str) -> Sequence[Text]:
+    def find_regex(
+        self,
+        query: str,
+        case_sensitive: bool = True,
+        max_matches: Optional[int] = None,
+        include_text=True,
+        snippet_length: Optional[int] = None,
+    ) -> Sequence[TextMatch]:
         pass
 
-    def get(self, identifier: str) -> object:
-        pass
+    def get(self, identifier: int) -> Optional[Text]:
+        with self.get_session() as s:
+            doc = s.get(TextSQL, identifier)
+            return doc.to_text() if doc else None
+
+    def get_many(self, ids: Sequence[int], include_text=True, max_length: Optional[int] = None) -> List[Optional[Text]]:
+        """
+            Fetches up to `__max_batch_size__` rows per `IN` query,
+            truncating contents with `SUBSTR` on the server.
+        """
+        found = dict()
+        if not include_text:
+            columns = [TextSQL._id]
+        elif max_length is not None:
+            columns = [TextSQL._id, func.substr(TextSQL.content, 1, max_length)]
+        else:
+            columns = [TextSQL._id, TextSQL.content]
+        with self.get_session() as s:
+            for part in chunks(ids, type(self).__max_batch_size__):
+                for row in s.query(*columns).filter(TextSQL._id.in_(part)):
+                    found[row[0]] = Text(row[0], row[1] if include_text else '')
+        return [found.get(_id, None) for _id in ids]
+
+    @property
+    def texts(self) -> Generator[Text, None, None]:
+        with self.get_session() as s:
+            query = s.query(TextSQL._id, TextSQL.content).yield_per(
+                type(self).__max_batch_size__)
+            for row in query:
+                yield Text(row[0], row[1])
 
     # endregion
@@ -0,0 +1,260 @@
+import re
+import sys
+import copy
+import dataclasses
+import time
+import threading
+import collections
+import collections.abc
+from typing import List, Optional, Dict, Generator, Set, Tuple, Sequence
+
+from PyStorageTexts.BaseAPI import BaseAPI
+from PyStorageHelpers import *
+
+
+class Cached(BaseAPI):
+    """
+        Wraps any other backend with an LRU cache of search results,
+        for dashboards and services, that repeat the same queries.
+        Results are keyed by `(method, query, case_sensitive, max_matches, include_text)`.
+        The cache is bounded by the number of entries and their approximate size in bytes,
+        and every entry may also expire after `ttl` seconds.
+
+        Writes through the wrapper invalidate the cache:
+            * 'conservative' - drops everything on every write,
+            * 'precise' - drops only the queries, that a written or removed text
+                could affect. It assumes that the backend matches substrings and
+                patterns just like Python `str` and `re` do, so don't use it with
+                token-based full-text search engines.
+        Writes, that bypass the wrapper, are only handled by `ttl`.
+        The cache keeps its own copies of the matches and returns new copies
+        on every hit, so callers may modify the results they get.
+    """
+    __invalidation_modes__ = ['conservative', 'precise']
+
+# region Metadata
+
+    def __init__(
+        self,
+        backend: BaseAPI,
+        max_entries: int = 1024,
+        max_bytes: int = 64 * 1024 * 1024,
+        ttl: Optional[float] = None,
+        invalidation: str = 'conservative',
+        **kwargs,
+    ):
+        BaseAPI.__init__(self, **kwargs)
+        if invalidation not in Cached.__invalidation_modes__:
+            raise ValueError(
+                f'Unknown invalidation mode: {invalidation}, '
+                f'choose one of: {Cached.__invalidation_modes__}')
+        self.backend = backend
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.invalidation = invalidation
+        # Maps keys to `(expiration_time, matches, size_in_bytes)`,
+        # from the least to the most recently used.
+        self.entries: collections.OrderedDict = collections.OrderedDict()
+        self.cached_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        # Incremented by every invalidation, so results of queries,
+        # that ran concurrently with a write, aren't cached.
+        self.generation = 0
+        self.lock = threading.Lock()
+
+    def count_texts(self) -> int:
+        return self.backend.count_texts()
+
+    def close(self):
+        self.backend.close()
+
+# region Random Writes
+
+    def add(self, one_or_many_texts, upsert=True) -> int:
+        result = self.backend.add(one_or_many_texts, upsert=upsert)
+        if self.invalidation == 'precise':
+            self.invalidate_texts(texts_of(one_or_many_texts))
+        else:
+            self.invalidate()
+        return result
+
+    def remove(self, one_or_many_texts) -> int:
+        result = self.backend.remove(one_or_many_texts)
+        if self.invalidation == 'precise':
+            self.invalidate_ids(ids_of(one_or_many_texts))
+        else:
+            self.invalidate()
+        return result
+
+# region Random Reads
+
+    def get(self, identifier: int) -> Optional[Text]:
+        return self.backend.get(identifier)
+
+    def get_many(self, ids: Sequence[int], include_text=True, max_length: Optional[int] = None) -> List[Optional[Text]]:
+        return self.backend.get_many(ids, include_text=include_text, max_length=max_length)
+
+    def find_substring(
+        self,
+        query: str,
+        case_sensitive: bool = True,
+        max_matches: Optional[int] = None,
+        include_text=True,
+        snippet_length: Optional[int] = None,
+    ) -> Sequence[TextMatch]:
+        return self.lookup(
+            'substring', query,
+            case_sensitive=case_sensitive,
+            max_matches=max_matches,
+            include_text=include_text,
+            snippet_length=snippet_length,
+        )
+
+    def find_regex(
+        self,
+        query: str,
+        case_sensitive: bool = True,
+        max_matches: Optional[int] = None,
+        include_text=True,
+        snippet_length: Optional[int] = None,
+    ) -> Sequence[TextMatch]:
+        return self.lookup(
+            'regex', query,
+            case_sensitive=case_sensitive,
+            max_matches=max_matches,
+            include_text=include_text,
+            snippet_length=snippet_length,
+        )
+
+    def explain(self, query: str, case_sensitive: bool = True) -> QueryPlan:
+        return self.backend.explain(query, case_sensitive=case_sensitive)
+
+# region Bulk Reads
+
+    @property
+    def texts(self) -> Sequence[Text]:
+        return self.backend.texts
+
+# region Bulk Writes
+
+    def bulk_load(self):
+        return self.backend.bulk_load()
+
+    def add_stream(self, stream, upsert=False, **kwargs) -> int:
+        # Checking every imported text against every query
+        # would cost more, than just repeating the queries.
+        try:
+            return self.backend.add_stream(stream, upsert=upsert, **kwargs)
+        finally:
+            self.invalidate()
+
+    def clear(self):
+        self.backend.clear()
+        self.invalidate()
+
+# region Helpers
+
+    def lookup(self, method: str, query: str, **kwargs) -> List[TextMatch]:
+        key = (method, query, kwargs['case_sensitive'],
+               kwargs['max_matches'], kwargs['include_text'], kwargs['snippet_length'])
+        now = time.monotonic()
+        with self.lock:
+            entry = self.entries.get(key, None)
+            if entry is not None and (entry[0] is None or entry[0] > now):
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return copy_matches(entry[1])
+            self.misses += 1
+            generation = self.generation
+
+        find = self.backend.find_substring if method == 'substring' else self.backend.find_regex
+        matches = list(find(query, **kwargs))
+        size = sys.getsizeof(query) + \
+            sum(sys.getsizeof(m.content) + sum(map(sys.getsizeof, m.snippets)) + 64 for m in matches)
+        if size > self.max_bytes:
+            return matches
+
+        expiration = (now + self.ttl) if self.ttl is not None else None
+        with self.lock:
+            if generation != self.generation:
+                return matches
+            self.drop(key)
+            self.entries[key] = (expiration, copy_matches(matches), size)
+            self.cached_bytes += size
+            while len(self.entries) > self.max_entries or self.cached_bytes > self.max_bytes:
+                self.drop(next(iter(self.entries)))
+        return matches
+
+    def drop(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.cached_bytes -= entry[2]
+
+    def invalidate(self):
+        with self.lock:
+            self.generation += 1
+            self.entries.clear()
+            self.cached_bytes = 0
+
+    def invalidate_ids(self, ids: Set[int]):
+        """ Drops the queries, which results contain any of the `ids`. """
+        with self.lock:
+            self.generation += 1
+            for key, entry in list(self.entries.items()):
+                if any(m._id in ids for m in entry[1]):
+                    self.drop(key)
+
+    def invalidate_texts(self, texts: Sequence[Text]):
+        """
+            Drops the queries, that match any of the new `texts`,
+            or contain an older version of them in the results.
+        """
+        ids = {t._id for t in texts}
+        with self.lock:
+            self.generation += 1
+            for key, entry in list(self.entries.items()):
+                method, query, case_sensitive = key[:3]
+                if any(m._id in ids for m in entry[1]) or \
+                        any(matches_text(method, query, case_sensitive, t.content) for t in texts):
+                    self.drop(key)
+
+
+def copy_matches(matches: Sequence[Text]) -> List[Text]:
+    """ Strings are immutable, so only the objects and their lists are copied. """
+    return [dataclasses.replace(m, sections=list(m.sections), spans=list(m.spans), snippets=list(m.snippets))
+            if isinstance(m, TextMatch) else copy.copy(m) for m in matches]
+
+
+def matches_text(method: str, query: str, case_sensitive: bool, content: str) -> bool:
+    if method == 'substring':
+        if case_sensitive:
+            return query in content
+        return query.lower() in content.lower()
+    return re.search(query, content, 0 if case_sensitive else re.IGNORECASE) is not None
+
+
+def texts_of(one_or_many_texts) -> List[Text]:
+    if isinstance(one_or_many_texts, Text):
+        return [one_or_many_texts]
+    elif isinstance(one_or_many_texts, dict):
+        return [Text(**one_or_many_texts)]
+    elif isinstance(one_or_many_texts, str):
+        return []
+    elif isinstance(one_or_many_texts, (TextBatch, collections.abc.Sequence)):
+        return [t for x in one_or_many_texts for t in texts_of(x)]
+    return []
+
+
+def ids_of(one_or_many_texts) -> Set[int]:
+    if isinstance(one_or_many_texts, int):
+        return {one_or_many_texts}
+    elif isinstance(one_or_many_texts, Text):
+        return {one_or_many_texts._id}
+    elif isinstance(one_or_many_texts, dict):
+        return {one_or_many_texts.get('_id', None)}
+    elif isinstance(one_or_many_texts, collections.abc.Sequence) and \
+            not isinstance(one_or_many_texts, str):
+        return {i for x in one_or_many_texts for i in ids_of(x)}
+    return set()
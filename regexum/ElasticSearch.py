@@ -1,13 +1,37 @@
+import re
 import copy
+import json
+import queue
+import threading
+import contextlib
 
-from elasticsearch import Elasticsearch
 from elasticsearch.helpers import streaming_bulk
 
 from PyStorageTexts.BaseAPI import BaseAPI
+from PyStorageTexts.Registry import shared_client, release_client, reconnect_after_fork, ForkSafeClients
 from PyStorageHelpers import *
 
 
-class ElasticSearch(BaseAPI):
+def encode_bulk_body(batch: TextBatch) -> bytes:
+    """
+        Serializes a columnar batch straight into the newline-delimited
+        `_bulk` body, without building an action dict per document.
+        https://www.elastic.co/guide/en/elasticsearch/reference/current/docs-bulk.html
+    """
+    return b''.join(
+        b'{"index":{"_id":%d}}\n{"content":%s}\n' % (
+            _id, json.dumps(content, ensure_ascii=False).encode('utf-8'))
+        for _id, content in batch.items()
+    )
+
+
+def bulk_item_results(result: dict) -> Generator[Tuple[bool, dict], None, None]:
+    for item in result.get('items', []):
+        details = next(iter(item.values()))
+        yield (200 <= details.get('status', 500) < 300), item
+
+
+class ElasticSearch(BaseAPI, ForkSafeClients):
     """
         ElasticSearch is built on top of Lucene, but Lucene is  
         hard to install on its own. So we run the full version.
@@ -15,20 +39,79 @@ class ElasticSearch(BaseAPI):
         https://www.elastic.co
         https://elasticsearch-py.readthedocs.io/en/master/
         https://www.elastic.co/guide/en/elasticsearch/reference/current/brew.html
+
+        All the instances pointing to one cluster share a client with
+        up to `pool_size` connections, which is recreated after `fork`.
     """
+    __client_attributes__ = ('elastic',)
     __is_concurrent__ = False
     __max_batch_size__ = 100000
+    __max_bulk_size__ = 1000
+    __max_msearch_size__ = 100
     __in_memory__ = False
+    __regex_dialect__ = 'lucene'
+    # `match` queries look up analyzed tokens, not arbitrary substrings.
+    __exact_substrings__ = False
+    __refresh_policies__ = ['immediate', 'wait_for', 'interval', 'manual']
+    __truncation_script__ = """
+        def content = params._source.content;
+        if (content == null) { return ''; }
+        return content.substring(0, (int) Math.min(content.length(), params.max_length));
+    """
 
 # region Metadata
 
-    def __init__(self, url='http://localhost:9200/text', **kwargs):
+    def __init__(
+        self,
+        url='http://localhost:9200/text',
+        page_size=1000,
+        keep_alive='1m',
+        refresh='immediate',
+        refresh_interval='1s',
+        pool_size: Optional[int] = None,
+        allow_scan: bool = False,
+        **kwargs,
+    ):
         BaseAPI.__init__(self, **kwargs)
+        if refresh not in type(self).__refresh_policies__:
+            raise ValueError(f'Unknown refresh policy: {refresh}')
+        # Defines when the writes become visible to searches:
+        # *   `immediate` - explicit refresh after every synced write,
+        # *   `wait_for` - writes block until the next scheduled refresh,
+        # *   `interval` - Lucene refreshes every `refresh_interval` on its own,
+        # *   `manual` - only when `commit_all` is called.
+        self.refresh = refresh
+        self.refresh_interval = refresh_interval
+        self.refresh_lock = threading.Condition()
+        self.refresh_requested = 0
+        self.refresh_completed = 0
+        self.refresh_running = False
+        # Streaming reads fetch `page_size` hits per request and keep
+        # the point-in-time open for `keep_alive` between the requests.
+        self.page_size = page_size
+        self.keep_alive = keep_alive
+        # RegEx queries without any term to look up would export the whole
+        # index to the client for verification, unless refused by default.
+        self.allow_scan = allow_scan
+        self.bulk_errors = list()
+        self.search_errors = dict()
         url, db_name = extract_database_name(url, default='text')
-        self.elastic = Elasticsearch([url])
+        self.url = url
+        self.pool_size = pool_size
         self.db_name = db_name
+        self.reconnect()
+        reconnect_after_fork(self)
         self.create_index()
 
+    def reconnect(self):
+        self.elastic = shared_client('elasticsearch', self.url, pool_size=self.pool_size)
+
+    def close(self):
+        # The client is shared, so only its last user closes it.
+        client = release_client('elasticsearch', self.url, pool_size=self.pool_size)
+        if client is not None:
+            client.close()
+
     def count_texts(self) -> int:
         if not self.index_exists():
             return 0
@@ -43,17 +126,23 @@ class ElasticSearch(BaseAPI):
         if isinstance(one_or_many_texts, Text):
             result = self.elastic.index(index=self.db_name, id=one_or_many_texts._id, body={
                 'content': one_or_many_texts.content,
-            })
+            }, **self.write_params(sync))
             result = result.pop('result', None)
             success = (result == 'created') or (result == 'updated')
-            if sync and success:
-                self.commit_all()
+            if success:
+                self.refresh_after_write(sync)
             return success
         elif is_sequence_of(one_or_many_texts, Text):
-            statuses = [self.add(t, sync=False) for t in one_or_many_texts]
-            cnt = int(sum(statuses))
-            if sync and cnt:
-                self.commit_all()
+            cnt = self.bulk(self.make_index_actions(
+                one_or_many_texts), **self.write_params(sync))
+            if cnt:
+                self.refresh_after_write(sync)
+            return cnt
+        elif isinstance(one_or_many_texts, TextBatch):
+            cnt = self.bulk_encoded(
+                one_or_many_texts, **self.write_params(sync))
+            if cnt:
+                self.refresh_after_write(sync)
             return cnt
 
         return super().add(one_or_many_texts, upsert=upsert)
@@ -61,17 +150,17 @@ class ElasticSearch(BaseAPI):
     def remove(self, one_or_many_texts, sync=True) -> int:
         if isinstance(one_or_many_texts, int):
             result = self.elastic.delete(
-                index=self.db_name, id=one_or_many_texts)
+                index=self.db_name, id=one_or_many_texts, **self.write_params(sync))
             result = result.pop('result', None)
             success = (result == 'deleted')
-            if sync and success:
-                self.commit_all()
+            if success:
+                self.refresh_after_write(sync)
             return success
         elif is_sequence_of(one_or_many_texts, int):
-            statuses = [self.remove(t, sync=False) for t in one_or_many_texts]
-            cnt = int(sum(statuses))
-            if sync and cnt:
-                self.commit_all()
+            cnt = self.bulk(self.make_delete_actions(
+                one_or_many_texts), **self.write_params(sync))
+            if cnt:
+                self.refresh_after_write(sync)
             return cnt
 
         return super().remove(one_or_many_texts)
@@ -89,45 +178,58 @@ class ElasticSearch(BaseAPI):
             return self.parse_match(result)
         return None
 
+    def get_many(
+        self,
+        ids: Sequence[int],
+        include_text=True,
+        max_length: Optional[int] = None,
+    ) -> List[Optional[Text]]:
+        """
+            Fetches up to `page_size` documents per `_mget` request.
+            As `_mget` can't transform documents, truncated contents are
+            produced by a `script_fields` search over the same IDs.
+            https://www.elastic.co/guide/en/elasticsearch/reference/current/docs-multi-get.html
+            https://www.elastic.co/guide/en/elasticsearch/reference/current/search-fields.html#script-fields
+        """
+        found = dict()
+        for part in chunks(ids, self.page_size):
+            if include_text and max_length is not None:
+                result = self.elastic.search(index=self.db_name, body={
+                    'query': {'ids': {'values': part}},
+                    'size': len(part),
+                    '_source': False,
+                    'script_fields': {'content': {'script': {
+                        'source': self.__truncation_script__,
+                        'params': {'max_length': max_length},
+                    }}},
+                })
+                for hit in result.get('hits', {}).get('hits', []):
+                    _id = int(hit['_id'])
+                    content = hit.get('fields', {}).get('content', [''])[0]
+                    found[_id] = Text(_id, content)
+                continue
+
+            result = self.elastic.mget(
+                index=self.db_name, body={'ids': part}, _source=include_text)
+            for doc in result.get('docs', []):
+                if doc.get('found', False):
+                    t = self.parse_match(doc)
+                    found[t._id] = Text(t._id, t.content)
+        return [found.get(_id, None) for _id in ids]
+
     def find_substring(
         self,
         query: str,
         case_sensitive: bool = True,
         max_matches: Optional[int] = None,
         include_text=True,
+        snippet_length: Optional[int] = None,
     ) -> Sequence[TextMatch]:
-        """
-            https://www.elastic.co/guide/en/elasticsearch/reference/6.8/query-dsl-term-query.html
-            https://www.elastic.co/guide/en/elasticsearch/reference/6.8/query-dsl-match-query.html
-        """
-        query_dict = {
-            'query': {
-                'match': {
-                    'content': {
-                        'query': query,
-                        'operator': 'and',
-                        'zero_terms_query': 'all',
-                        'auto_generate_synonyms_phrase_query': False,
-                    },
-                },
-            },
-            'stored_fields': [],
-        }
-        # query_dict = {
-        #     'query': {
-        #         'match_phrase': {
-        #             'content': query,
-        #         },
-        #     },
-        #     'stored_fields': [],
-        # }
-        if max_matches:
-            query_dict['from'] = 0
-            query_dict['size'] = max_matches
-        #
-        result = self.elastic.search(index=self.db_name, body=query_dict)
-        dicts = result.get('hits', {}).get('hits', [])
-        return list(map(self.parse_match, dicts))
+        query_dict = self.substring_query(
+            query, case_sensitive=case_sensitive, include_text=include_text)
+        if snippet_length:
+            query_dict = self.snippet_query(query_dict, snippet_length)
+        return self.search(query_dict, max_matches=max_matches)
 
     def find_regex(
         self,
@@ -135,22 +237,26 @@ class ElasticSearch(BaseAPI):
         case_sensitive: bool = True,
         max_matches: Optional[int] = None,
         include_text=True,
+        snippet_length: Optional[int] = None,
     ):
         """
-            https://www.elastic.co/guide/en/elasticsearch/reference/6.8/query-dsl-regexp-query.html
-            https://lucene.apache.org/core/4_9_0/core/org/apache/lucene/util/automaton/RegExp.html
+            Candidates are verified with Python `re`, so the whole contents
+            are fetched anyway and snippets are cut on the client.
         """
-        query_dict = {
-            'query': {
-                'regexp': {
-                    'content': {
-                        'value': query,
-                        'flags': 'INTERVAL',
-                    },
-                },
-            },
-            'stored_fields': [],
-        }
+        matches = list(self.iter_regex(
+            query,
+            case_sensitive=case_sensitive,
+            max_matches=max_matches,
+            include_text=include_text or bool(snippet_length),
+        ))
+        if snippet_length:
+            pattern = compile_query(query, is_regex=True,
+                                    case_sensitive=case_sensitive)
+            return add_snippets(matches, pattern, snippet_length)
+        return matches
+
+    def search(self, query_dict: dict, max_matches: Optional[int] = None) -> Sequence[TextMatch]:
+        query_dict = dict(query_dict)
         if max_matches:
             query_dict['from'] = 0
             query_dict['size'] = max_matches
@@ -159,45 +265,359 @@ class ElasticSearch(BaseAPI):
         dicts = result.get('hits', {}).get('hits', [])
         return list(map(self.parse_match, dicts))
 
+    def find_substring_many(
+        self,
+        queries: Sequence[str],
+        case_sensitive: bool = True,
+        max_matches: Optional[int] = None,
+        include_text=True,
+    ) -> List[Sequence[TextMatch]]:
+        query_dicts = [self.substring_query(q, case_sensitive=case_sensitive, include_text=include_text)
+                       for q in queries]
+        return self.msearch(query_dicts, max_matches=max_matches)
+
+    def find_regex_many(
+        self,
+        queries: Sequence[str],
+        case_sensitive: bool = True,
+        max_matches: Optional[int] = None,
+        include_text=True,
+    ) -> List[Sequence[TextMatch]]:
+        """
+            Fetches the first `page_size` candidates of all the queries in
+            `_msearch` batches and verifies them. Queries, that found less,
+            than `max_matches`, while more candidates remain, and queries,
+            that need a full scan, continue with `iter_regex` one by one,
+            so the results are the same as from `find_regex`. Queries,
+            that failed in `_msearch`, are retried the same way, so their
+            errors are raised instead of being mistaken for no matches.
+        """
+        plans = [self.explain(q, case_sensitive=case_sensitive)
+                 for q in queries]
+        for plan in plans:
+            self.check_plan(plan)
+        searched = [p for p in plans if p.operation != 'scan']
+        first_pages = iter(enumerate(self.msearch(
+            [self.plan_query(p) for p in searched], max_matches=self.page_size)))
+        failed = self.search_errors
+        results = list()
+        for plan in plans:
+            candidates = None
+            if plan.operation != 'scan':
+                position, candidates = next(first_pages)
+                if position in failed:
+                    candidates = None
+            if candidates is not None:
+                pattern = compile_query(plan.pattern, is_regex=True,
+                                        case_sensitive=case_sensitive)
+                matches = list(self.verify(
+                    iter(candidates), pattern, max_matches, include_text))
+                exhausted = len(candidates) < self.page_size
+                if exhausted or (max_matches and len(matches) >= max_matches):
+                    results.append(matches)
+                    continue
+            results.append(list(self.iter_regex(
+                plan.pattern,
+                case_sensitive=case_sensitive,
+                max_matches=max_matches,
+                include_text=include_text,
+            )))
+        return results
+
+    def msearch(self, query_dicts: Sequence[dict], max_matches: Optional[int] = None) -> List[Sequence[TextMatch]]:
+        """
+            Packs up to `__max_msearch_size__` queries into every `_msearch`
+            request, which the cluster executes concurrently.
+            A failed query doesn't fail the others, it just returns no matches,
+            while its error is put into `search_errors` by the query position.
+            https://www.elastic.co/guide/en/elasticsearch/reference/current/search-multi-search.html
+        """
+        results = list()
+        self.search_errors = dict()
+        for part in chunks(query_dicts, type(self).__max_msearch_size__):
+            body = list()
+            for query_dict in part:
+                query_dict = dict(query_dict)
+                if max_matches:
+                    query_dict['from'] = 0
+                    query_dict['size'] = max_matches
+                body.append({'index': self.db_name})
+                body.append(query_dict)
+            result = self.elastic.msearch(body=body)
+            for response in result.get('responses', []):
+                if 'error' in response:
+                    self.search_errors[len(results)] = response['error']
+                dicts = response.get('hits', {}).get('hits', [])
+                results.append(list(map(self.parse_match, dicts)))
+        return results
+
+# region Streaming Reads
+
+    def iter_substring(
+        self,
+        query: str,
+        case_sensitive: bool = True,
+        max_matches: Optional[int] = None,
+        include_text=True,
+    ) -> Generator[TextMatch, None, None]:
+        query_dict = self.substring_query(
+            query, case_sensitive=case_sensitive, include_text=include_text)
+        yield from self.iter_search(query_dict, max_matches=max_matches)
+
+    def iter_regex(
+        self,
+        query: str,
+        case_sensitive: bool = True,
+        max_matches: Optional[int] = None,
+        include_text=True,
+    ) -> Generator[TextMatch, None, None]:
+        """
+            Runs the plan of `explain`: Lucene `regexp` queries over the
+            terms, that any match must contain, or a full export, if there
+            are none and `allow_scan` is set. All candidates are verified
+            with Python `re`.
+        """
+        plan = self.explain(query, case_sensitive=case_sensitive)
+        self.check_plan(plan)
+        if plan.operation == 'scan':
+            candidates = self.export()
+        else:
+            candidates = self.iter_search(self.plan_query(plan))
+        pattern = compile_query(query, is_regex=True,
+                                case_sensitive=case_sensitive)
+        yield from self.verify(candidates, pattern, max_matches, include_text)
+
+    def verify(
+        self,
+        candidates: Generator[TextMatch, None, None],
+        pattern: re.Pattern,
+        max_matches: Optional[int],
+        include_text: bool,
+    ) -> Generator[TextMatch, None, None]:
+        cnt_yielded = 0
+        try:
+            for m in candidates:
+                if not pattern.search(m.content):
+                    continue
+                if not include_text:
+                    m.content = ''
+                yield m
+                cnt_yielded += 1
+                if max_matches and cnt_yielded >= max_matches:
+                    return
+        finally:
+            if hasattr(candidates, 'close'):
+                candidates.close()
+
+    def iter_search(self, query_dict: dict, max_matches: Optional[int] = None) -> Generator[TextMatch, None, None]:
+        """
+            Pages through the results with `search_after` over a point-in-time,
+            so deep pages cost the same as the first one and aren't limited
+            by `index.max_result_window`.
+            https://www.elastic.co/guide/en/elasticsearch/reference/current/point-in-time-api.html
+            https://www.elastic.co/guide/en/elasticsearch/reference/current/paginate-search-results.html#search-after
+        """
+        if max_matches and max_matches <= self.page_size:
+            yield from self.search(query_dict, max_matches=max_matches)
+            return
+
+        pit_id = self.elastic.open_point_in_time(
+            index=self.db_name, keep_alive=self.keep_alive)['id']
+        try:
+            query_dict = dict(query_dict)
+            query_dict['sort'] = [{'_score': 'desc'}, {'_shard_doc': 'asc'}]
+            query_dict['track_total_hits'] = False
+            cnt_yielded = 0
+            while True:
+                page_size = self.page_size
+                if max_matches:
+                    page_size = min(page_size, max_matches - cnt_yielded)
+                query_dict['size'] = page_size
+                query_dict['pit'] = {'id': pit_id, 'keep_alive': self.keep_alive}
+                result = self.elastic.search(body=query_dict)
+                pit_id = result.get('pit_id', pit_id)
+                dicts = result.get('hits', {}).get('hits', [])
+                if not dicts:
+                    break
+                query_dict['search_after'] = dicts[-1]['sort']
+                yield from map(self.parse_match, dicts)
+                cnt_yielded += len(dicts)
+                if len(dicts) < page_size:
+                    break
+                if max_matches and cnt_yielded >= max_matches:
+                    break
+        finally:
+            self.elastic.close_point_in_time(body={'id': pit_id})
+
 # region Bulk Reads
 
     @property
-    def texts(self, page_size=100) -> Generator[Text, None, None]:
-        offset = 0
+    def texts(self) -> Generator[Text, None, None]:
+        return self.export()
+
+    def export(self, page_size: Optional[int] = None, slices: int = 1) -> Generator[Text, None, None]:
+        """
+            Dumps the whole index, unlike `from`/`size` paging, which gets
+            slower with every page and stops at `index.max_result_window`.
+            With `slices > 1` the point-in-time is split into independent
+            slices, each exported by its own thread. The order of documents
+            is arbitrary in that case.
+            https://www.elastic.co/guide/en/elasticsearch/reference/current/paginate-search-results.html#search-after
+            https://www.elastic.co/guide/en/elasticsearch/reference/current/point-in-time-api.html#search-slicing
+        """
+        page_size = page_size or self.page_size
+        if not self.index_exists():
+            return
+        pit_id = self.elastic.open_point_in_time(
+            index=self.db_name, keep_alive=self.keep_alive)['id']
+        try:
+            if slices <= 1:
+                for dicts in self.export_pages(pit_id, page_size):
+                    yield from map(self.parse_match, dicts)
+            else:
+                yield from self.export_sliced(pit_id, page_size, slices)
+        finally:
+            self.elastic.close_point_in_time(body={'id': pit_id})
+
+    def export_sliced(self, pit_id: str, page_size: int, slices: int) -> Generator[Text, None, None]:
+        # Bounded, so fast workers wait for a slow consumer.
+        pages = queue.Queue(maxsize=slices * 2)
+        stopped = threading.Event()
+
+        def put(page) -> bool:
+            while not stopped.is_set():
+                try:
+                    pages.put(page, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def export_slice(slice_id: int):
+            try:
+                for dicts in self.export_pages(pit_id, page_size, slice_id=slice_id, slices=slices):
+                    if not put(dicts):
+                        return
+            except Exception as e:
+                put(e)
+            finally:
+                put(None)
+
+        workers = [threading.Thread(target=export_slice, args=(i,), daemon=True)
+                   for i in range(slices)]
+        for w in workers:
+            w.start()
+        try:
+            cnt_finished = 0
+            while cnt_finished < slices:
+                page = pages.get()
+                if page is None:
+                    cnt_finished += 1
+                elif isinstance(page, Exception):
+                    raise page
+                else:
+                    yield from map(self.parse_match, page)
+        finally:
+            stopped.set()
+            for w in workers:
+                w.join()
+
+    def export_pages(
+        self,
+        pit_id: str,
+        page_size: int,
+        slice_id: Optional[int] = None,
+        slices: int = 1,
+    ) -> Generator[List[dict], None, None]:
+        query_dict = {
+            'query': {'match_all': {}},
+            'sort': ['_doc'],
+            'size': page_size,
+            'track_total_hits': False,
+        }
+        if slices > 1:
+            query_dict['slice'] = {'id': slice_id, 'max': slices}
         while True:
-            result = self.elastic.search(index=self.db_name, body={
-                "size": page_size,
-                "from": offset
-            })
+            query_dict['pit'] = {'id': pit_id, 'keep_alive': self.keep_alive}
+            result = self.elastic.search(body=query_dict)
+            pit_id = result.get('pit_id', pit_id)
             dicts = result.get('hits', {}).get('hits', [])
             if not dicts:
                 break
-            yield from map(self.parse_match, dicts)
-            offset += page_size
+            query_dict['search_after'] = dicts[-1]['sort']
+            yield dicts
+            if len(dicts) < page_size:
+                break
 
 # region Bulk Writes
 
-    def add_stream(self, stream, upsert=False) -> int:
+    def add_stream(self, stream, upsert=False, writers: Optional[int] = None, processes: Optional[int] = None) -> int:
         """
             https://elasticsearch-py.readthedocs.io/en/master/helpers.html
         """
+        cnt_success = super().add_stream(
+            stream, upsert=upsert, writers=writers, processes=processes)
+        # Waiting for a refresh on every chunk would slow the import,
+        # so even with `wait_for` we refresh once in the end.
+        if self.refresh in ('immediate', 'wait_for'):
+            self.commit_all()
+        return cnt_success
+
+    def add_prepared(self, batch, upsert=False) -> int:
+        return self.add(batch, upsert=upsert, sync=False)
+
+    @contextlib.contextmanager
+    def bulk_load(self):
+        """
+            Disables periodic refreshes and replicas, so Lucene segments are
+            built and copied once, then restores the previous settings.
+            https://www.elastic.co/guide/en/elasticsearch/reference/current/tune-for-indexing-speed.html
+        """
+        previous = self.index_settings('refresh_interval', 'number_of_replicas')
+        self.put_index_settings({'refresh_interval': '-1', 'number_of_replicas': 0})
+        try:
+            yield self
+        finally:
+            self.put_index_settings(previous)
+            self.commit_all()
+
+    def bulk(self, actions, **kwargs) -> int:
+        """
+            Sends actions in `_bulk` requests, instead of a round trip per document.
+            Failed items don't interrupt the batch, they are collected
+            into `bulk_errors` and the number of successful ones is returned.
+            https://www.elastic.co/guide/en/elasticsearch/reference/current/docs-bulk.html
+        """
+        return self.count_bulk_results(streaming_bulk(
+            client=self.elastic,
+            index=self.db_name,
+            actions=actions,
+            raise_on_error=False,
+            raise_on_exception=False,
+            **kwargs,
+        ))
+
+    def bulk_encoded(self, batch: TextBatch, **kwargs) -> int:
+        def send_parts():
+            for part in batch.split(type(self).__max_bulk_size__):
+                result = self.elastic.bulk(
+                    index=self.db_name, body=encode_bulk_body(part), **kwargs)
+                yield from bulk_item_results(result)
+
+        return self.count_bulk_results(send_parts())
+
+    def count_bulk_results(self, results) -> int:
         cnt_success = 0
-        if upsert:
-            for t in stream:
-                self.add(t, upsert=True, sync=False)
+        self.bulk_errors = list()
+        for ok, item in results:
+            if ok:
                 cnt_success += 1
-        else:
-            def produce_validated():
-                for t in stream:
-                    yield t.__dict__
-            for ok, action in streaming_bulk(
-                client=self.elastic,
-                index=self.db_name,
-                actions=produce_validated(),
-            ):
-                cnt_success += ok
-        #
-        self.commit_all()
+                continue
+            op_type, details = next(iter(item.items()))
+            # Deleting missing documents isn't an error, just a miss.
+            if op_type == 'delete' and details.get('result', None) == 'not_found':
+                continue
+            self.bulk_errors.append(item)
         return cnt_success
 
     def clear(self):
@@ -215,19 +635,144 @@ class ElasticSearch(BaseAPI):
             https://www.elastic.co/guide/en/elasticsearch/reference/master/indices-create-index.html
             https://sarahleejane.github.io/learning/python/2015/10/14/creating-an-elastic-search-index-with-python.html
         """
-        if self.index_exists():
+        if not self.index_exists():
+            properties = dict()
+            for field in self.indexed_fields:
+                properties[field] = {'type': 'text'}
+            self.elastic.indices.create(self.db_name, body={
+                'settings': {
+                    'number_of_shards': 1,
+                },
+                'mappings': {
+                    'properties': properties,
+                }
+            })
+        self.apply_refresh_policy()
+
+    def apply_refresh_policy(self):
+        """
+            https://www.elastic.co/guide/en/elasticsearch/reference/current/index-modules.html#dynamic-index-settings
+        """
+        if self.refresh != 'interval':
             return
-        properties = dict()
-        for field in self.indexed_fields:
-            properties[field] = {'type': 'text'}
-        self.elastic.indices.create(self.db_name, body={
-            'settings': {
-                'number_of_shards': 1,
+        self.put_index_settings({'refresh_interval': self.refresh_interval})
+
+    def index_settings(self, *names) -> dict:
+        """
+            Returns the explicitly set values of dynamic `index.*` settings,
+            with `None` for the defaults, so they can be put back as is.
+            https://www.elastic.co/guide/en/elasticsearch/reference/current/indices-get-settings.html
+        """
+        result = self.elastic.indices.get_settings(index=self.db_name)
+        settings = result[self.db_name]['settings']['index']
+        return {name: settings.get(name, None) for name in names}
+
+    def put_index_settings(self, settings: dict):
+        """
+            Settings with `None` values are reset to their defaults.
+            https://www.elastic.co/guide/en/elasticsearch/reference/current/indices-update-settings.html
+        """
+        self.elastic.indices.put_settings(index=self.db_name, body={
+            'index': settings,
+        })
+
+    def substring_query(self, query: str, case_sensitive: bool = True, include_text=True) -> dict:
+        """
+            Contents are fetched from the `_source` only if `include_text`.
+            https://www.elastic.co/guide/en/elasticsearch/reference/6.8/query-dsl-term-query.html
+            https://www.elastic.co/guide/en/elasticsearch/reference/6.8/query-dsl-match-query.html
+        """
+        # Alternatively, a `match_phrase` query can be used.
+        return {
+            'query': {
+                'match': {
+                    'content': {
+                        'query': query,
+                        'operator': 'and',
+                        'zero_terms_query': 'all',
+                        'auto_generate_synonyms_phrase_query': False,
+                    },
+                },
+            },
+            '_source': ['content'] if include_text else False,
+        }
+
+    def regex_query(self, query: str, case_sensitive: bool = True) -> dict:
+        """
+            https://www.elastic.co/guide/en/elasticsearch/reference/6.8/query-dsl-regexp-query.html
+            https://lucene.apache.org/core/4_9_0/core/org/apache/lucene/util/automaton/RegExp.html
+        """
+        return {
+            'query': {
+                'regexp': {
+                    'content': {
+                        'value': query,
+                        'flags': 'INTERVAL',
+                    },
+                },
+            },
+            'stored_fields': [],
+        }
+
+    def check_plan(self, plan: QueryPlan):
+        if plan.operation == 'scan' and not self.allow_scan:
+            raise ValueError(
+                f'No index term can narrow down {plan.pattern!r}, so every document '
+                f'would be exported and checked. Pass `allow_scan=True` to permit it.\n{plan}')
+
+    def plan_query(self, plan: QueryPlan) -> dict:
+        """
+            Every `regexp` of the plan must match one of the terms.
+            Only the default operators are used, so `flags` disable the rest.
+            https://www.elastic.co/guide/en/elasticsearch/reference/current/regexp-syntax.html
+        """
+        regexps = [plan.query] if plan.operation == 'regex' else plan.terms
+        return {
+            'query': {
+                'bool': {
+                    'must': [{'regexp': {'content': {'value': r, 'flags': 'NONE'}}}
+                             for r in regexps],
+                },
+            },
+            '_source': ['content'],
+        }
+
+    def snippet_query(self, query_dict: dict, snippet_length: int) -> dict:
+        """
+            Instead of the `_source`, returns one fragment of `snippet_length`
+            characters around the best match, without highlighting tags.
+            Fragments are cut on the server, but their offsets aren't reported.
+            https://www.elastic.co/guide/en/elasticsearch/reference/current/highlighting.html
+        """
+        query_dict = dict(query_dict)
+        query_dict['_source'] = False
+        query_dict['highlight'] = {
+            'fields': {
+                'content': {
+                    'fragment_size': snippet_length,
+                    'number_of_fragments': 1,
+                    'no_match_size': snippet_length,
+                    'pre_tags': [''],
+                    'post_tags': [''],
+                },
             },
-            'mappings': {
-                'properties': properties,
+        }
+        return query_dict
+
+    def make_index_actions(self, texts) -> Generator[dict, None, None]:
+        for t in texts:
+            yield {
+                '_op_type': 'index',
+                '_id': t._id,
+                'content': t.content,
+            }
+
+    def make_delete_actions(self, identifiers) -> Generator[dict, None, None]:
+        for identifier in identifiers:
+            yield {
+                '_op_type': 'delete',
+                '_id': identifier,
             }
-        })
 
     def index_exists(self):
         """
@@ -235,14 +780,49 @@ class ElasticSearch(BaseAPI):
         """
         return self.elastic.indices.exists(self.db_name)
 
+    def write_params(self, sync: bool) -> dict:
+        """
+            https://www.elastic.co/guide/en/elasticsearch/reference/current/docs-refresh.html
+        """
+        if sync and self.refresh == 'wait_for':
+            return {'refresh': 'wait_for'}
+        return {}
+
+    def refresh_after_write(self, sync: bool):
+        if sync and self.refresh == 'immediate':
+            self.commit_all()
+
     def commit_all(self):
-        return self.elastic.indices.refresh(self.db_name)
+        """
+            Makes all the previous writes searchable. Refreshes are coalesced:
+            writers arriving while one is running wait for the next one,
+            which serves all of them at once, instead of queueing their own.
+            https://www.elastic.co/guide/en/elasticsearch/reference/current/indices-refresh.html
+        """
+        with self.refresh_lock:
+            self.refresh_requested += 1
+            ticket = self.refresh_requested
+            while self.refresh_completed < ticket:
+                if self.refresh_running:
+                    self.refresh_lock.wait()
+                    continue
+                self.refresh_running = True
+                covered = self.refresh_requested
+                self.refresh_lock.release()
+                try:
+                    self.elastic.indices.refresh(self.db_name)
+                finally:
+                    self.refresh_lock.acquire()
+                    self.refresh_running = False
+                    self.refresh_lock.notify_all()
+                self.refresh_completed = max(self.refresh_completed, covered)
 
     def parse_match(self, hit: dict) -> TextMatch:
         return TextMatch(
             _id=int(hit.pop('_id', 0)),
             content=hit.pop('_source', {}).pop('content', ''),
             rating=float(hit.pop('_score', 1)),
+            snippets=hit.pop('highlight', {}).get('content', []),
         )
 
 
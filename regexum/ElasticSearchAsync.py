@@ -0,0 +1,409 @@
+import re
+import asyncio
+from typing import List, Optional, Dict, Generator, Set, Tuple, Sequence, AsyncGenerator
+
+from elasticsearch.helpers import async_streaming_bulk
+
+from PyStorageTexts.BaseAsyncAPI import BaseAsyncAPI
+from PyStorageTexts.Registry import shared_client, release_client, reconnect_after_fork, ForkSafeClients
+from PyStorageTexts.ElasticSearch import ElasticSearch, encode_bulk_body, bulk_item_results
+from PyStorageHelpers import *
+
+
+class ElasticSearchAsync(BaseAsyncAPI, ForkSafeClients):
+    """
+        Same index layout, queries and refresh policies as `ElasticSearch`,
+        but through the `asyncio` client, that multiplexes many requests
+        over a shared `aiohttp` connection pool.
+        https://elasticsearch-py.readthedocs.io/en/master/async.html
+
+        RegEx queries are planned, translated and verified like in `ElasticSearch`.
+    """
+    __client_attributes__ = ('elastic',)
+    __is_concurrent__ = True
+    __max_batch_size__ = ElasticSearch.__max_bulk_size__
+    __max_in_flight__ = 4
+    __regex_dialect__ = ElasticSearch.__regex_dialect__
+    __exact_substrings__ = ElasticSearch.__exact_substrings__
+    __refresh_policies__ = ElasticSearch.__refresh_policies__
+
+# region Metadata
+
+    def __init__(
+        self,
+        url='http://localhost:9200/text',
+        page_size=1000,
+        keep_alive='1m',
+        refresh='immediate',
+        refresh_interval='1s',
+        pool_size: Optional[int] = None,
+        allow_scan: bool = False,
+        **kwargs,
+    ):
+        BaseAsyncAPI.__init__(self, **kwargs)
+        if refresh not in type(self).__refresh_policies__:
+            raise ValueError(f'Unknown refresh policy: {refresh}')
+        self.refresh = refresh
+        self.refresh_interval = refresh_interval
+        # Synchronization primitives are created on first use,
+        # to bind to the loop, that actually runs the requests.
+        self.refresh_lock = None
+        self.refresh_requested = 0
+        self.refresh_completed = 0
+        self.refresh_running = False
+        self.page_size = page_size
+        self.keep_alive = keep_alive
+        # RegEx queries without any term to look up would export the whole
+        # index to the client for verification, unless refused by default.
+        self.allow_scan = allow_scan
+        self.bulk_errors = list()
+        url, db_name = extract_database_name(url, default='text')
+        self.url = url
+        self.pool_size = pool_size
+        self.db_name = db_name
+        self.reconnect()
+        reconnect_after_fork(self)
+        # Constructors can't await, so the index is created before the first request.
+        self.index_ready = False
+
+    async def count_texts(self) -> int:
+        if not await self.index_exists():
+            return 0
+        result = await self.elastic.count(index=self.db_name)
+        return result.get('count', 0)
+
+    def reconnect(self):
+        self.elastic = shared_client('elasticsearch_async', self.url, pool_size=self.pool_size)
+
+    async def close(self):
+        # The client is shared, so only its last user closes it.
+        client = release_client('elasticsearch_async', self.url, pool_size=self.pool_size)
+        if client is not None:
+            await client.close()
+
+# region Random Writes
+
+    async def add(self, one_or_many_texts, upsert=True, sync=True) -> int:
+        await self.ensure_index()
+        if isinstance(one_or_many_texts, Text):
+            result = await self.elastic.index(index=self.db_name, id=one_or_many_texts._id, body={
+                'content': one_or_many_texts.content,
+            }, **self.write_params(sync))
+            result = result.get('result', None)
+            success = (result == 'created') or (result == 'updated')
+            if success:
+                await self.refresh_after_write(sync)
+            return success
+        elif is_sequence_of(one_or_many_texts, Text):
+            cnt = await self.bulk(self.make_index_actions(
+                one_or_many_texts), **self.write_params(sync))
+            if cnt:
+                await self.refresh_after_write(sync)
+            return cnt
+        elif isinstance(one_or_many_texts, TextBatch):
+            cnt = await self.bulk_encoded(
+                one_or_many_texts, **self.write_params(sync))
+            if cnt:
+                await self.refresh_after_write(sync)
+            return cnt
+
+        return await super().add(one_or_many_texts, upsert=upsert)
+
+    async def remove(self, one_or_many_texts, sync=True) -> int:
+        if isinstance(one_or_many_texts, int):
+            result = await self.elastic.delete(
+                index=self.db_name, id=one_or_many_texts, ignore=[404], **self.write_params(sync))
+            success = (result.get('result', None) == 'deleted')
+            if success:
+                await self.refresh_after_write(sync)
+            return success
+        elif is_sequence_of(one_or_many_texts, int):
+            cnt = await self.bulk(self.make_delete_actions(
+                one_or_many_texts), **self.write_params(sync))
+            if cnt:
+                await self.refresh_after_write(sync)
+            return cnt
+
+        return await super().remove(one_or_many_texts)
+
+# region Random Reads
+
+    async def get(self, identifier: int) -> Optional[Text]:
+        """
+            https://www.elastic.co/guide/en/elasticsearch/reference/current/docs-get.html
+        """
+        result = await self.elastic.get(index=self.db_name, id=identifier, ignore=[404])
+        if result and result.get('found', False):
+            return self.parse_match(dict(result))
+        return None
+
+    async def find_substring(
+        self,
+        query: str,
+        case_sensitive: bool = True,
+        max_matches: Optional[int] = None,
+        include_text=True,
+    ) -> Sequence[TextMatch]:
+        query_dict = self.substring_query(
+            query, case_sensitive=case_sensitive, include_text=include_text)
+        return await self.search(query_dict, max_matches=max_matches)
+
+    async def find_regex(
+        self,
+        query: str,
+        case_sensitive: bool = True,
+        max_matches: Optional[int] = None,
+        include_text=True,
+    ) -> Sequence[TextMatch]:
+        return [m async for m in self.iter_regex(
+            query,
+            case_sensitive=case_sensitive,
+            max_matches=max_matches,
+            include_text=include_text,
+        )]
+
+    async def search(self, query_dict: dict, max_matches: Optional[int] = None) -> Sequence[TextMatch]:
+        await self.ensure_index()
+        query_dict = dict(query_dict)
+        if max_matches:
+            query_dict['from'] = 0
+            query_dict['size'] = max_matches
+        result = await self.elastic.search(index=self.db_name, body=query_dict)
+        dicts = result.get('hits', {}).get('hits', [])
+        return list(map(self.parse_match, dicts))
+
+# region Streaming Reads
+
+    async def iter_substring(
+        self,
+        query: str,
+        case_sensitive: bool = True,
+        max_matches: Optional[int] = None,
+        include_text=True,
+    ) -> AsyncGenerator[TextMatch, None]:
+        query_dict = self.substring_query(
+            query, case_sensitive=case_sensitive, include_text=include_text)
+        async for m in self.iter_search(query_dict, max_matches=max_matches):
+            yield m
+
+    async def iter_regex(
+        self,
+        query: str,
+        case_sensitive: bool = True,
+        max_matches: Optional[int] = None,
+        include_text=True,
+    ) -> AsyncGenerator[TextMatch, None]:
+        """
+            Runs the plan of `explain`, just like `ElasticSearch.iter_regex`,
+            verifying all the candidates with Python `re`.
+        """
+        plan = self.explain(query, case_sensitive=case_sensitive)
+        self.check_plan(plan)
+        if plan.operation == 'scan':
+            candidates = self.texts
+        else:
+            candidates = self.iter_search(self.plan_query(plan))
+        pattern = compile_query(query, is_regex=True,
+                                case_sensitive=case_sensitive)
+        async for m in self.verify(candidates, pattern, max_matches, include_text):
+            yield m
+
+    async def verify(
+        self,
+        candidates: AsyncGenerator[TextMatch, None],
+        pattern: re.Pattern,
+        max_matches: Optional[int],
+        include_text: bool,
+    ) -> AsyncGenerator[TextMatch, None]:
+        cnt_yielded = 0
+        try:
+            async for m in candidates:
+                if not pattern.search(m.content):
+                    continue
+                if not include_text:
+                    m.content = ''
+                yield m
+                cnt_yielded += 1
+                if max_matches and cnt_yielded >= max_matches:
+                    return
+        finally:
+            await candidates.aclose()
+
+    async def iter_search(self, query_dict: dict, max_matches: Optional[int] = None) -> AsyncGenerator[TextMatch, None]:
+        """
+            Async port of `ElasticSearch.iter_search`: `search_after` over a point-in-time.
+        """
+        if max_matches and max_matches <= self.page_size:
+            for m in await self.search(query_dict, max_matches=max_matches):
+                yield m
+            return
+
+        query_dict = dict(query_dict)
+        query_dict['sort'] = [{'_score': 'desc'}, {'_shard_doc': 'asc'}]
+        query_dict['track_total_hits'] = False
+        cnt_yielded = 0
+        async for dicts in self.iter_pages(query_dict, max_matches=max_matches):
+            for m in map(self.parse_match, dicts):
+                yield m
+            cnt_yielded += len(dicts)
+            if max_matches and cnt_yielded >= max_matches:
+                break
+
+# region Bulk Reads
+
+    @property
+    async def texts(self) -> AsyncGenerator[Text, None]:
+        if not await self.index_exists():
+            return
+        query_dict = {
+            'query': {'match_all': {}},
+            'sort': ['_doc'],
+            'track_total_hits': False,
+        }
+        async for dicts in self.iter_pages(query_dict):
+            for t in map(self.parse_match, dicts):
+                yield t
+
+    async def iter_pages(self, query_dict: dict, max_matches: Optional[int] = None) -> AsyncGenerator[List[dict], None]:
+        """
+            https://www.elastic.co/guide/en/elasticsearch/reference/current/point-in-time-api.html
+            https://www.elastic.co/guide/en/elasticsearch/reference/current/paginate-search-results.html#search-after
+        """
+        await self.ensure_index()
+        result = await self.elastic.open_point_in_time(
+            index=self.db_name, keep_alive=self.keep_alive)
+        pit_id = result['id']
+        try:
+            cnt_fetched = 0
+            while True:
+                page_size = self.page_size
+                if max_matches:
+                    page_size = min(page_size, max_matches - cnt_fetched)
+                query_dict['size'] = page_size
+                query_dict['pit'] = {'id': pit_id, 'keep_alive': self.keep_alive}
+                result = await self.elastic.search(body=query_dict)
+                pit_id = result.get('pit_id', pit_id)
+                dicts = result.get('hits', {}).get('hits', [])
+                if not dicts:
+                    break
+                query_dict['search_after'] = dicts[-1]['sort']
+                yield dicts
+                cnt_fetched += len(dicts)
+                if len(dicts) < page_size:
+                    break
+        finally:
+            await self.elastic.close_point_in_time(body={'id': pit_id})
+
+# region Bulk Writes
+
+    async def add_stream(self, stream, upsert=False, in_flight: Optional[int] = None) -> int:
+        """
+            Keeps up to `in_flight` `_bulk` requests running at once.
+            Like in `ElasticSearch.add_stream`, refreshes once in the end.
+        """
+        cnt_success = await super().add_stream(stream, upsert=upsert, in_flight=in_flight)
+        if self.refresh in ('immediate', 'wait_for'):
+            await self.commit_all()
+        return cnt_success
+
+    async def add_prepared(self, batch, upsert=False) -> int:
+        return await self.add(batch, upsert=upsert, sync=False)
+
+    async def bulk(self, actions, **kwargs) -> int:
+        """
+            https://elasticsearch-py.readthedocs.io/en/master/async.html#async-helpers
+        """
+        results = [r async for r in async_streaming_bulk(
+            client=self.elastic,
+            index=self.db_name,
+            actions=actions,
+            raise_on_error=False,
+            raise_on_exception=False,
+            **kwargs,
+        )]
+        return self.count_bulk_results(results)
+
+    async def bulk_encoded(self, batch: TextBatch, **kwargs) -> int:
+        results = list()
+        for part in batch.split(ElasticSearch.__max_bulk_size__):
+            result = await self.elastic.bulk(
+                index=self.db_name, body=encode_bulk_body(part), **kwargs)
+            results.extend(bulk_item_results(result))
+        return self.count_bulk_results(results)
+
+    async def clear(self):
+        if await self.index_exists():
+            await self.elastic.indices.delete(index=self.db_name)
+        self.index_ready = False
+        await self.ensure_index()
+
+# region Helpers
+
+    async def ensure_index(self):
+        """
+            https://www.elastic.co/guide/en/elasticsearch/reference/master/indices-create-index.html
+        """
+        if self.index_ready:
+            return
+        if not await self.index_exists():
+            properties = dict()
+            for field in self.indexed_fields:
+                properties[field] = {'type': 'text'}
+            # Concurrent first requests may race to create the index.
+            await self.elastic.indices.create(index=self.db_name, ignore=[400], body={
+                'settings': {
+                    'number_of_shards': 1,
+                },
+                'mappings': {
+                    'properties': properties,
+                }
+            })
+        if self.refresh == 'interval':
+            await self.elastic.indices.put_settings(index=self.db_name, body={
+                'index': {
+                    'refresh_interval': self.refresh_interval,
+                },
+            })
+        self.index_ready = True
+
+    async def index_exists(self) -> bool:
+        return await self.elastic.indices.exists(index=self.db_name)
+
+    async def refresh_after_write(self, sync: bool):
+        if sync and self.refresh == 'immediate':
+            await self.commit_all()
+
+    async def commit_all(self):
+        """
+            Coalesces refreshes just like `ElasticSearch.commit_all`,
+            but suspends the waiting coroutines instead of threads.
+            https://www.elastic.co/guide/en/elasticsearch/reference/current/indices-refresh.html
+        """
+        if self.refresh_lock is None:
+            self.refresh_lock = asyncio.Condition()
+        async with self.refresh_lock:
+            self.refresh_requested += 1
+            ticket = self.refresh_requested
+            while self.refresh_completed < ticket:
+                if self.refresh_running:
+                    await self.refresh_lock.wait()
+                    continue
+                self.refresh_running = True
+                covered = self.refresh_requested
+                self.refresh_lock.release()
+                try:
+                    await self.elastic.indices.refresh(index=self.db_name)
+                finally:
+                    await self.refresh_lock.acquire()
+                    self.refresh_running = False
+                    self.refresh_lock.notify_all()
+                self.refresh_completed = max(self.refresh_completed, covered)
+
+    substring_query = ElasticSearch.substring_query
+    plan_query = ElasticSearch.plan_query
+    check_plan = ElasticSearch.check_plan
+    make_index_actions = ElasticSearch.make_index_actions
+    make_delete_actions = ElasticSearch.make_delete_actions
+    write_params = ElasticSearch.write_params
+    count_bulk_results = ElasticSearch.count_bulk_results
+    parse_match = ElasticSearch.parse_match
@@ -1,14 +1,131 @@
 from typing import List, Optional, Dict, Generator, Set, Tuple, Sequence
+import re
+import struct
+import contextlib
+import concurrent.futures
 
+import bson
+from bson.raw_bson import RawBSONDocument
 import pymongo
-from pymongo import MongoClient
-from pymongo import UpdateOne, DeleteOne
+from pymongo import UpdateOne, DeleteOne, ReplaceOne
+from pymongo.write_concern import WriteConcern
 
 from PyStorageTexts.BaseAPI import BaseAPI
+from PyStorageTexts.Registry import shared_client, release_client, reconnect_after_fork, ForkSafeClients
 from PyStorageHelpers import *
 
+# Options of bulk writes, selected with `MongoDB(..., write_profile=...)`.
+# Imports don't wait for the journal, as a failed one is simply restarted.
+# Unacknowledged writes can't bypass the validation, the driver forbids it.
+# https://docs.mongodb.com/manual/reference/write-concern/
+# https://docs.mongodb.com/manual/core/schema-validation/#bypass-document-validation
+WRITE_PROFILES = {
+    'default': {'write_concern': {}, 'bypass_document_validation': False},
+    'import': {'write_concern': {'w': 1, 'j': False}, 'bypass_document_validation': True},
+    'unacknowledged': {'write_concern': {'w': 0}, 'bypass_document_validation': False},
+}
 
-class MongoDB(BaseAPI):
+
+def encode_texts(texts: Sequence[Text]) -> List[bytes]:
+    """
+        Serializes texts into BSON in a worker process,
+        so the writing threads only push bytes into sockets.
+    """
+    if isinstance(texts, TextBatch):
+        return encode_batch(texts)
+    return [bson.encode(t.to_dict()) for t in texts]
+
+
+def encode_batch(batch: TextBatch) -> List[bytes]:
+    """
+        Assembles `{_id: int64, content: string}` BSON documents straight
+        from the columns, reusing the UTF-8 contents without decoding them.
+        http://bsonspec.org/spec.html
+    """
+    docs = list()
+    for i, _id in enumerate(batch.ids):
+        content = batch.encoded(i)
+        header = struct.pack(
+            '<iB4sqB8si',
+            32 + len(content),
+            0x12, b'_id\x00', _id,
+            0x02, b'content\x00', len(content) + 1,
+        )
+        docs.append(b''.join((header, content, b'\x00\x00')))
+    return docs
+
+
+def make_document(t: Text, trigrams=False) -> dict:
+    d = t.to_dict()
+    if trigrams:
+        d['trigrams'] = trigram_hashes(t.content)
+    return d
+
+
+def encode_texts_with_trigrams(texts: Sequence[Text]) -> List[bytes]:
+    """ Like `encode_texts`, but hashing the trigrams in the worker process as well. """
+    if isinstance(texts, TextBatch):
+        texts = [Text(_id, content) for _id, content in texts.items()]
+    return [bson.encode(make_document(t, trigrams=True)) for t in texts]
+
+
+def trigrams_filter(query: tuple) -> Optional[dict]:
+    """
+        Converts the output of `regex_to_trigram_query` into a filter
+        over the multikey `trigrams` field. Trigrams of a conjunction
+        are grouped into one `$all`. Returns `None`, if nothing can match.
+        https://docs.mongodb.com/manual/reference/operator/query/all/
+        https://docs.mongodb.com/manual/core/index-multikey/
+    """
+    kind = query[0]
+    if kind == 'all':
+        return {}
+    elif kind == 'none':
+        return None
+    elif kind == 'trigram':
+        return {'trigrams': trigram_hash(query[1])}
+    elif kind == 'or':
+        return {'$or': [trigrams_filter(q) for q in query[1]]}
+
+    hashes = [trigram_hash(q[1]) for q in query[1] if q[0] == 'trigram']
+    clauses = [{'trigrams': {'$all': hashes}}] if hashes else []
+    clauses.extend(trigrams_filter(q) for q in query[1] if q[0] != 'trigram')
+    return clauses[0] if len(clauses) == 1 else {'$and': clauses}
+
+
+def substring_filter(query: str, case_sensitive: bool = True) -> dict:
+    """
+        CAUTION: Seems like MongoDB doesn't support text search limited 
+        to a specific field, so it's inapplicable to more complex cases.
+        https://docs.mongodb.com/manual/reference/operator/query/text/
+        https://docs.mongodb.com/manual/core/index-text/
+        https://docs.mongodb.com/manual/reference/text-search-languages/#text-search-languages
+    """
+    return {
+        '$text': {
+            '$search': f'\"{query}\"',
+            '$caseSensitive': case_sensitive,
+            '$diacriticSensitive': False,
+        },
+    }
+
+
+def regex_filter(query: str, case_sensitive: bool = True) -> dict:
+    """
+        Python patterns are translated into PCRE, so anchors and
+        named groups keep their meaning.
+        https://docs.mongodb.com/manual/reference/operator/query/regex/
+    """
+    opts = 'm' if case_sensitive else 'mi'
+    return {
+        'content': {
+            '$regex': translate_regex(query, 'pcre'),
+            '$options': opts,
+        },
+    }
+
+
+class MongoDB(BaseAPI, ForkSafeClients):
     """
         MongoDB until v2.6 had 1'000 element limit for the batch size.
         It was later pushed to 100'000, but there isn't much improvement 
@@ -16,120 +133,353 @@ class MongoDB(BaseAPI):
         in RAM with such batch sizes.
         https://stackoverflow.com/q/51250036/2766161
         https://docs.mongodb.com/manual/reference/limits/#Write-Command-Batch-Limit-Size
+
+        With `trigrams` every document also stores the sorted hashes of its
+        case-folded trigrams in a multikey-indexed `trigrams` field.
+        Substring and RegEx queries then look up the candidates, that
+        contain all the required trigrams, and verify them with `$regex`,
+        instead of scanning the whole collection. Substrings are matched
+        exactly in this mode, not by `$text` tokens.
+
+        The `write_profile` trades the durability of bulk writes for speed,
+        see `WRITE_PROFILES`. With `'unacknowledged'` the server reports
+        nothing back, so the returned counts are just the number of sent
+        documents. Every one of the `writers` threads of `add_stream`
+        runs its own `bulk_write` over the shared connection pool.
+
+        All the instances pointing to one server share a client with
+        up to `pool_size` connections, which is recreated after `fork`.
     """
+    __client_attributes__ = ('db', 'texts_collection', 'writes_collection')
     __max_batch_size__ = 10000
+    __max_writers__ = 4
+    __max_readers__ = 8
+    __max_facets__ = 64
+    __max_facet_ids__ = 100000
     __is_concurrent__ = True
+    __regex_dialect__ = 'pcre'
+    # `$text` matches stemmed tokens, not arbitrary substrings.
+    __exact_substrings__ = False
 
 # region Metadata
 
-    def __init__(self, url='mongodb://localhost:27017/texts', **kwargs):
+    def __init__(
+        self,
+        url='mongodb://localhost:27017/texts',
+        batch_size=1000,
+        trigrams=False,
+        write_profile='default',
+        writers: Optional[int] = None,
+        pool_size: Optional[int] = None,
+        **kwargs,
+    ):
         BaseAPI.__init__(self, **kwargs)
-        _, db_name = extract_database_name(url)
-        self.db = MongoClient(url)
-        self.texts_collection = self.db[db_name]['texts']
+        # Number of documents fetched per round trip by streaming cursors.
+        self.batch_size = batch_size
+        self.trigrams = trigrams
+        if write_profile not in WRITE_PROFILES:
+            raise ValueError(f'Unknown write profile: {write_profile}')
+        profile = WRITE_PROFILES[write_profile]
+        self.write_concern = WriteConcern(**profile['write_concern'])
+        self.bypass_document_validation = profile['bypass_document_validation']
+        self.writers = writers
+        self.url = url
+        self.pool_size = pool_size
+        self.reconnect()
+        reconnect_after_fork(self)
         self.create_indexes()
 
+    def reconnect(self):
+        _, db_name = extract_database_name(self.url)
+        self.db = shared_client('mongodb', self.url, pool_size=self.pool_size)
+        self.texts_collection = self.db[db_name]['texts']
+        # Only the inserts and upserts use the profile,
+        # reads and removals keep the defaults.
+        self.writes_collection = self.texts_collection.with_options(
+            write_concern=self.write_concern)
+
     def count_texts(self) -> int:
         return self.texts_collection.count_documents(filter={})
 
+    def close(self):
+        # The client is shared, so only its last user closes it.
+        client = release_client('mongodb', self.url, pool_size=self.pool_size)
+        if client is not None:
+            client.close()
+
 # region Random Reads
 
     def get(self, query: int) -> Optional[Text]:
         result = self.texts_collection.find_one(filter={
             '_id': query
-        })
+        }, projection=['_id', 'content'])
         if result:
             return Text(**result)
         return None
 
+    def get_many(
+        self,
+        ids: Sequence[int],
+        include_text=True,
+        max_length: Optional[int] = None,
+    ) -> List[Optional[Text]]:
+        """
+            Fetches up to `batch_size` documents per `$in` query.
+            Truncation happens on the server with `$substrCP`.
+            https://docs.mongodb.com/manual/reference/operator/query/in/
+            https://docs.mongodb.com/manual/reference/operator/aggregation/substrCP/
+        """
+        found = dict()
+        for part in chunks(ids, self.batch_size):
+            match = {'_id': {'$in': part}}
+            if not include_text:
+                dicts = self.texts_collection.find(
+                    filter=match, projection=['_id'])
+            elif max_length is not None:
+                dicts = self.texts_collection.aggregate([
+                    {'$match': match},
+                    {'$project': {'content': {
+                        '$substrCP': ['$content', 0, max_length]}}},
+                ])
+            else:
+                dicts = self.texts_collection.find(
+                    filter=match, projection=['_id', 'content'])
+            for d in dicts:
+                found[d['_id']] = Text(d['_id'], d.get('content', ''))
+        return [found.get(_id, None) for _id in ids]
+
     def find_substring(
         self,
         query: str,
         case_sensitive: bool = True,
         max_matches: Optional[int] = None,
         include_text=True,
+        snippet_length: Optional[int] = None,
     ) -> Sequence[TextMatch]:
+        if snippet_length:
+            return self.find_snippets(
+                filter=self.search_filter(
+                    query, is_regex=False, case_sensitive=case_sensitive),
+                pattern=translate_regex(re.escape(query), 'pcre'),
+                case_sensitive=case_sensitive,
+                max_matches=max_matches,
+                snippet_length=snippet_length,
+            )
+        return list(self.iter_substring(
+            query,
+            case_sensitive=case_sensitive,
+            max_matches=max_matches,
+            include_text=include_text,
+        ))
+
+    def find_regex(
+        self,
+        query: str,
+        case_sensitive: bool = True,
+        max_matches: Optional[int] = None,
+        include_text=True,
+        snippet_length: Optional[int] = None,
+    ) -> Sequence[TextMatch]:
+        if snippet_length:
+            return self.find_snippets(
+                filter=self.search_filter(
+                    query, is_regex=True, case_sensitive=case_sensitive),
+                pattern=translate_regex(query, 'pcre'),
+                case_sensitive=case_sensitive,
+                max_matches=max_matches,
+                snippet_length=snippet_length,
+            )
+        return list(self.iter_regex(
+            query,
+            case_sensitive=case_sensitive,
+            max_matches=max_matches,
+            include_text=include_text,
+        ))
+
+    def find_snippets(
+        self,
+        filter: dict,
+        pattern: str,
+        case_sensitive: bool = True,
+        max_matches: Optional[int] = None,
+        snippet_length: int = 200,
+    ) -> List[TextMatch]:
         """
-            CAUTION: Seems like MongoDB doesn't support text search limited 
-            to a specific field, so it's inapplicable to more complex cases.
+            Locates the first occurrence of the `pattern` with `$regexFind`
+            and cuts `snippet_length` characters around it with `$substrCP`,
+            so the full `content` never leaves the server. Documents, that
+            `$text` matched only by tokens, get the beginning of the `content`.
+            https://docs.mongodb.com/manual/reference/operator/aggregation/regexFind/
+            https://docs.mongodb.com/manual/reference/operator/aggregation/substrCP/
         """
-        # https://docs.mongodb.com/manual/reference/operator/query/text/
-        # https://docs.mongodb.com/manual/core/index-text/
-        # https://docs.mongodb.com/manual/reference/text-search-languages/#text-search-languages
-        proj = ['_id', 'content'] if include_text else ['_id']
-        dicts = self.texts_collection.find(filter={
-            '$text': {
-                '$search': f'\"{query}\"',
-                '$caseSensitive': case_sensitive,
-                '$diacriticSensitive': False,
-            },
-        }, projection=proj)
+        if filter is None:
+            return []
+        stages = [{'$match': filter}]
         if max_matches:
-            dicts = dicts.limit(max_matches)
-        return list(map(self.parse_match, dicts))
+            stages.append({'$limit': max_matches})
+        stages.append({'$addFields': {'found': {'$regexFind': {
+            'input': '$content',
+            'regex': pattern,
+            'options': 'm' if case_sensitive else 'mi',
+        }}}})
+        stages.append({'$project': {
+            'start': '$found.idx',
+            'length': {'$cond': [
+                '$found', {'$strLenCP': '$found.match'}, '$$REMOVE']},
+            'snippet': {'$substrCP': [
+                '$content',
+                {'$max': [0, {'$subtract': ['$found.idx', snippet_length // 2]}]},
+                snippet_length,
+            ]},
+        }})
 
-    def find_regex(
+        results = list()
+        for d in self.texts_collection.aggregate(stages):
+            m = TextMatch(_id=d['_id'], rating=1, snippets=[d['snippet']])
+            if d.get('start') is not None:
+                m.spans = [(d['start'], d['start'] + d['length'])]
+            results.append(m)
+        return results
+
+    def find_substring_many(
+        self,
+        queries: Sequence[str],
+        case_sensitive: bool = True,
+        max_matches: Optional[int] = None,
+        include_text=True,
+    ) -> List[Sequence[TextMatch]]:
+        """
+            `$text` must be the first stage of a pipeline and can't be used
+            inside a `$facet`, so the queries are sent concurrently over
+            the connection pool instead.
+            https://docs.mongodb.com/manual/reference/operator/aggregation/facet/#behavior
+        """
+        return self.find_concurrently(
+            self.find_substring,
+            queries,
+            case_sensitive=case_sensitive,
+            max_matches=max_matches,
+            include_text=include_text,
+        )
+
+    def find_regex_many(
+        self,
+        queries: Sequence[str],
+        case_sensitive: bool = True,
+        max_matches: Optional[int] = None,
+        include_text=True,
+    ) -> List[Sequence[TextMatch]]:
+        """
+            RegEx queries can't use indexes and scan the whole collection.
+            With `$facet` up to `__max_facets__` of them share one scan.
+            Only IDs are returned from the aggregation, as its output must
+            fit into one 16 MB document, contents are fetched afterwards.
+            https://docs.mongodb.com/manual/reference/operator/aggregation/facet/
+
+            To stay below that limit, every facet is capped by `max_matches`
+            and a single scan returns at most `__max_facet_ids__` IDs.
+            Unbounded queries stream from their own cursors instead.
+            Sub-pipelines of a `$facet` can't use indexes, so with `trigrams`
+            the queries are sent concurrently as well.
+        """
+        max_facet_ids = type(self).__max_facet_ids__
+        if self.trigrams or not max_matches or max_matches > max_facet_ids:
+            return self.find_concurrently(
+                self.find_regex,
+                queries,
+                case_sensitive=case_sensitive,
+                max_matches=max_matches,
+                include_text=include_text,
+            )
+        results = list()
+        facets_per_scan = min(type(self).__max_facets__, max_facet_ids // max_matches)
+        for part in chunks(queries, facets_per_scan):
+            facets = dict()
+            for i, query in enumerate(part):
+                facets[str(i)] = [
+                    {'$match': regex_filter(query, case_sensitive=case_sensitive)},
+                    {'$limit': max_matches},
+                    {'$project': {'_id': 1}},
+                ]
+            output = next(self.texts_collection.aggregate(
+                [{'$facet': facets}]), {})
+            results.extend([d['_id'] for d in output.get(str(i), [])]
+                           for i in range(len(part)))
+
+        if not include_text:
+            return [[TextMatch(_id=_id, rating=1) for _id in ids] for ids in results]
+        contents = self.get_contents({_id for ids in results for _id in ids})
+        return [[TextMatch(_id=_id, content=contents.get(_id, ''), rating=1) for _id in ids]
+                for ids in results]
+
+# region Streaming Reads
+
+    def iter_substring(
         self,
         query: str,
         case_sensitive: bool = True,
         max_matches: Optional[int] = None,
         include_text=True,
-    ) -> Sequence[TextMatch]:
+    ) -> Generator[TextMatch, None, None]:
+        yield from self.iter_cursor(
+            filter=self.search_filter(
+                query, is_regex=False, case_sensitive=case_sensitive),
+            max_matches=max_matches,
+            include_text=include_text,
+        )
+
+    def iter_regex(
+        self,
+        query: str,
+        case_sensitive: bool = True,
+        max_matches: Optional[int] = None,
+        include_text=True,
+    ) -> Generator[TextMatch, None, None]:
+        yield from self.iter_cursor(
+            filter=self.search_filter(
+                query, is_regex=True, case_sensitive=case_sensitive),
+            max_matches=max_matches,
+            include_text=include_text,
+        )
 
-        # https://docs.mongodb.com/manual/reference/operator/query/regex/
+    def iter_cursor(
+        self,
+        filter: dict,
+        max_matches: Optional[int] = None,
+        include_text=True,
+    ) -> Generator[TextMatch, None, None]:
+        """
+            Keeps the server-side cursor open, while the caller consumes
+            the results, and closes it, if the generator is abandoned.
+            https://api.mongodb.com/python/current/api/pymongo/cursor.html#pymongo.cursor.Cursor.batch_size
+        """
+        if filter is None:
+            return
         proj = ['_id', 'content'] if include_text else ['_id']
-        opts = 'm' if case_sensitive else 'mi'
-        dicts = self.texts_collection.find(filter={
-            'content': {
-                '$regex': query,
-                '$options': opts,
-            },
-        }, projection=proj)
+        dicts = self.texts_collection.find(filter=filter, projection=proj)
+        dicts = dicts.batch_size(self.batch_size)
         if max_matches:
             dicts = dicts.limit(max_matches)
-        return list(map(self.parse_match, dicts))
+        try:
+            yield from map(self.parse_match, dicts)
+        finally:
+            dicts.close()
 
 # region Random Writes
 
     def add(self, obj: Text, upsert=True) -> int:
         """
-            Supports up to 1000 updates per batch.
+            Upserts replace whole documents, which is cheaper for the server,
+            than merging the `$set` of every field.
             https://api.mongodb.com/python/current/examples/bulk.html#ordered-bulk-write-operations
         """
-        target = self.texts_collection
         if isinstance(obj, Text):
-            if upsert:
-                result = target.update_one(
-                    filter={'_id': obj._id, },
-                    update={'$set': obj.__dict__, },
-                    upsert=True,
-                )
-                return (result.modified_count >= 1) or (result.upserted_id is not None)
-            else:
-                return target.insert_one(obj.__dict__).acknowledged
+            return self.write_documents([make_document(obj, self.trigrams)], upsert=upsert) >= 1
         elif is_sequence_of(obj, Text):
-            if upsert:
-                def make_upsert(o):
-                    return UpdateOne(
-                        filter={'_id': o._id, },
-                        update={'$set': o.__dict__, },
-                        upsert=True,
-                    )
-                ops = list(map(make_upsert, obj))
-                try:
-                    result = target.bulk_write(
-                        requests=ops, ordered=False)
-                    cnt_old = result.bulk_api_result['nUpserted']
-                    cnt_new = result.bulk_api_result['nInserted']
-                    return cnt_new + cnt_old
-                except pymongo.errors.BulkWriteError as bwe:
-                    print(bwe)
-                    print(bwe.details['writeErrors'])
-                    return 0
-            else:
-                obj = [o.__dict__ for o in obj]
-                result = target.insert_many(obj, ordered=False)
-                return len(result.inserted_ids)
+            docs = [make_document(o, self.trigrams) for o in obj]
+            return self.write_documents(docs, upsert=upsert)
+        elif isinstance(obj, TextBatch):
+            return self.add_prepared(self.batch_preparer()(obj), upsert=upsert)
 
         return super().add(obj, upsert=upsert)
 
@@ -147,7 +497,7 @@ class MongoDB(BaseAPI):
 
     @property
     def texts(self) -> Sequence[Text]:
-        return [Text(**as_dict) for as_dict in self.texts_collection.find()]
+        return [Text(**as_dict) for as_dict in self.texts_collection.find(projection=['_id', 'content'])]
 
 # region Bulk Writes
 
@@ -155,17 +505,79 @@ class MongoDB(BaseAPI):
         self.texts_collection.drop()
         self.create_indexes()
 
-    def add_stream(self, stream, upsert=False) -> int:
+    @contextlib.contextmanager
+    def bulk_load(self):
+        """
+            Drops every index, but the one on `_id`, and builds them
+            once in the end, instead of updating them per document.
+            https://docs.mongodb.com/manual/core/index-creation/
+        """
+        self.texts_collection.drop_indexes()
+        try:
+            yield self
+        finally:
+            self.create_indexes()
+
+    def add_stream(self, stream, upsert=False, writers: Optional[int] = None, processes: Optional[int] = None) -> int:
         # Current version of MongoDB driver is incapable of chunking the iterable input,
         # so it loads everything into RAM forcing the OS to allocate GBs of swap pages.
         # https://api.mongodb.com/python/current/api/pymongo/collection.html#pymongo.collection.Collection.insert_many
-        return super().add_stream(stream, upsert=upsert)
+        writers = writers or self.writers
+        return super().add_stream(stream, upsert=upsert, writers=writers, processes=processes)
+
+    def batch_preparer(self):
+        return encode_texts_with_trigrams if self.trigrams else encode_texts
+
+    def add_prepared(self, batch, upsert=False) -> int:
+        """
+            Accepts either texts or their BSON produced by `encode_texts`.
+            https://api.mongodb.com/python/current/api/bson/raw_bson.html
+        """
+        if not is_sequence_of(batch, bytes):
+            return self.add(batch, upsert=upsert)
+        return self.write_documents([RawBSONDocument(b) for b in batch], upsert=upsert)
+
+    def write_documents(self, docs: list, upsert=False) -> int:
+        """
+            Sends one unordered batch with the options of the `write_profile`.
+            A `BulkWriteError` doesn't discard the whole batch, only the
+            failed documents, so the rest are still counted.
+            https://docs.mongodb.com/manual/reference/method/db.collection.bulkWrite/#error-handling
+        """
+        if len(docs) == 0:
+            return 0
+        target = self.writes_collection
+        try:
+            if upsert:
+                ops = [ReplaceOne(filter={'_id': d['_id']}, replacement=d, upsert=True)
+                       for d in docs]
+                result = target.bulk_write(
+                    requests=ops,
+                    ordered=False,
+                    bypass_document_validation=self.bypass_document_validation,
+                )
+                if not result.acknowledged:
+                    return len(docs)
+                return result.upserted_count + result.matched_count
+            result = target.insert_many(
+                docs,
+                ordered=False,
+                bypass_document_validation=self.bypass_document_validation,
+            )
+            if not result.acknowledged:
+                return len(docs)
+            return len(result.inserted_ids)
+        except pymongo.errors.BulkWriteError as bwe:
+            details = bwe.details
+            return details.get('nInserted', 0) + details.get('nUpserted', 0) + details.get('nMatched', 0)
 
 # region Helpers
 
     def create_indexes(self):
         for field in self.indexed_fields:
             self.create_index(field)
+        if self.trigrams:
+            self.texts_collection.create_index([('trigrams', pymongo.ASCENDING)])
         # As MongoDB can't search in a specific index,
         # we can create a generic index for all fields.
         # self.create_index_for_all_strings()
@@ -183,6 +595,57 @@ class MongoDB(BaseAPI):
             background=background,
         )
 
+    def get_contents(self, ids: Set[int]) -> Dict[int, str]:
+        contents = dict()
+        for part in chunks(ids, self.batch_size):
+            for d in self.texts_collection.find(filter={'_id': {'$in': part}}, projection=['_id', 'content']):
+                contents[d['_id']] = d['content']
+        return contents
+
+    def search_filter(self, query: str, is_regex: bool, case_sensitive: bool = True) -> Optional[dict]:
+        """
+            Returns the filter for `find_*` and `iter_*` methods
+            or `None`, if no document can match the `query`.
+        """
+        if not self.trigrams:
+            if is_regex:
+                return regex_filter(query, case_sensitive=case_sensitive)
+            return substring_filter(query, case_sensitive=case_sensitive)
+
+        pattern = query if is_regex else re.escape(query)
+        candidates = trigrams_filter(regex_to_trigram_query(pattern))
+        if candidates is None:
+            return None
+        exact = regex_filter(pattern, case_sensitive=case_sensitive)
+        return {'$and': [candidates, exact]} if candidates else exact
+
+    def explain(self, query: str, case_sensitive: bool = True) -> QueryPlan:
+        plan = super().explain(query, case_sensitive=case_sensitive)
+        if self.trigrams:
+            plan.terms = [format_trigram_query(regex_to_trigram_query(query))]
+            plan.notes.append('candidates are looked up in the `trigrams` index')
+        return plan
+
+    def find_concurrently(self, find, queries: Sequence[str], **kwargs) -> List[Sequence[TextMatch]]:
+        if len(queries) <= 1:
+            return [find(q, **kwargs) for q in queries]
+        readers = min(len(queries), type(self).__max_readers__)
+        with concurrent.futures.ThreadPoolExecutor(max_workers=readers) as executor:
+            return list(executor.map(lambda q: find(q, **kwargs), queries))
+
+    def backfill_trigrams(self) -> int:
+        """ Hashes the trigrams of documents, imported before the mode was enabled. """
+        cnt = 0
+        missing = self.texts_collection.find(
+            filter={'trigrams': {'$exists': False}}, projection=['_id', 'content'])
+        for part in chunks(missing.batch_size(self.batch_size), self.batch_size):
+            ops = [UpdateOne(
+                filter={'_id': d['_id']},
+                update={'$set': {'trigrams': trigram_hashes(d['content'])}},
+            ) for d in part]
+            cnt += self.texts_collection.bulk_write(requests=ops, ordered=False).modified_count
+        return cnt
+
     def parse_match(self, dict_) -> TextMatch:
         return TextMatch(_id=dict_['_id'], content=dict_.get('content', ''), rating=1)
 
@@ -0,0 +1,223 @@
+from typing import List, Optional, Dict, Generator, Set, Tuple, Sequence, AsyncGenerator
+
+from bson.raw_bson import RawBSONDocument
+import pymongo
+from pymongo import ReplaceOne
+
+from PyStorageTexts.BaseAsyncAPI import BaseAsyncAPI
+from PyStorageTexts.Registry import shared_client, release_client, reconnect_after_fork, ForkSafeClients
+from PyStorageTexts.MongoDB import MongoDB, encode_texts, encode_batch, substring_filter, regex_filter
+from PyStorageHelpers import *
+
+
+class MongoDBAsync(BaseAsyncAPI, ForkSafeClients):
+    """
+        Same collection layout and queries as `MongoDB`, but through Motor,
+        the `asyncio` driver, so many requests can be awaited at once
+        from a single thread without blocking the event loop.
+        https://motor.readthedocs.io/en/stable/tutorial-asyncio.html
+
+        Like in `MongoDB`, instances pointing to one server share a client
+        with up to `pool_size` connections, which is recreated after `fork`.
+    """
+    __client_attributes__ = ('db', 'texts_collection')
+    __max_batch_size__ = MongoDB.__max_batch_size__
+    __max_in_flight__ = 4
+    __is_concurrent__ = True
+
+# region Metadata
+
+    def __init__(
+        self,
+        url='mongodb://localhost:27017/texts',
+        batch_size=1000,
+        pool_size: Optional[int] = None,
+        **kwargs,
+    ):
+        BaseAsyncAPI.__init__(self, **kwargs)
+        # Number of documents fetched per round trip by streaming cursors.
+        self.batch_size = batch_size
+        self.url = url
+        self.pool_size = pool_size
+        self.reconnect()
+        reconnect_after_fork(self)
+        # Constructors can't await, so indexes are created before the first request.
+        self.indexes_ready = False
+
+    def reconnect(self):
+        _, db_name = extract_database_name(self.url)
+        self.db = shared_client('motor', self.url, pool_size=self.pool_size)
+        self.texts_collection = self.db[db_name]['texts']
+
+    async def count_texts(self) -> int:
+        return await self.texts_collection.count_documents(filter={})
+
+    async def close(self):
+        # The client is shared, so only its last user closes it.
+        client = release_client('motor', self.url, pool_size=self.pool_size)
+        if client is not None:
+            client.close()
+
+# region Random Reads
+
+    async def get(self, identifier: int) -> Optional[Text]:
+        result = await self.texts_collection.find_one(filter={
+            '_id': identifier
+        }, projection=['_id', 'content'])
+        if result:
+            return Text(**result)
+        return None
+
+    async def find_substring(
+        self,
+        query: str,
+        case_sensitive: bool = True,
+        max_matches: Optional[int] = None,
+        include_text=True,
+    ) -> Sequence[TextMatch]:
+        return [m async for m in self.iter_substring(
+            query,
+            case_sensitive=case_sensitive,
+            max_matches=max_matches,
+            include_text=include_text,
+        )]
+
+    async def find_regex(
+        self,
+        query: str,
+        case_sensitive: bool = True,
+        max_matches: Optional[int] = None,
+        include_text=True,
+    ) -> Sequence[TextMatch]:
+        return [m async for m in self.iter_regex(
+            query,
+            case_sensitive=case_sensitive,
+            max_matches=max_matches,
+            include_text=include_text,
+        )]
+
+# region Streaming Reads
+
+    async def iter_substring(
+        self,
+        query: str,
+        case_sensitive: bool = True,
+        max_matches: Optional[int] = None,
+        include_text=True,
+    ) -> AsyncGenerator[TextMatch, None]:
+        await self.ensure_indexes()
+        async for m in self.iter_cursor(
+            filter=substring_filter(query, case_sensitive=case_sensitive),
+            max_matches=max_matches,
+            include_text=include_text,
+        ):
+            yield m
+
+    async def iter_regex(
+        self,
+        query: str,
+        case_sensitive: bool = True,
+        max_matches: Optional[int] = None,
+        include_text=True,
+    ) -> AsyncGenerator[TextMatch, None]:
+        await self.ensure_indexes()
+        async for m in self.iter_cursor(
+            filter=regex_filter(query, case_sensitive=case_sensitive),
+            max_matches=max_matches,
+            include_text=include_text,
+        ):
+            yield m
+
+    async def iter_cursor(
+        self,
+        filter: dict,
+        max_matches: Optional[int] = None,
+        include_text=True,
+    ) -> AsyncGenerator[TextMatch, None]:
+        """
+            https://motor.readthedocs.io/en/stable/api-asyncio/asyncio_motor_cursor.html
+        """
+        proj = ['_id', 'content'] if include_text else ['_id']
+        dicts = self.texts_collection.find(filter=filter, projection=proj)
+        dicts = dicts.batch_size(self.batch_size)
+        if max_matches:
+            dicts = dicts.limit(max_matches)
+        try:
+            async for d in dicts:
+                yield self.parse_match(d)
+        finally:
+            await dicts.close()
+
+# region Random Writes
+
+    async def add(self, obj, upsert=True) -> int:
+        await self.ensure_indexes()
+        if isinstance(obj, Text):
+            return await self.add([obj], upsert=upsert)
+        elif is_sequence_of(obj, Text):
+            return await self.add_prepared(encode_texts(obj), upsert=upsert)
+        elif isinstance(obj, TextBatch):
+            return await self.add_prepared(encode_batch(obj), upsert=upsert)
+
+        return await super().add(obj, upsert=upsert)
+
+    async def remove(self, obj) -> int:
+        target = self.texts_collection
+        if isinstance(obj, int):
+            result = await target.delete_one(filter={'_id': obj})
+            return result.deleted_count >= 1
+        elif is_sequence_of(obj, int):
+            result = await target.delete_many(filter={'_id': {'$in': obj}})
+            return result.deleted_count
+
+        return await super().remove(obj)
+
+# region Bulk Reads
+
+    @property
+    async def texts(self) -> AsyncGenerator[Text, None]:
+        async for as_dict in self.texts_collection.find(projection=['_id', 'content']):
+            yield Text(**as_dict)
+
+# region Bulk Writes
+
+    async def clear(self):
+        await self.texts_collection.drop()
+        self.indexes_ready = False
+        await self.ensure_indexes()
+
+    async def add_prepared(self, batch, upsert=False) -> int:
+        """
+            Writes BSON produced by `encode_texts`, just like `MongoDB.add_prepared`.
+            Duplicates don't fail the whole batch, only reduce the returned count.
+        """
+        if not is_sequence_of(batch, bytes):
+            return await self.add(batch, upsert=upsert)
+        if len(batch) == 0:
+            return 0
+        docs = [RawBSONDocument(b) for b in batch]
+        target = self.texts_collection
+        try:
+            if upsert:
+                ops = [ReplaceOne(filter={'_id': d['_id']}, replacement=d, upsert=True)
+                       for d in docs]
+                result = await target.bulk_write(requests=ops, ordered=False)
+                return result.upserted_count + result.matched_count
+            result = await target.insert_many(docs, ordered=False)
+            return len(result.inserted_ids)
+        except pymongo.errors.BulkWriteError as bwe:
+            details = bwe.details
+            return details.get('nInserted', 0) + details.get('nUpserted', 0) + details.get('nMatched', 0)
+
+# region Helpers
+
+    async def ensure_indexes(self):
+        # Creating an existing index is a no-op, so concurrent
+        # first requests may safely race here.
+        if self.indexes_ready:
+            return
+        for field in self.indexed_fields:
+            await self.texts_collection.create_index([(field, pymongo.TEXT)])
+        self.indexes_ready = True
+
+    parse_match = MongoDB.parse_match
@@ -0,0 +1,203 @@
+import os
+import threading
+import weakref
+import importlib
+from urllib.parse import urlparse, urlunparse
+from typing import List, Optional, Dict, Generator, Set, Tuple, Sequence
+
+
+def make_mongo_client(address: str, pool_size: Optional[int] = None):
+    """
+        The client connects lazily, on the first operation, so it
+        is safe to create it before forking the worker processes.
+        https://pymongo.readthedocs.io/en/stable/faq.html#is-pymongo-fork-safe
+    """
+    from pymongo import MongoClient
+    options = {'connect': False}
+    if pool_size:
+        options['maxPoolSize'] = pool_size
+    return MongoClient(address, **options)
+
+
+def make_elastic_client(address: str, pool_size: Optional[int] = None):
+    """
+        https://elasticsearch-py.readthedocs.io/en/7.x/connection.html
+    """
+    from elasticsearch import Elasticsearch
+    options = dict()
+    if pool_size:
+        options['maxsize'] = pool_size
+    return Elasticsearch([address], **options)
+
+
+def make_motor_client(address: str, pool_size: Optional[int] = None):
+    """
+        Motor binds to the event loop on the first operation, so clients
+        must only be shared by the backends used from one loop.
+        https://motor.readthedocs.io/en/stable/api-asyncio/asyncio_motor_client.html
+    """
+    from motor.motor_asyncio import AsyncIOMotorClient
+    options = dict()
+    if pool_size:
+        options['maxPoolSize'] = pool_size
+    return AsyncIOMotorClient(address, **options)
+
+
+def make_async_elastic_client(address: str, pool_size: Optional[int] = None):
+    """
+        https://elasticsearch-py.readthedocs.io/en/7.x/async.html
+    """
+    from elasticsearch import AsyncElasticsearch
+    options = dict()
+    if pool_size:
+        options['maxsize'] = pool_size
+    return AsyncElasticsearch([address], **options)
+
+
+# Builders of clients for `shared_client`, by their kind.
+CLIENT_FACTORIES = {
+    'mongodb': make_mongo_client,
+    'elasticsearch': make_elastic_client,
+    'motor': make_motor_client,
+    'elasticsearch_async': make_async_elastic_client,
+}
+
+# Backends for `connect`, by the scheme of the URL: module and class names.
+# Relative modules are resolved within this package, so `connect` returns
+# instances of the same classes, as the lazy attributes of the package.
+BACKENDS = {
+    'mongodb': ('.MongoDB', 'MongoDB'),
+    'mongodb+srv': ('.MongoDB', 'MongoDB'),
+    'http': ('.ElasticSearch', 'ElasticSearch'),
+    'https': ('.ElasticSearch', 'ElasticSearch'),
+    'sqlite': ('.SQLite', 'SQLite'),
+    'memory': ('.SuffixArray', 'SuffixArray'),
+}
+
+clients: Dict[Tuple[str, str, Optional[int]], object] = dict()
+# Number of `shared_client` calls per client, not yet released.
+clients_users: Dict[Tuple[str, str, Optional[int]], int] = dict()
+clients_lock = threading.Lock()
+clients_pid = os.getpid()
+# Backends, that must `disconnect` in the child process after `fork`.
+reconnecting_backends = weakref.WeakSet()
+
+
+def client_address(url: str) -> str:
+    """
+        Drops the path of the URL, which names the database or the index,
+        so all of them share the client of one server. Credentials should
+        then name their database in the query, like `?authSource=admin`.
+    """
+    parts = urlparse(url)
+    return urlunparse((parts.scheme, parts.netloc, '', '', parts.query, ''))
+
+
+def shared_client(kind: str, url: str, pool_size: Optional[int] = None):
+    """
+        Returns the client of the `kind` for the server of the `url`, creating
+        it on the first call. Clients are thread-safe and keep their own pool
+        of up to `pool_size` connections, shared by all the backends of the
+        process. Clients inherited from the parent process are never reused.
+    """
+    if os.getpid() != clients_pid:
+        forget_clients()
+    address = client_address(url)
+    key = (kind, address, pool_size)
+    with clients_lock:
+        client = clients.get(key, None)
+        if client is None:
+            client = CLIENT_FACTORIES[kind](address, pool_size=pool_size)
+            clients[key] = client
+        clients_users[key] = clients_users.get(key, 0) + 1
+        return client
+
+
+def release_client(kind: str, url: str, pool_size: Optional[int] = None):
+    """
+        Undoes one `shared_client` call. Returns the client, once its last
+        user has released it, so the caller can close it, as only the caller
+        knows, whether closing must be awaited. Otherwise returns `None`.
+    """
+    key = (kind, client_address(url), pool_size)
+    with clients_lock:
+        cnt_users = clients_users.get(key, 0) - 1
+        if cnt_users > 0:
+            clients_users[key] = cnt_users
+            return None
+        clients_users.pop(key, None)
+        return clients.pop(key, None)
+
+
+def reconnect_after_fork(backend):
+    """
+        The `backend.disconnect()` will be called in the children processes.
+        It must only drop the inherited clients, without any I/O, as most
+        children, like the workers of process pools, never use them.
+        The clients are recreated on the first use, like in `ForkSafeClients`.
+    """
+    reconnecting_backends.add(backend)
+
+
+class ForkSafeClients(object):
+    """
+        Mixin for backends, that keep their clients in the attributes listed
+        in `__client_attributes__`, all of which are set by `reconnect`.
+        `disconnect` drops them and the first access to any of them calls
+        `reconnect` again, which gets a new client from `shared_client`.
+    """
+    __client_attributes__ = ()
+
+    def disconnect(self):
+        for name in type(self).__client_attributes__:
+            self.__dict__.pop(name, None)
+
+    def __getattr__(self, name: str):
+        # Only called for missing attributes, so connected backends pay nothing.
+        if name in type(self).__client_attributes__:
+            self.reconnect()
+            return self.__dict__[name]
+        raise AttributeError(f'{type(self).__name__!r} object has no attribute {name!r}')
+
+
+def forget_clients():
+    """
+        Sockets of the parent process can't be shared with the child,
+        so its clients are dropped without closing, which would send
+        the goodbye messages on behalf of the parent.
+    """
+    global clients_pid, clients_lock
+    clients.clear()
+    clients_users.clear()
+    clients_lock = threading.Lock()
+    clients_pid = os.getpid()
+
+
+def after_fork_in_child():
+    # Inherited clients are forgotten by the next `shared_client` call.
+    for backend in list(reconnecting_backends):
+        backend.disconnect()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=after_fork_in_child)
+
+
+def register_backend(scheme: str, module_name: str, class_name: str):
+    """ The `module_name` may be absolute or relative to this package. """
+    BACKENDS[scheme] = (module_name, class_name)
+
+
+def connect(url: str, **kwargs):
+    """
+        Instantiates the backend registered for the scheme of the `url`,
+        passing it the `kwargs`. Backends of one server share a client:
+
+            db = regexum.connect('mongodb://localhost:27017/texts', trigrams=True)
+    """
+    scheme = urlparse(url).scheme
+    if scheme not in BACKENDS:
+        raise ValueError(f'No backend registered for: {scheme}://')
+    module_name, class_name = BACKENDS[scheme]
+    class_ = getattr(importlib.import_module(module_name, __package__), class_name)
+    return class_(url=url, **kwargs)
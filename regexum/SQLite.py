@@ -0,0 +1,361 @@
+import re
+import sys
+import functools
+import threading
+from typing import List, Optional, Dict, Generator, Set, Tuple, Sequence
+
+from sqlalchemy import text
+from sqlalchemy.pool import StaticPool
+
+from PyStorageTexts.BaseSQL import BaseSQL, TextSQL
+from PyStorageHelpers import *
+
+
+@functools.lru_cache(maxsize=256)
+def compile_pattern(pattern: str, flags: int) -> re.Pattern:
+    return re.compile(pattern, flags)
+
+
+last_search = threading.local()
+
+
+def search_once(pattern: str, flags: int, value: str) -> Optional[re.Match]:
+    """
+        The filter and the snippet columns of a row look up the same match,
+        so the last one is reused. Comparing contents is much cheaper, than
+        running the RegEx again.
+    """
+    key = (pattern, flags, value)
+    if getattr(last_search, 'key', None) != key:
+        last_search.key = key
+        last_search.found = compile_pattern(pattern, flags).search(value)
+    return last_search.found
+
+
+def regexp(pattern: str, value: Optional[str]) -> bool:
+    """ Implements `value REGEXP pattern`, which SQLite only declares. """
+    return value is not None and search_once(pattern, 0, value) is not None
+
+
+def iregexp(pattern: str, value: Optional[str]) -> bool:
+    return value is not None and search_once(pattern, re.IGNORECASE, value) is not None
+
+
+def regexp_instr(pattern: str, value: Optional[str], ignore_case: int, return_end: int) -> int:
+    """
+        Like `instr`, returns the 1-based position of the first match or 0.
+        With `return_end` - the position following the match, like in MySQL.
+        https://dev.mysql.com/doc/refman/8.0/en/regexp.html#function_regexp-instr
+    """
+    if value is None:
+        return 0
+    found = search_once(pattern, re.IGNORECASE if ignore_case else 0, value)
+    if found is None:
+        return 0
+    return (found.end() if return_end else found.start()) + 1
+
+
+def fts_phrase(s: str) -> str:
+    """ https://www.sqlite.org/fts5.html#fts5_strings """
+    return '"' + s.replace('"', '""') + '"'
+
+
+def trigram_query_to_fts(query: tuple) -> str:
+    """ Converts the output of `regex_to_trigram_query` into an FTS5 expression. """
+    kind = query[0]
+    if kind == 'trigram':
+        return fts_phrase(query[1])
+    joiner = ' AND ' if kind == 'and' else ' OR '
+    return '(' + joiner.join(map(trigram_query_to_fts, query[1])) + ')'
+
+
+class SQLite(BaseSQL):
+    """
+        Zero-service SQL backend. Besides the `table_texts` it keeps an FTS5
+        virtual table with the `trigram` tokenizer (SQLite 3.34+), which
+        indexes every 3-character sequence, so it can find arbitrary
+        substrings, not only whole words. The FTS table only references
+        the contents of `table_texts` and is kept in sync by triggers.
+
+        Substrings of 3+ characters are found with a phrase MATCH.
+        RegEx queries are translated into AND/OR trigram queries to prefilter
+        candidates, which are then checked with a `REGEXP` function,
+        implemented with Python `re`. Literal patterns are answered by
+        the phrase search and patterns anchored with a literal prefix,
+        like `^Abstract`, scan a range of the `content_index`.
+
+        https://www.sqlite.org/fts5.html#the_trigram_tokenizer
+        https://www.sqlite.org/fts5.html#external_content_tables
+        https://www.sqlite.org/lang_expr.html#regexp
+    """
+    __max_batch_size__ = 10000
+    __is_concurrent__ = False
+    __in_memory__ = False
+
+    def __init__(self, url='sqlite:///texts.db', **kwargs):
+        BaseSQL.__init__(self, url=url, **kwargs)
+
+    def engine_options(self, url: str) -> dict:
+        """
+            Every connection to `:memory:` opens a new empty database,
+            so all the threads of `add_stream` must share one connection.
+            https://docs.sqlalchemy.org/en/14/dialects/sqlite.html#using-a-memory-database-in-multiple-threads
+        """
+        if ':memory:' not in url:
+            return {}
+        return {
+            'poolclass': StaticPool,
+            'connect_args': {'check_same_thread': False},
+        }
+
+    def disconnect(self):
+        # The `:memory:` database lives in its only connection,
+        # which the child process gets a private copy of.
+        if self.engine.url.database != ':memory:':
+            super().disconnect()
+
+    def on_connect(self, dbapi_connection, connection_record):
+        dbapi_connection.create_function(
+            'regexp', 2, regexp, deterministic=True)
+        dbapi_connection.create_function(
+            'iregexp', 2, iregexp, deterministic=True)
+        dbapi_connection.create_function(
+            'regexp_instr', 4, regexp_instr, deterministic=True)
+
+    def drop_indexes(self):
+        """
+            Without triggers the FTS table isn't updated during imports,
+            so `create_indexes` rebuilds it from scratch afterwards.
+        """
+        super().drop_indexes()
+        with self.engine.begin() as connection:
+            for trigger in ('table_texts_ai', 'table_texts_ad', 'table_texts_au'):
+                connection.execute(text(f'DROP TRIGGER IF EXISTS {trigger}'))
+
+    def create_indexes(self):
+        super().create_indexes()
+        with self.engine.begin() as connection:
+            connection.execute(text(
+                "INSERT INTO table_texts_fts(table_texts_fts) VALUES ('rebuild')"))
+
+    def create_search_index(self):
+        statements = [
+            """
+            CREATE VIRTUAL TABLE IF NOT EXISTS table_texts_fts USING fts5(
+                content, content='table_texts', content_rowid='_id', tokenize='trigram'
+            )
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS table_texts_ai AFTER INSERT ON table_texts BEGIN
+                INSERT INTO table_texts_fts(rowid, content) VALUES (new._id, new.content);
+            END
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS table_texts_ad AFTER DELETE ON table_texts BEGIN
+                INSERT INTO table_texts_fts(table_texts_fts, rowid, content) VALUES ('delete', old._id, old.content);
+            END
+            """,
+            """
+            CREATE TRIGGER IF NOT EXISTS table_texts_au AFTER UPDATE ON table_texts BEGIN
+                INSERT INTO table_texts_fts(table_texts_fts, rowid, content) VALUES ('delete', old._id, old.content);
+                INSERT INTO table_texts_fts(rowid, content) VALUES (new._id, new.content);
+            END
+            """,
+        ]
+        with self.engine.begin() as connection:
+            for statement in statements:
+                connection.execute(text(statement))
+
+    # --------------------------------
+    # region Search Queries.
+    # --------------------------------
+
+    def find_substring(
+        self,
+        query: str,
+        case_sensitive: bool = True,
+        max_matches: Optional[int] = None,
+        include_text=True,
+        snippet_length: Optional[int] = None,
+    ) -> Sequence[TextMatch]:
+        if len(query) < 3:
+            # Shorter strings have no trigrams to look up.
+            return self.search_regex(
+                re.escape(query),
+                case_sensitive=case_sensitive,
+                max_matches=max_matches,
+                include_text=include_text,
+                snippet_length=snippet_length,
+            )
+
+        # The trigram index is case-insensitive,
+        # so the exact case is checked afterwards.
+        check = 'AND instr(t.content, :query) > 0' if case_sensitive else ''
+        if not snippet_length:
+            columns = self.content_column(include_text)
+        elif case_sensitive:
+            columns = self.snippet_columns(
+                'instr(t.content, :query)', 'instr(t.content, :query) + length(:query)')
+        else:
+            columns = self.snippet_columns(
+                'regexp_instr(:pattern, t.content, 1, 0)', 'regexp_instr(:pattern, t.content, 1, 1)')
+        return self.search(f"""
+            SELECT t._id, -f.rank, {columns}
+            FROM table_texts_fts AS f JOIN table_texts AS t ON t._id = f.rowid
+            WHERE table_texts_fts MATCH :phrase {check}
+            ORDER BY f.rank LIMIT :limit
+        """, phrase=fts_phrase(query), query=query, pattern=re.escape(query),
+            limit=max_matches or -1, snippet_length=snippet_length)
+
+    def find_regex(
+        self,
+        query: str,
+        case_sensitive: bool = True,
+        max_matches: Optional[int] = None,
+        include_text=True,
+        snippet_length: Optional[int] = None,
+    ) -> Sequence[TextMatch]:
+        plan = self.explain(query, case_sensitive=case_sensitive)
+        if plan.operation == 'none':
+            return []
+        elif plan.operation == 'substring':
+            return self.find_substring(
+                plan.query,
+                case_sensitive=case_sensitive,
+                max_matches=max_matches,
+                include_text=include_text,
+                snippet_length=snippet_length,
+            )
+        elif plan.operation == 'prefix':
+            return self.search_prefix(
+                plan,
+                max_matches=max_matches,
+                include_text=include_text,
+                snippet_length=snippet_length,
+            )
+        return self.search_regex(
+            query,
+            case_sensitive=case_sensitive,
+            max_matches=max_matches,
+            include_text=include_text,
+            snippet_length=snippet_length,
+        )
+
+    def search_prefix(
+        self,
+        plan: QueryPlan,
+        max_matches: Optional[int] = None,
+        include_text=True,
+        snippet_length: Optional[int] = None,
+    ) -> List[TextMatch]:
+        """
+            Contents starting with the literal prefix of an anchored pattern
+            form a contiguous range of the `content_index`.
+        """
+        low = plan.query
+        conditions = ['t.content >= :low']
+        high = None
+        if ord(low[-1]) < sys.maxunicode:
+            high = low[:-1] + chr(ord(low[-1]) + 1)
+            conditions.append('t.content < :high')
+        if plan.post_filter:
+            conditions.append('regexp(:pattern, t.content)')
+        if not snippet_length:
+            columns = self.content_column(include_text)
+        else:
+            columns = self.snippet_columns(
+                'regexp_instr(:pattern, t.content, 0, 0)', 'regexp_instr(:pattern, t.content, 0, 1)')
+        return self.search(f"""
+            SELECT t._id, 1, {columns}
+            FROM table_texts AS t
+            WHERE {' AND '.join(conditions)}
+            LIMIT :limit
+        """, low=low, high=high, pattern=plan.pattern,
+            limit=max_matches or -1, snippet_length=snippet_length)
+
+    def search_regex(
+        self,
+        query: str,
+        case_sensitive: bool = True,
+        max_matches: Optional[int] = None,
+        include_text=True,
+        snippet_length: Optional[int] = None,
+    ) -> List[TextMatch]:
+        trigrams_query = regex_to_trigram_query(query)
+        if trigrams_query == QUERY_NONE:
+            return []
+        function = 'regexp' if case_sensitive else 'iregexp'
+        if not snippet_length:
+            columns = self.content_column(include_text)
+        else:
+            columns = self.snippet_columns(
+                'regexp_instr(:pattern, t.content, :ignore_case, 0)',
+                'regexp_instr(:pattern, t.content, :ignore_case, 1)')
+        if trigrams_query == QUERY_ALL:
+            return self.search(f"""
+                SELECT t._id, 1, {columns}
+                FROM table_texts AS t
+                WHERE {function}(:pattern, t.content)
+                LIMIT :limit
+            """, pattern=query, ignore_case=int(not case_sensitive),
+                limit=max_matches or -1, snippet_length=snippet_length)
+
+        return self.search(f"""
+            SELECT t._id, 1, {columns}
+            FROM table_texts_fts AS f JOIN table_texts AS t ON t._id = f.rowid
+            WHERE table_texts_fts MATCH :expression AND {function}(:pattern, t.content)
+            LIMIT :limit
+        """, expression=trigram_query_to_fts(trigrams_query), pattern=query, ignore_case=int(not case_sensitive),
+            limit=max_matches or -1, snippet_length=snippet_length)
+
+    def search(self, statement: str, **params) -> List[TextMatch]:
+        """
+            Rows start with the ID and the rating, followed either by the
+            content or by the snippet and the 1-based bounds of the match.
+        """
+        results = list()
+        with self.engine.connect() as connection:
+            for row in connection.execute(text(statement), params):
+                if len(row) == 3:
+                    results.append(TextMatch(
+                        _id=row[0], content=row[2], rating=row[1]))
+                    continue
+                m = TextMatch(_id=row[0], rating=row[1], snippets=[row[2]])
+                if row[3] > 0:
+                    m.spans = [(row[3] - 1, row[4] - 1)]
+                results.append(m)
+        return results
+
+    def content_column(self, include_text: bool) -> str:
+        return 't.content' if include_text else "''"
+
+    def snippet_columns(self, start: str, end: str) -> str:
+        """
+            Cuts `:snippet_length` characters around the match, which starts at
+            the 1-based `start`, so only the window is copied out of SQLite.
+            https://www.sqlite.org/lang_corefunc.html#substr
+            https://www.sqlite.org/lang_corefunc.html#instr
+        """
+        return f"substr(t.content, max(1, {start} - :snippet_length / 2), :snippet_length), {start}, {end}"
+
+    # endregion
+
+
+# region Testing
+
+if __name__ == '__main__':
+    db = SQLite(url='sqlite:///:memory:')
+    db.clear()
+    assert db.count_texts() == 0
+    assert db.add([
+        Text(1, 'the big brown fox'),
+        Text(2, 'as.the.day;passes'),
+        Text(3, 'along the:way'),
+    ])
+    assert db.count_texts() == 3
+    assert {m._id for m in db.find_substring('the')} == {1, 2, 3}
+    assert {m._id for m in db.find_substring('BIG', case_sensitive=False)} == {1}
+    assert not db.find_substring('BIG')
+    assert {m._id for m in db.find_regex('b[a-z]+n')} == {1}
+    assert db.remove(1)
+    assert not db.find_substring('big')
@@ -0,0 +1,127 @@
+from typing import List, Optional, Dict, Generator, Set, Tuple, Sequence
+
+from PyStorageTexts.BaseAPI import BaseAPI
+from PyStorageHelpers import *
+
+
+class Sectioned(BaseAPI):
+    """
+        Wraps backends, filled from CSV files read with `sections=True`,
+        where every row is stored as a separate `TextSection`. Searches
+        return one `TextMatch` per parent document instead, listing the
+        matched sections in `TextMatch.sections`, see `collapse_sections`.
+
+        Sections are streamed from the backend, until `max_matches`
+        parents are found. With `snippet_length` the backend cuts the
+        snippets and `max_matches` limits the number of sections instead.
+        Random reads and writes still address individual sections.
+    """
+
+# region Metadata
+
+    def __init__(self, backend: BaseAPI, **kwargs):
+        BaseAPI.__init__(self, **kwargs)
+        self.backend = backend
+
+    def count_texts(self) -> int:
+        return self.backend.count_texts()
+
+    def close(self):
+        self.backend.close()
+
+# region Random Writes
+
+    def add(self, one_or_many_texts, upsert=True) -> int:
+        return self.backend.add(one_or_many_texts, upsert=upsert)
+
+    def remove(self, one_or_many_texts) -> int:
+        return self.backend.remove(one_or_many_texts)
+
+# region Random Reads
+
+    def get(self, identifier: int) -> Optional[Text]:
+        return self.backend.get(identifier)
+
+    def get_many(self, ids: Sequence[int], include_text=True, max_length: Optional[int] = None) -> List[Optional[Text]]:
+        return self.backend.get_many(ids, include_text=include_text, max_length=max_length)
+
+    def find_substring(
+        self,
+        query: str,
+        case_sensitive: bool = True,
+        max_matches: Optional[int] = None,
+        include_text=True,
+        snippet_length: Optional[int] = None,
+    ) -> Sequence[TextMatch]:
+        if snippet_length:
+            return collapse_sections(self.backend.find_substring(
+                query,
+                case_sensitive=case_sensitive,
+                max_matches=max_matches,
+                snippet_length=snippet_length,
+            ))
+        return self.collapse(self.backend.iter_substring(
+            query,
+            case_sensitive=case_sensitive,
+            include_text=include_text,
+        ), max_matches)
+
+    def find_regex(
+        self,
+        query: str,
+        case_sensitive: bool = True,
+        max_matches: Optional[int] = None,
+        include_text=True,
+        snippet_length: Optional[int] = None,
+    ) -> Sequence[TextMatch]:
+        if snippet_length:
+            return collapse_sections(self.backend.find_regex(
+                query,
+                case_sensitive=case_sensitive,
+                max_matches=max_matches,
+                snippet_length=snippet_length,
+            ))
+        return self.collapse(self.backend.iter_regex(
+            query,
+            case_sensitive=case_sensitive,
+            include_text=include_text,
+        ), max_matches)
+
+    def explain(self, query: str, case_sensitive: bool = True) -> QueryPlan:
+        return self.backend.explain(query, case_sensitive=case_sensitive)
+
+# region Bulk Reads
+
+    @property
+    def texts(self) -> Sequence[Text]:
+        return self.backend.texts
+
+# region Bulk Writes
+
+    def bulk_load(self):
+        return self.backend.bulk_load()
+
+    def add_stream(self, stream, upsert=False, **kwargs) -> int:
+        return self.backend.add_stream(stream, upsert=upsert, **kwargs)
+
+    def clear(self):
+        self.backend.clear()
+
+# region Helpers
+
+    def collapse(self, sections: Generator[TextMatch, None, None], max_matches: Optional[int]) -> List[TextMatch]:
+        """ Stops reading the sections at the first one of a parent past `max_matches`. """
+        parent_ids = set()
+        taken = list()
+        try:
+            for m in sections:
+                parent_id = m._id // MAX_SECTIONS_PER_TEXT
+                if parent_id not in parent_ids:
+                    if max_matches and len(parent_ids) >= max_matches:
+                        break
+                    parent_ids.add(parent_id)
+                taken.append(m)
+        finally:
+            if hasattr(sections, 'close'):
+                sections.close()
+        return collapse_sections(taken)
@@ -0,0 +1,263 @@
+import heapq
+import struct
+import operator
+import zlib
+import contextlib
+import concurrent.futures
+from itertools import chain, islice
+from typing import List, Optional, Dict, Generator, Set, Tuple, Sequence
+
+from PyStorageTexts.BaseAPI import BaseAPI
+from PyStorageHelpers import *
+
+
+def shard_of(identifier: int, count_shards: int) -> int:
+    """
+        Stable across processes and Python versions, unlike `hash()`,
+        so the same corpus can be reopened by other clients.
+    """
+    try:
+        identifier = operator.index(identifier)
+    except TypeError:
+        raise TypeError(f'Document IDs must be integers, got {identifier!r}') from None
+    return zlib.crc32(struct.pack('<q', identifier)) % count_shards
+
+
+def merge_by_rating(results: Sequence[Sequence[TextMatch]], max_matches: Optional[int] = None) -> List[TextMatch]:
+    ranked = [sorted(r, key=lambda m: -m.rating) for r in results]
+    merged = heapq.merge(*ranked, key=lambda m: -m.rating)
+    return list(islice(merged, max_matches or None))
+
+
+class Sharded(BaseAPI):
+    """
+        Spreads one logical corpus across several backends, for example
+        multiple MongoDB servers. Documents are hash-partitioned by `_id`.
+        Searches are broadcasted to all the shards in parallel threads
+        and merged by `rating`, so every shard returns at most `max_matches`
+        and the merged results are cut at `max_matches` again.
+        Ratings of different shards are compared as is, so relevance scores,
+        that depend on shard-level statistics, like BM25, are approximate.
+    """
+    __max_batch_size__ = 10000
+
+# region Metadata
+
+    def __init__(self, shards: Sequence[BaseAPI], **kwargs):
+        BaseAPI.__init__(self, **kwargs)
+        assert len(shards) > 0, 'Need at least one shard'
+        self.shards = list(shards)
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=len(self.shards))
+
+    def count_texts(self) -> int:
+        return int(sum(self.broadcast(lambda s: s.count_texts())))
+
+    def close(self):
+        self.broadcast(lambda s: s.close())
+        self.executor.shutdown()
+
+# region Random Writes
+
+    def add(self, one_or_many_texts, upsert=True) -> int:
+        if isinstance(one_or_many_texts, Text):
+            return self.shard(one_or_many_texts._id).add(one_or_many_texts, upsert=upsert)
+        elif is_sequence_of(one_or_many_texts, Text) or isinstance(one_or_many_texts, TextBatch):
+            parts = self.partition(one_or_many_texts)
+            return int(sum(self.scatter(parts, lambda s, part: s.add(part, upsert=upsert))))
+
+        return super().add(one_or_many_texts, upsert=upsert)
+
+    def remove(self, one_or_many_texts) -> int:
+        if isinstance(one_or_many_texts, int):
+            return self.shard(one_or_many_texts).remove(one_or_many_texts)
+        elif is_sequence_of(one_or_many_texts, int):
+            parts = self.partition(one_or_many_texts)
+            return int(sum(self.scatter(parts, lambda s, part: s.remove(part))))
+
+        return super().remove(one_or_many_texts)
+
+# region Random Reads
+
+    def get(self, identifier: int) -> Optional[Text]:
+        return self.shard(identifier).get(identifier)
+
+    def get_many(self, ids: Sequence[int], include_text=True, max_length: Optional[int] = None) -> List[Optional[Text]]:
+        parts = self.partition(ids)
+        results = self.scatter(parts, lambda s, part: s.get_many(
+            part, include_text=include_text, max_length=max_length))
+        found = dict()
+        for part, texts in zip([p for p in parts if len(p)], results):
+            found.update(zip(part, texts))
+        return [found.get(_id, None) for _id in ids]
+
+    def find_substring(
+        self,
+        query: str,
+        case_sensitive: bool = True,
+        max_matches: Optional[int] = None,
+        include_text=True,
+        snippet_length: Optional[int] = None,
+    ) -> Sequence[TextMatch]:
+        return merge_by_rating(self.broadcast(lambda s: s.find_substring(
+            query,
+            case_sensitive=case_sensitive,
+            max_matches=max_matches,
+            include_text=include_text,
+            snippet_length=snippet_length,
+        )), max_matches=max_matches)
+
+    def find_regex(
+        self,
+        query: str,
+        case_sensitive: bool = True,
+        max_matches: Optional[int] = None,
+        include_text=True,
+        snippet_length: Optional[int] = None,
+    ) -> Sequence[TextMatch]:
+        return merge_by_rating(self.broadcast(lambda s: s.find_regex(
+            query,
+            case_sensitive=case_sensitive,
+            max_matches=max_matches,
+            include_text=include_text,
+            snippet_length=snippet_length,
+        )), max_matches=max_matches)
+
+    def explain(self, query: str, case_sensitive: bool = True) -> QueryPlan:
+        # All shards share the plan, if they are of the same kind.
+        return self.shards[0].explain(query, case_sensitive=case_sensitive)
+
+    def find_substring_many(
+        self,
+        queries: Sequence[str],
+        case_sensitive: bool = True,
+        max_matches: Optional[int] = None,
+        include_text=True,
+    ) -> List[Sequence[TextMatch]]:
+        per_shard = self.broadcast(lambda s: s.find_substring_many(
+            queries,
+            case_sensitive=case_sensitive,
+            max_matches=max_matches,
+            include_text=include_text,
+        ))
+        return [merge_by_rating(r, max_matches=max_matches) for r in zip(*per_shard)]
+
+    def find_regex_many(
+        self,
+        queries: Sequence[str],
+        case_sensitive: bool = True,
+        max_matches: Optional[int] = None,
+        include_text=True,
+    ) -> List[Sequence[TextMatch]]:
+        per_shard = self.broadcast(lambda s: s.find_regex_many(
+            queries,
+            case_sensitive=case_sensitive,
+            max_matches=max_matches,
+            include_text=include_text,
+        ))
+        return [merge_by_rating(r, max_matches=max_matches) for r in zip(*per_shard)]
+
+# region Streaming Reads
+
+    def iter_substring(
+        self,
+        query: str,
+        case_sensitive: bool = True,
+        max_matches: Optional[int] = None,
+        include_text=True,
+    ) -> Generator[TextMatch, None, None]:
+        yield from self.merge_streams([s.iter_substring(
+            query,
+            case_sensitive=case_sensitive,
+            max_matches=max_matches,
+            include_text=include_text,
+        ) for s in self.shards], max_matches=max_matches)
+
+    def iter_regex(
+        self,
+        query: str,
+        case_sensitive: bool = True,
+        max_matches: Optional[int] = None,
+        include_text=True,
+    ) -> Generator[TextMatch, None, None]:
+        yield from self.merge_streams([s.iter_regex(
+            query,
+            case_sensitive=case_sensitive,
+            max_matches=max_matches,
+            include_text=include_text,
+        ) for s in self.shards], max_matches=max_matches)
+
+    def merge_streams(self, streams: List[Generator], max_matches: Optional[int] = None) -> Generator[TextMatch, None, None]:
+        """
+            Merges per-shard streams, each ordered by descending `rating`.
+            The first matches of all shards are requested in parallel,
+            further ones - only when needed, so once `max_matches` are
+            yielded, the remaining cursors are closed without being drained.
+        """
+        heads = list(self.executor.map(lambda s: next(s, None), streams))
+        heap = [(-m.rating, i, m) for i, m in enumerate(heads) if m is not None]
+        heapq.heapify(heap)
+        cnt_yielded = 0
+        try:
+            while heap:
+                _, i, m = heapq.heappop(heap)
+                yield m
+                cnt_yielded += 1
+                if max_matches and cnt_yielded >= max_matches:
+                    break
+                following = next(streams[i], None)
+                if following is not None:
+                    heapq.heappush(heap, (-following.rating, i, following))
+        finally:
+            for s in streams:
+                if hasattr(s, 'close'):
+                    s.close()
+
+# region Bulk Reads
+
+    @property
+    def texts(self) -> Generator[Text, None, None]:
+        return chain.from_iterable(s.texts for s in self.shards)
+
+# region Bulk Writes
+
+    def clear(self):
+        self.broadcast(lambda s: s.clear())
+
+    @contextlib.contextmanager
+    def bulk_load(self):
+        with contextlib.ExitStack() as stack:
+            for s in self.shards:
+                stack.enter_context(s.bulk_load())
+            yield self
+
+# region Helpers
+
+    def shard(self, identifier: int) -> BaseAPI:
+        return self.shards[shard_of(identifier, len(self.shards))]
+
+    def partition(self, objs) -> List[object]:
+        """
+            Splits texts, a `TextBatch` or IDs into one part per shard,
+            of the same type as the input.
+        """
+        count_shards = len(self.shards)
+        if isinstance(objs, TextBatch):
+            parts = [TextBatch() for _ in range(count_shards)]
+            for i, _id in enumerate(objs.ids):
+                parts[shard_of(_id, count_shards)].append_encoded(
+                    _id, objs.encoded(i))
+            return parts
+        parts = [list() for _ in range(count_shards)]
+        for o in objs:
+            _id = o if isinstance(o, int) else o._id
+            parts[shard_of(_id, count_shards)].append(o)
+        return parts
+
+    def broadcast(self, func) -> List[object]:
+        return list(self.executor.map(func, self.shards))
+
+    def scatter(self, parts: List[object], func) -> List[object]:
+        futures = [self.executor.submit(func, s, part)
+                   for s, part in zip(self.shards, parts) if len(part)]
+        return [f.result() for f in futures]
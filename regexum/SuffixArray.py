@@ -0,0 +1,302 @@
+import re
+from typing import List, Optional, Dict, Generator, Set, Tuple, Sequence
+
+import numpy as np
+
+from PyStorageTexts.BaseAPI import BaseAPI
+from PyStorageHelpers import *
+
+
+def build_suffix_array(codes: np.ndarray) -> Tuple[np.ndarray, List[np.ndarray]]:
+    """
+        Prefix-doubling construction in O(n * log(n)^2).
+        Besides the suffix array returns the ranks of every level,
+        where `levels[k][i] == levels[k][j]` means that suffixes `i` and `j`
+        share the first `2^k` characters. Those are later reused for LCP.
+        https://en.wikipedia.org/wiki/Suffix_array#Construction_algorithms
+    """
+    count = len(codes)
+    rank = codes.astype(np.int64)
+    levels = [rank]
+    order = np.argsort(rank, kind='stable')
+    if count == 0 or np.unique(rank).size == count:
+        return order, levels
+
+    step = 1
+    while True:
+        following = np.full(count, -1, dtype=np.int64)
+        following[:count - step] = rank[step:]
+        order = np.lexsort((following, rank))
+        sorted_rank = rank[order]
+        sorted_following = following[order]
+        changed = np.ones(count, dtype=bool)
+        changed[1:] = (sorted_rank[1:] != sorted_rank[:-1]) | \
+            (sorted_following[1:] != sorted_following[:-1])
+        rank = np.empty(count, dtype=np.int64)
+        rank[order] = np.cumsum(changed) - 1
+        levels.append(rank)
+        if rank[order[-1]] == count - 1:
+            return order, levels
+        step *= 2
+
+
+def build_lcp_array(order: np.ndarray, levels: List[np.ndarray]) -> np.ndarray:
+    """
+        Longest Common Prefix of every pair of neighboring suffixes:
+        `lcp[i]` is shared by `order[i-1]` and `order[i]`, `lcp[0] = 0`.
+        Instead of sequential Kasai, descends through the ranks of every
+        doubling level, extending all prefixes at once.
+    """
+    count = len(order)
+    lcp = np.zeros(count, dtype=np.int64)
+    if count < 2:
+        return lcp
+    lefts = order[:-1]
+    rights = order[1:]
+    shared = np.zeros(count - 1, dtype=np.int64)
+    for level in reversed(range(len(levels))):
+        rank = levels[level]
+        left_ends = lefts + shared
+        right_ends = rights + shared
+        valid = (left_ends < count) & (right_ends < count)
+        equal = np.zeros(count - 1, dtype=bool)
+        equal[valid] = rank[left_ends[valid]] == rank[right_ends[valid]]
+        shared[equal] += 1 << level
+    lcp[1:] = shared
+    return lcp
+
+
+def encode_codes(content: str) -> np.ndarray:
+    return np.frombuffer(content.encode('utf-32-le'), dtype=np.uint32)
+
+
+class SuffixIndex(object):
+    """
+        Concatenates all documents into one buffer of code points,
+        terminating each with a `\\0` separator, so that no match
+        can cross the boundary of a document.
+    """
+
+    def __init__(self, ids: Sequence[int], contents: Sequence[str]):
+        self.ids = list(ids)
+        lengths = np.fromiter(map(len, contents), dtype=np.int64,
+                              count=len(contents)) + 1
+        self.starts = np.zeros(len(lengths) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=self.starts[1:])
+        self.codes = encode_codes(''.join(c + '\0' for c in contents))
+        self.order, levels = build_suffix_array(self.codes)
+        self.lcp = build_lcp_array(self.order, levels)
+
+    def compare(self, position: int, query: np.ndarray) -> int:
+        window = self.codes[position:position + len(query)]
+        mismatches = np.flatnonzero(window != query[:len(window)])
+        if mismatches.size:
+            first = mismatches[0]
+            return -1 if window[first] < query[first] else 1
+        return 0 if len(window) == len(query) else -1
+
+    def lower_bound(self, query: np.ndarray) -> int:
+        low, high = 0, len(self.order)
+        while low < high:
+            middle = (low + high) // 2
+            if self.compare(self.order[middle], query) < 0:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def count_matches(self, query: str, max_matches: Optional[int] = None) -> Dict[int, int]:
+        """
+            Returns the number of occurrences per document index.
+            Binary search finds the first matching suffix in O(|q| * log(n)),
+            the rest are a contiguous range, that ends where LCP drops below `|q|`.
+            The range is scanned in exponentially growing blocks,
+            so that `max_matches` can stop early.
+        """
+        counts = dict()
+        if len(query) == 0 or '\0' in query:
+            return counts
+        pattern = encode_codes(query)
+        first = self.lower_bound(pattern)
+        if first == len(self.order) or self.compare(self.order[first], pattern) != 0:
+            return counts
+
+        block = max(max_matches or 0, 64)
+        while first < len(self.order):
+            breaks = np.flatnonzero(
+                self.lcp[first + 1:first + block] < len(pattern))
+            last = first + 1 + breaks[0] if breaks.size else \
+                min(first + block, len(self.order))
+            positions = self.order[first:last]
+            docs = np.searchsorted(self.starts, positions, side='right') - 1
+            docs, occurrences = np.unique(docs, return_counts=True)
+            for doc, cnt in zip(docs.tolist(), occurrences.tolist()):
+                counts[doc] = counts.get(doc, 0) + cnt
+            if breaks.size or (max_matches and len(counts) >= max_matches):
+                break
+            # The next block starts after the scanned range,
+            # so its first suffix must be checked separately.
+            if last >= len(self.order) or self.lcp[last] < len(pattern):
+                break
+            first = last
+            block *= 2
+        return counts
+
+
+class SuffixArray(BaseAPI):
+    """
+        Zero-service baseline, that keeps all the texts in RAM.
+        Substring search is answered with a Suffix Array and an LCP array
+        built over the concatenation of all documents, separately for the
+        original and the case-folded contents. Both are rebuilt lazily on
+        the first query after a modification, so batch your writes.
+        https://en.wikipedia.org/wiki/Suffix_array
+        https://en.wikipedia.org/wiki/LCP_array
+    """
+    __max_batch_size__ = 100000
+    __is_concurrent__ = False
+    __in_memory__ = True
+
+# region Metadata
+
+    def __init__(self, url='memory://texts', **kwargs):
+        BaseAPI.__init__(self, **kwargs)
+        self.contents: Dict[int, str] = dict()
+        self.suffix_indexes: Dict[bool, SuffixIndex] = dict()
+
+    def count_texts(self) -> int:
+        return len(self.contents)
+
+# region Random Writes
+
+    def add(self, one_or_many_texts, upsert=True) -> int:
+        if isinstance(one_or_many_texts, Text):
+            if not upsert and (one_or_many_texts._id in self.contents):
+                return False
+            self.contents[one_or_many_texts._id] = one_or_many_texts.content
+            self.suffix_indexes.clear()
+            return True
+        elif is_sequence_of(one_or_many_texts, Text):
+            return int(sum(self.add(t, upsert=upsert) for t in one_or_many_texts))
+
+        return super().add(one_or_many_texts, upsert=upsert)
+
+    def remove(self, one_or_many_texts) -> int:
+        if isinstance(one_or_many_texts, int):
+            if self.contents.pop(one_or_many_texts, None) is None:
+                return False
+            self.suffix_indexes.clear()
+            return True
+        elif is_sequence_of(one_or_many_texts, int):
+            return int(sum(map(self.remove, one_or_many_texts)))
+
+        return super().remove(one_or_many_texts)
+
+# region Random Reads
+
+    def get(self, identifier: int) -> Optional[Text]:
+        content = self.contents.get(identifier, None)
+        if content is None:
+            return None
+        return Text(identifier, content)
+
+    def find_substring(
+        self,
+        query: str,
+        case_sensitive: bool = True,
+        max_matches: Optional[int] = None,
+        include_text=True,
+        snippet_length: Optional[int] = None,
+    ) -> Sequence[TextMatch]:
+        if snippet_length:
+            matches = self.find_substring(
+                query, case_sensitive=case_sensitive, max_matches=max_matches)
+            pattern = compile_query(query, is_regex=False,
+                                    case_sensitive=case_sensitive)
+            return add_snippets(matches, pattern, snippet_length)
+        index = self.suffix_index(case_sensitive)
+        if not case_sensitive:
+            query = query.lower()
+        counts = index.count_matches(query, max_matches=max_matches)
+        docs = sorted(counts.keys(), key=lambda doc: (-counts[doc], doc))
+        if max_matches:
+            docs = docs[:max_matches]
+        return [self.make_match(index.ids[doc], counts[doc], include_text) for doc in docs]
+
+    def find_regex(
+        self,
+        query: str,
+        case_sensitive: bool = True,
+        max_matches: Optional[int] = None,
+        include_text=True,
+        snippet_length: Optional[int] = None,
+    ) -> Sequence[TextMatch]:
+        plan = self.explain(query, case_sensitive=case_sensitive)
+        if plan.operation == 'substring':
+            return self.find_substring(
+                plan.query,
+                case_sensitive=case_sensitive,
+                max_matches=max_matches,
+                include_text=include_text,
+                snippet_length=snippet_length,
+            )
+        # Suffix arrays can't help with arbitrary patterns,
+        # so those are matched with a linear scan.
+        pattern = re.compile(query, 0 if case_sensitive else re.IGNORECASE)
+        results = list()
+        for _id, content in self.contents.items():
+            if max_matches and len(results) >= max_matches:
+                break
+            if pattern.search(content):
+                results.append(self.make_match(
+                    _id, 1, include_text or bool(snippet_length)))
+        if snippet_length:
+            return add_snippets(results, pattern, snippet_length)
+        return results
+
+# region Bulk Reads
+
+    @property
+    def texts(self) -> Sequence[Text]:
+        return [Text(_id, content) for _id, content in self.contents.items()]
+
+# region Bulk Writes
+
+    def clear(self):
+        self.contents = dict()
+        self.suffix_indexes.clear()
+
+# region Helpers
+
+    def suffix_index(self, case_sensitive: bool) -> SuffixIndex:
+        index = self.suffix_indexes.get(case_sensitive, None)
+        if index is None:
+            contents = list(self.contents.values())
+            if not case_sensitive:
+                contents = [c.lower() for c in contents]
+            index = SuffixIndex(self.contents.keys(), contents)
+            self.suffix_indexes[case_sensitive] = index
+        return index
+
+    def make_match(self, _id: int, rating: float, include_text: bool) -> TextMatch:
+        content = self.contents[_id] if include_text else ''
+        return TextMatch(_id=_id, content=content, rating=rating)
+
+
+# region Testing
+
+if __name__ == '__main__':
+    db = SuffixArray()
+    db.clear()
+    assert db.count_texts() == 0
+    assert db.add([
+        Text(1, 'the big brown fox'),
+        Text(2, 'as.the.day;passes'),
+        Text(3, 'along the:way'),
+    ])
+    assert db.count_texts() == 3
+    assert {m._id for m in db.find_substring('the')} == {1, 2, 3}
+    assert {m._id for m in db.find_substring('BIG', case_sensitive=False)} == {1}
+    assert len(db.find_substring('the', max_matches=2)) == 2
+    assert db.remove(1)
+    assert not db.find_substring('big')
@@ -0,0 +1,190 @@
+import re
+from typing import List, Optional, Dict, Generator, Set, Tuple, Sequence
+
+from PyStorageTexts.BaseAPI import BaseAPI
+from PyStorageHelpers import *
+
+
+class TrigramIndex(BaseAPI):
+    """
+        Wraps any other backend with an in-memory trigram inverted index,
+        similar to Google Code Search. Every regex is translated into
+        an AND/OR query over trigrams, the posting lists are intersected
+        into a set of candidate IDs and only those candidates are fetched
+        from the underlying backend and matched with Python `re`.
+        All writes must go through the wrapper to keep the index in sync.
+        Writes, that the backend doesn't confirm in full, keep the trigrams
+        of the old contents too, so they only add extra candidates,
+        until the next `rebuild`.
+
+        https://swtch.com/~rsc/regexp/regexp4.html
+    """
+    # Substring searches go to the backend, which may be approximate.
+    __exact_substrings__ = False
+
+# region Metadata
+
+    def __init__(self, backend: BaseAPI, rebuild=True, **kwargs):
+        BaseAPI.__init__(self, **kwargs)
+        self.backend = backend
+        self.postings: Dict[str, Set[int]] = dict()
+        self.trigrams_per_text: Dict[int, Set[str]] = dict()
+        if rebuild:
+            self.rebuild()
+
+    def count_texts(self) -> int:
+        return self.backend.count_texts()
+
+    def close(self):
+        self.backend.close()
+
+# region Random Writes
+
+    def add(self, one_or_many_texts, upsert=True) -> int:
+        if isinstance(one_or_many_texts, Text):
+            texts = [one_or_many_texts]
+        elif is_sequence_of(one_or_many_texts, Text):
+            texts = one_or_many_texts
+        else:
+            return super().add(one_or_many_texts, upsert=upsert)
+
+        # Until the backend confirms the writes, both the old and the new
+        # contents must be found, even if the backend raises half-way.
+        for t in texts:
+            self.index_text(t, replace=False)
+        result = self.backend.add(one_or_many_texts, upsert=upsert)
+        # The count doesn't tell, which writes failed, so only a complete
+        # success allows dropping the trigrams of the old contents.
+        if upsert and result == len(texts):
+            for t in texts:
+                self.index_text(t, replace=True)
+        return result
+
+    def remove(self, one_or_many_texts) -> int:
+        if isinstance(one_or_many_texts, int):
+            ids = [one_or_many_texts]
+        elif is_sequence_of(one_or_many_texts, int):
+            ids = one_or_many_texts
+        else:
+            return super().remove(one_or_many_texts)
+
+        result = self.backend.remove(one_or_many_texts)
+        # Documents, that may still exist, must remain candidates.
+        if result == len(ids):
+            for _id in ids:
+                self.unindex_text(_id)
+        return result
+
+# region Random Reads
+
+    def get(self, identifier: int) -> Optional[Text]:
+        return self.backend.get(identifier)
+
+    def get_many(self, ids: Sequence[int], include_text=True, max_length: Optional[int] = None) -> List[Optional[Text]]:
+        return self.backend.get_many(ids, include_text=include_text, max_length=max_length)
+
+    def find_substring(
+        self,
+        query: str,
+        case_sensitive: bool = True,
+        max_matches: Optional[int] = None,
+        include_text=True,
+        snippet_length: Optional[int] = None,
+    ) -> Sequence[TextMatch]:
+        return self.backend.find_substring(
+            query,
+            case_sensitive=case_sensitive,
+            max_matches=max_matches,
+            include_text=include_text,
+            snippet_length=snippet_length,
+        )
+
+    def find_regex(
+        self,
+        query: str,
+        case_sensitive: bool = True,
+        max_matches: Optional[int] = None,
+        include_text=True,
+        snippet_length: Optional[int] = None,
+    ) -> Sequence[TextMatch]:
+        pattern = re.compile(query, 0 if case_sensitive else re.IGNORECASE)
+        results = list()
+        candidates = sorted(self.candidates(query))
+        for ids in chunks(candidates, type(self).__max_batch_size__):
+            for text in self.backend.get_many(ids):
+                if max_matches and len(results) >= max_matches:
+                    return results
+                if (text is None) or (not pattern.search(text.content)):
+                    continue
+                content = text.content if include_text or snippet_length else ''
+                results.append(TextMatch(_id=text._id, content=content, rating=1))
+        if snippet_length:
+            return add_snippets(results, pattern, snippet_length)
+        return results
+
+# region Bulk Reads
+
+    @property
+    def texts(self) -> Sequence[Text]:
+        return self.backend.texts
+
+# region Bulk Writes
+
+    def bulk_load(self):
+        return self.backend.bulk_load()
+
+    def add_stream(self, stream, upsert=False, **kwargs) -> int:
+        # Let the backend use its own bulk-import path,
+        # just peek into the documents on their way there.
+        # Streams aren't confirmed per document, so old trigrams are kept.
+        def produce_indexed():
+            for t in ([stream] if isinstance(stream, TextBatch) else stream):
+                if isinstance(t, TextBatch):
+                    for _id, content in t.items():
+                        self.index_text(Text(_id, content), replace=False)
+                else:
+                    self.index_text(t, replace=False)
+                yield t
+        return self.backend.add_stream(produce_indexed(), upsert=upsert, **kwargs)
+
+    def clear(self):
+        self.backend.clear()
+        self.postings = dict()
+        self.trigrams_per_text = dict()
+
+# region Helpers
+
+    def rebuild(self):
+        self.postings = dict()
+        self.trigrams_per_text = dict()
+        for t in self.backend.texts:
+            self.index_text(t)
+
+    def index_text(self, text: Text, replace=True):
+        new_trigrams = trigrams(text.content)
+        if replace:
+            self.unindex_text(text._id)
+        else:
+            # Without upserts the old content may persist,
+            # so we keep the trigrams of both versions.
+            new_trigrams |= self.trigrams_per_text.get(text._id, set())
+        self.trigrams_per_text[text._id] = new_trigrams
+        for t in new_trigrams:
+            self.postings.setdefault(t, set()).add(text._id)
+
+    def unindex_text(self, identifier: int):
+        old_trigrams = self.trigrams_per_text.pop(identifier, set())
+        for t in old_trigrams:
+            ids = self.postings.get(t, None)
+            if ids is None:
+                continue
+            ids.discard(identifier)
+            if not ids:
+                self.postings.pop(t)
+
+    def candidates(self, query: str) -> Set[int]:
+        return evaluate_trigram_query(
+            regex_to_trigram_query(query),
+            self.postings,
+            self.trigrams_per_text.keys(),
+        )
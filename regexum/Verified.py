@@ -0,0 +1,195 @@
+import os
+import re
+import concurrent.futures
+from typing import List, Optional, Dict, Generator, Set, Tuple, Sequence
+
+from PyStorageTexts.BaseAPI import BaseAPI
+from PyStorageHelpers import *
+
+
+class Verified(BaseAPI):
+    """
+        Wraps backends with approximate search, like token-based `$text`
+        in MongoDB or `match` queries in ElasticSearch, re-checking every
+        returned document with the exact substring or Python `re` pattern.
+        False positives are dropped and `TextMatch.spans` are filled with
+        the offsets of matches. Matching runs in a pool of `processes`,
+        so it scales across cores instead of blocking the caller.
+
+        Results are streamed from the backend in batches of `batch_size`,
+        until `max_matches` of them pass the verification.
+        The pool is started on the first search and stopped by `close`,
+        which also closes the wrapped backend:
+
+            with Verified(MongoDB(url)) as db:
+                db.find_substring('needle')
+    """
+
+# region Metadata
+
+    def __init__(
+        self,
+        backend: BaseAPI,
+        processes: Optional[int] = None,
+        batch_size: int = 1000,
+        max_spans: Optional[int] = None,
+        **kwargs,
+    ):
+        BaseAPI.__init__(self, **kwargs)
+        self.backend = backend
+        self.processes = processes or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.max_spans = max_spans
+        self.executor = None
+
+    def count_texts(self) -> int:
+        return self.backend.count_texts()
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown()
+            self.executor = None
+        self.backend.close()
+
+# region Random Writes
+
+    def add(self, one_or_many_texts, upsert=True) -> int:
+        return self.backend.add(one_or_many_texts, upsert=upsert)
+
+    def remove(self, one_or_many_texts) -> int:
+        return self.backend.remove(one_or_many_texts)
+
+# region Random Reads
+
+    def get(self, identifier: int) -> Optional[Text]:
+        return self.backend.get(identifier)
+
+    def get_many(self, ids: Sequence[int], include_text=True, max_length: Optional[int] = None) -> List[Optional[Text]]:
+        return self.backend.get_many(ids, include_text=include_text, max_length=max_length)
+
+    def find_substring(
+        self,
+        query: str,
+        case_sensitive: bool = True,
+        max_matches: Optional[int] = None,
+        include_text=True,
+        snippet_length: Optional[int] = None,
+    ) -> Sequence[TextMatch]:
+        matches = list(self.iter_substring(
+            query,
+            case_sensitive=case_sensitive,
+            max_matches=max_matches,
+            include_text=include_text or bool(snippet_length),
+        ))
+        return self.cut_snippets(matches, snippet_length) if snippet_length else matches
+
+    def find_regex(
+        self,
+        query: str,
+        case_sensitive: bool = True,
+        max_matches: Optional[int] = None,
+        include_text=True,
+        snippet_length: Optional[int] = None,
+    ) -> Sequence[TextMatch]:
+        matches = list(self.iter_regex(
+            query,
+            case_sensitive=case_sensitive,
+            max_matches=max_matches,
+            include_text=include_text or bool(snippet_length),
+        ))
+        return self.cut_snippets(matches, snippet_length) if snippet_length else matches
+
+    def explain(self, query: str, case_sensitive: bool = True) -> QueryPlan:
+        plan = self.backend.explain(query, case_sensitive=case_sensitive)
+        plan.post_filter = True
+        return plan
+
+# region Streaming Reads
+
+    def iter_substring(
+        self,
+        query: str,
+        case_sensitive: bool = True,
+        max_matches: Optional[int] = None,
+        include_text=True,
+    ) -> Generator[TextMatch, None, None]:
+        candidates = self.backend.iter_substring(
+            query, case_sensitive=case_sensitive, include_text=True)
+        pattern = compile_query(query, is_regex=False,
+                                case_sensitive=case_sensitive)
+        yield from self.verify(candidates, pattern, max_matches, include_text)
+
+    def iter_regex(
+        self,
+        query: str,
+        case_sensitive: bool = True,
+        max_matches: Optional[int] = None,
+        include_text=True,
+    ) -> Generator[TextMatch, None, None]:
+        candidates = self.backend.iter_regex(
+            query, case_sensitive=case_sensitive, include_text=True)
+        pattern = compile_query(query, is_regex=True,
+                                case_sensitive=case_sensitive)
+        yield from self.verify(candidates, pattern, max_matches, include_text)
+
+# region Bulk Reads
+
+    @property
+    def texts(self) -> Sequence[Text]:
+        return self.backend.texts
+
+# region Bulk Writes
+
+    def bulk_load(self):
+        return self.backend.bulk_load()
+
+    def add_stream(self, stream, upsert=False, **kwargs) -> int:
+        return self.backend.add_stream(stream, upsert=upsert, **kwargs)
+
+    def clear(self):
+        self.backend.clear()
+
+# region Helpers
+
+    def verify(
+        self,
+        candidates: Generator[TextMatch, None, None],
+        pattern: re.Pattern,
+        max_matches: Optional[int],
+        include_text: bool,
+    ) -> Generator[TextMatch, None, None]:
+        cnt_yielded = 0
+        try:
+            for batch in chunks(candidates, self.batch_size):
+                verified = verify_matches(
+                    batch,
+                    pattern,
+                    executor=self.process_pool(),
+                    max_spans=self.max_spans,
+                    processes=self.processes,
+                )
+                for m in verified:
+                    if not include_text:
+                        m.content = ''
+                    yield m
+                    cnt_yielded += 1
+                    if max_matches and cnt_yielded >= max_matches:
+                        return
+        finally:
+            if hasattr(candidates, 'close'):
+                candidates.close()
+
+    def cut_snippets(self, matches: List[TextMatch], snippet_length: int) -> List[TextMatch]:
+        """ Full contents are needed for verification, so snippets are cut locally. """
+        for m in matches:
+            m.snippets = [make_snippet(m.content, m.spans[0][0], snippet_length)]
+            m.content = ''
+        return matches
+
+    def process_pool(self) -> Optional[concurrent.futures.Executor]:
+        if self.processes <= 1:
+            return None
+        if self.executor is None:
+            self.executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.processes)
+        return self.executor
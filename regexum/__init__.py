@@ -0,0 +1,56 @@
+import sys
+import types
+import importlib
+
+from .Registry import connect, register_backend
+
+# Every backend lives in a module of the same name and is only imported
+# on the first access, together with its driver, so a job using one
+# backend doesn't pay for loading all the others.
+# https://www.python.org/dev/peps/pep-0562/
+BACKEND_NAMES = [
+    'BaseAPI',
+    'BaseAsyncAPI',
+    'BaseSQL',
+    'Cached',
+    'ElasticSearch',
+    'ElasticSearchAsync',
+    'MongoDB',
+    'MongoDBAsync',
+    'SQLite',
+    'Sectioned',
+    'Sharded',
+    'SuffixArray',
+    'TrigramIndex',
+    'Verified',
+]
+
+__all__ = ['connect', 'register_backend'] + BACKEND_NAMES
+
+
+def __getattr__(name: str):
+    if name not in BACKEND_NAMES:
+        raise AttributeError(f'module {__name__!r} has no attribute {name!r}')
+    class_ = getattr(importlib.import_module(f'{__name__}.{name}'), name)
+    globals()[name] = class_
+    return class_
+
+
+def __dir__():
+    return sorted(list(globals()) + BACKEND_NAMES)
+
+
+class LazyPackage(types.ModuleType):
+    """
+        Importing a submodule, like `regexum.MongoDB`, binds it to the attribute
+        of the same name in the package, hiding the class. This keeps the class.
+        https://docs.python.org/3/reference/import.html#submodules
+    """
+
+    def __setattr__(self, name: str, value):
+        if name in BACKEND_NAMES and isinstance(value, types.ModuleType):
+            value = getattr(value, name)
+        super().__setattr__(name, value)
+
+
+sys.modules[__name__].__class__ = LazyPackage
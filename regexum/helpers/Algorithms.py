@@ -1,4 +1,4 @@
-from typing import List, Optional, Dict, Generator, Set, Tuple, Sequence, Generator
+from typing import List, Optional, Dict, Generator, Set, Tuple, Sequence, Generator, AsyncGenerator
 from itertools import groupby, count, filterfalse, chain
 import csv
 from urllib.parse import urlparse
@@ -6,6 +6,7 @@ import random
 from random import SystemRandom
 from pathlib import Path
 import collections
+import concurrent.futures
 
 
 from PyStorageHelpers.Edge import Edge
@@ -54,6 +55,32 @@ def chunks(iterable, size) -> Generator[list, None, None]:
         yield current
 
 
+async def chunks_async(iterable, size) -> AsyncGenerator[list, None]:
+    """ Same as `chunks`, but for async iterables. """
+    current = list()
+    async for v in iterable:
+        if len(current) == size:
+            yield current
+            current = list()
+        current.append(v)
+    if len(current) > 0:
+        yield current
+
+
+def map_bounded(executor: concurrent.futures.Executor, func, iterable, max_pending: int) -> Generator[object, None, None]:
+    """
+        Ordered alternative to `executor.map`, that doesn't submit
+        the whole iterable at once, keeping memory usage bounded.
+    """
+    pending = collections.deque()
+    for arg in iterable:
+        pending.append(executor.submit(func, arg))
+        if len(pending) >= max_pending:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+
 def extract_database_name(url: str, default='graph') -> Tuple[str, str]:
     url = urlparse(url)
     address = f'{url.scheme}://{url.netloc}'
@@ -1,11 +1,21 @@
-from typing import List, Optional, Dict, Generator, Set, Tuple, Sequence, Generator
+from typing import List, Optional, Dict, Generator, Set, Tuple, Sequence, Generator, Callable
 import csv
 from pathlib import Path
 import sys
 import os.path
+import io
+import operator
+import functools
+import concurrent.futures
+from itertools import chain
 
 from PyStorageHelpers.Edge import Edge
-from PyStorageHelpers.Text import Text
+from PyStorageHelpers.Text import Text, TextSection, TextBatch, section_id
+from PyStorageHelpers.Algorithms import map_bounded
+
+# Files smaller than this are parsed on a single core,
+# as the process pool isn't worth spawning for them.
+PARALLEL_CSV_MIN_BYTES = 256 * 1024 * 1024
 
 
 def allow_big_csv_fields():
@@ -28,30 +38,223 @@ def allow_big_csv_fields():
 # region Texts
 
 
-def yield_texts_from_csv(filepath: str, column: str = 'content', id_column: str = None) -> Generator[Text, None, None]:
-    last_text = str()
+def parse_id(value: str, id_parser: Callable[[str], int] = int) -> int:
+    """
+        Backends and `TextBatch` key documents by 64-bit integers, so both
+        CSV readers require them from `id_parser`, whatever the file size.
+    """
+    new_id = id_parser(value)
+    try:
+        return operator.index(new_id)
+    except TypeError:
+        raise TypeError(f'Document IDs must be integers, got {new_id!r} for {value!r}') from None
+
+
+def yield_texts_from_csv(
+    filepath: str,
+    column: str = 'content',
+    id_column: str = None,
+    sections: bool = False,
+    id_parser: Callable[[str], int] = int,
+) -> Generator[Text, None, None]:
+    """
+        Consecutive rows with the same `id_column` are merged into one document.
+        With `sections`, they are instead yielded separately as `TextSection`s.
+        Values of `id_column` are converted with `id_parser` into integers.
+    """
+    last_parts = list()
     last_id = 0
+    section = 0
     allow_big_csv_fields()
 
     with open(filepath, 'r') as f:
         reader = csv.DictReader(f)
 
         for row in reader:
-            new_id = str(row[id_column]) if id_column else (last_id + 1)
+            new_id = parse_id(row[id_column], id_parser) if id_column else (last_id + 1)
             new_text = str(row[column])
 
-            if new_id != last_id:
+            if sections:
+                section = (section + 1) if (new_id == last_id) else 0
+                last_id = new_id
+                if len(new_text) > 0:
+                    yield TextSection.make(new_id, section, new_text)
+            elif new_id != last_id:
+                last_text = ''.join(last_parts)
                 if len(last_text) > 0:
                     yield Text(last_id, last_text)
                 last_id = new_id
-                last_text = new_text
+                last_parts = [new_text]
             else:
-                last_text += new_text
+                # Joining the list once is linear, unlike repeated `+=`.
+                last_parts.append(new_text)
 
+        last_text = ''.join(last_parts)
         if len(last_text) > 0:
             yield Text(last_id, last_text)
 
 
+def find_csv_boundaries(filepath: str, start: int, range_bytes: int) -> List[int]:
+    """
+        Splits the file into ranges of roughly `range_bytes` each, returning
+        the offsets of their starts and the file size at the end.
+        Every boundary follows a line break outside of quoted fields,
+        which is tracked by the parity of quotes seen so far. Escaped
+        quotes come in pairs, so they don't affect it. The pass is
+        sequential, but `bytes.find` and `bytes.count` run at memory speed.
+    """
+    block_size = 1024 * 1024
+    boundaries = [start]
+    target = start + range_bytes
+    in_quotes = 0
+
+    with open(filepath, 'rb') as f:
+        f.seek(start)
+        position = start
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            block_end = position + len(block)
+            # Quotes are counted up to this offset within the block.
+            counted = 0
+            while target < block_end:
+                skipped = max(target - position, counted)
+                in_quotes ^= block.count(b'"', counted, skipped) & 1
+                counted = skipped
+                newline = block.find(b'\n', counted)
+                while newline >= 0:
+                    in_quotes ^= block.count(b'"', counted, newline) & 1
+                    counted = newline
+                    if not in_quotes:
+                        break
+                    newline = block.find(b'\n', newline + 1)
+                if newline < 0:
+                    break
+                boundaries.append(position + newline + 1)
+                target = boundaries[-1] + range_bytes
+            in_quotes ^= block.count(b'"', counted) & 1
+            position = block_end
+
+    if boundaries[-1] < position:
+        boundaries.append(position)
+    return boundaries
+
+
+def parse_csv_range(
+    byte_range: Tuple[int, int],
+    filepath: str,
+    fieldnames: List[str],
+    column: str,
+    id_column: str = None,
+    sections: bool = False,
+    id_parser: Callable[[str], int] = int,
+) -> TextBatch:
+    """
+        Runs in a worker process. Merges consecutive rows with the same
+        `id_column`, unless `sections` are needed. Without `id_column`
+        IDs are row numbers within the range, as only the parent process
+        knows the number of rows in previous ranges.
+    """
+    allow_big_csv_fields()
+    start, end = byte_range
+    with open(filepath, 'rb') as f:
+        f.seek(start)
+        data = f.read(end - start)
+    reader = csv.DictReader(
+        io.StringIO(data.decode('utf-8'), newline=None),
+        fieldnames=fieldnames,
+    )
+
+    ids = list()
+    parts = list()
+    for row in reader:
+        new_id = parse_id(row[id_column], id_parser) if id_column else (len(ids) + 1)
+        new_text = str(row[column])
+        if id_column and ids and ids[-1] == new_id and not sections:
+            parts[-1].append(new_text)
+        else:
+            ids.append(new_id)
+            parts.append([new_text])
+
+    batch = TextBatch()
+    for i, p in zip(ids, parts):
+        batch.append(i, ''.join(p))
+    return batch
+
+
+def yield_text_batches_from_csv(
+    filepath: str,
+    column: str = 'content',
+    id_column: str = None,
+    sections: bool = False,
+    processes: Optional[int] = None,
+    range_bytes: int = 64 * 1024 * 1024,
+    id_parser: Callable[[str], int] = int,
+) -> Generator[TextBatch, None, None]:
+    """
+        Parallel version of `yield_texts_from_csv`, producing same documents
+        in the same order, but in batches - one per byte range of the file.
+        Groups of rows sharing `id_column` may cross the ranges boundaries,
+        so the last document of every range is held until the next one.
+        The `id_parser` is sent to the worker processes, so it must be picklable.
+    """
+    allow_big_csv_fields()
+    with open(filepath, 'rb') as f:
+        header = f.readline()
+    fieldnames = next(csv.reader([header.decode('utf-8')]))
+    boundaries = find_csv_boundaries(filepath, len(header), range_bytes)
+    parse_range = functools.partial(
+        parse_csv_range,
+        filepath=filepath,
+        fieldnames=fieldnames,
+        column=column,
+        id_column=id_column,
+        sections=sections,
+        id_parser=id_parser,
+    )
+
+    cnt_rows = 0
+    last_id = 0
+    last_parts = list()
+    section = 0
+    with concurrent.futures.ProcessPoolExecutor(max_workers=processes) as pool:
+        max_pending = 2 * (processes or os.cpu_count() or 1)
+        for batch in map_bounded(pool, parse_range, zip(boundaries[:-1], boundaries[1:]), max_pending):
+            if id_column is None:
+                for i in range(len(batch)):
+                    batch.ids[i] += cnt_rows
+                cnt_rows += len(batch)
+
+            if sections:
+                for i, new_id in enumerate(batch.ids):
+                    section = (section + 1) if (new_id == last_id) else 0
+                    last_id = new_id
+                    batch.ids[i] = section_id(new_id, section)
+                batch = batch.without_empty()
+                if len(batch):
+                    yield batch
+                continue
+
+            if len(batch) and batch.ids[0] == last_id:
+                last_parts.append(batch.content(0))
+                batch = batch[1:]
+            if len(batch) == 0:
+                continue
+            merged = TextBatch()
+            merged.append(last_id, ''.join(last_parts))
+            merged.extend(batch, 0, len(batch) - 1)
+            merged = merged.without_empty()
+            last_id = batch.ids[-1]
+            last_parts = [batch.content(-1)]
+            if len(merged):
+                yield merged
+
+    last_text = ''.join(last_parts)
+    if len(last_text) > 0:
+        yield TextBatch.from_texts([Text(last_id, last_text)])
+
+
 def yield_texts_from_directory(directory: str) -> Generator[Text, None, None]:
 
     idx = 0
@@ -61,11 +264,24 @@ def yield_texts_from_directory(directory: str) -> Generator[Text, None, None]:
 
 
 def import_texts(gdb, filepath: str, *args, **kwargs) -> int:
+    """
+        Imports a CSV file or a directory of files within `bulk_load`,
+        if the backend supports it, so indexes are built once in the end.
+    """
+    if hasattr(gdb, 'bulk_load'):
+        with gdb.bulk_load():
+            return import_texts_directly(gdb, filepath, *args, **kwargs)
+    return import_texts_directly(gdb, filepath, *args, **kwargs)
+
+
+def import_texts_directly(gdb, filepath: str, *args, **kwargs) -> int:
 
     if filepath.endswith('.csv'):
         if hasattr(gdb, 'add_from_csv'):
             return gdb.add_from_csv(filepath, *args, **kwargs)
         elif hasattr(gdb, 'add_stream'):
+            if os.path.getsize(filepath) >= PARALLEL_CSV_MIN_BYTES:
+                return gdb.add_stream(yield_text_batches_from_csv(filepath, *args, **kwargs))
             return gdb.add_stream(yield_texts_from_csv(filepath, *args, **kwargs))
 
     elif os.path.isdir(filepath):
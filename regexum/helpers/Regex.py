@@ -0,0 +1,436 @@
+from dataclasses import dataclass, field
+from typing import List, Optional, Dict, Generator, Set, Tuple, Sequence
+try:
+    from re import _parser as sre_parse
+    from re import _constants as sre_constants
+except ImportError:
+    import sre_parse
+    import sre_constants
+
+from PyStorageHelpers.Trigrams import regex_to_trigram_query, format_trigram_query, QUERY_NONE
+
+# Queries are written in Python `re` syntax and translated into:
+#   'python' - used as is, by backends matching with Python `re`,
+#   'pcre' - MongoDB `$regex` and `$regexFind`,
+#   'lucene' - ElasticSearch `regexp`, which is matched against whole terms.
+REGEX_DIALECTS = ['python', 'pcre', 'lucene']
+
+# Lucene `regexp` queries without a literal prefix enumerate the whole
+# terms dictionary, so shorter fragments aren't worth a term query.
+MIN_TERM_LENGTH = 3
+
+# Characters, that the standard tokenizer keeps inside of tokens, like in
+# "e.g.", "don't" or "1,000". All other non-alphanumeric ones split tokens.
+# https://unicode.org/reports/tr29/#Word_Boundaries
+TOKEN_JOINERS = set(":,;.'_")
+
+
+@dataclass
+class QueryPlan:
+    """
+        Describes, how a backend will execute a RegEx query:
+        *   'substring' - `query` is a literal for `find_substring`,
+        *   'prefix' - `query` is a literal prefix of the whole content for a range scan,
+        *   'regex' - `query` is the pattern translated into the `dialect`,
+        *   'terms' - `terms` are term-level queries, that must all match,
+        *   'scan' - no index can help and every document is checked,
+        *   'none' - no document can match.
+        With `post_filter` the candidates are verified with Python `re`.
+    """
+    pattern: str
+    dialect: str
+    operation: str
+    query: str = ''
+    terms: List[str] = field(default_factory=list)
+    post_filter: bool = False
+    notes: List[str] = field(default_factory=list)
+
+    def __str__(self) -> str:
+        lines = [f'{self.operation} ({self.dialect}): {self.pattern!r}']
+        if self.query:
+            lines.append(f'  query: {self.query!r}')
+        for term in self.terms:
+            lines.append(f'  term: {term!r}')
+        if self.post_filter:
+            lines.append('  post-filtered with Python re')
+        for note in self.notes:
+            lines.append(f'  note: {note}')
+        return '\n'.join(lines)
+
+
+def plan_regex(
+    pattern: str,
+    dialect: str = 'python',
+    case_sensitive: bool = True,
+    exact_substrings: bool = True,
+    prefix_scans: bool = False,
+) -> QueryPlan:
+    """
+        Parses the Python `pattern` once and picks the cheapest operation
+        of a backend, that speaks the `dialect`. Literal patterns become
+        substring searches, if those are `exact_substrings` in the backend.
+        Patterns anchored to the beginning of the content with a literal
+        prefix become range scans over an ordered index, if `prefix_scans`
+        are supported and the search is case-sensitive.
+    """
+    assert dialect in REGEX_DIALECTS, f'Unknown dialect: {dialect}'
+    parsed = sre_parse.parse(pattern)
+    flags = _state(parsed).flags & ~sre_constants.SRE_FLAG_UNICODE
+
+    literal = _literal(parsed)
+    if literal is not None and not flags and exact_substrings:
+        return QueryPlan(pattern, dialect, 'substring', query=literal,
+                         notes=['the pattern is a plain literal'])
+
+    prefix, rest = _anchored_prefix(parsed)
+    if prefix and not flags and case_sensitive and prefix_scans:
+        return QueryPlan(pattern, dialect, 'prefix', query=prefix, post_filter=bool(rest),
+                         notes=['the pattern is anchored to the beginning of the content'])
+
+    if dialect == 'python':
+        trigrams_query = regex_to_trigram_query(pattern)
+        if trigrams_query == QUERY_NONE:
+            return QueryPlan(pattern, dialect, 'none')
+        return QueryPlan(pattern, dialect, 'regex', query=pattern,
+                         terms=[format_trigram_query(trigrams_query)])
+
+    if dialect == 'pcre':
+        plan = QueryPlan(pattern, dialect, 'regex',
+                         query=translate_regex(pattern, 'pcre'))
+        if literal is not None:
+            plan.notes.append('literal, but substring search is approximate here')
+        return plan
+
+    # Lucene matches whole lowercased terms, so everything is post-filtered.
+    try:
+        query = _to_lucene(parsed)
+        return QueryPlan(pattern, dialect, 'regex', query=query, post_filter=True,
+                         notes=['the pattern never crosses token boundaries'])
+    except ValueError as e:
+        reason = str(e)
+    terms = _lucene_terms(parsed)
+    if terms:
+        return QueryPlan(pattern, dialect, 'terms', terms=terms, post_filter=True,
+                         notes=[f'not a term-level pattern: {reason}'])
+    return QueryPlan(pattern, dialect, 'scan', post_filter=True,
+                     notes=[f'not a term-level pattern: {reason}',
+                            f'no literal of {MIN_TERM_LENGTH}+ characters to look up'])
+
+
+def translate_regex(pattern: str, dialect: str) -> str:
+    """
+        Rewrites a Python `re` pattern for another engine, preserving its meaning.
+        Raises `ValueError`, if the `dialect` can't express it.
+    """
+    if dialect == 'python':
+        return pattern
+    parsed = sre_parse.parse(pattern)
+    if dialect == 'pcre':
+        state = _state(parsed)
+        names = {index: name for name, index in state.groupdict.items()}
+        _check_pcre_flags(state.flags)
+        inline = ''.join(letter for flag, letter in (
+            (sre_constants.SRE_FLAG_IGNORECASE, 'i'),
+            (sre_constants.SRE_FLAG_MULTILINE, 'm'),
+            (sre_constants.SRE_FLAG_DOTALL, 's'),
+        ) if state.flags & flag)
+        multiline = bool(state.flags & sre_constants.SRE_FLAG_MULTILINE)
+        body = _to_pcre(parsed, names, multiline)
+        return f'(?{inline}){body}' if inline else body
+    elif dialect == 'lucene':
+        return _to_lucene(parsed)
+    raise ValueError(f'Unknown dialect: {dialect}')
+
+# region Parse Trees
+
+
+def _state(parsed):
+    # Renamed from `pattern` to `state` in Python 3.11.
+    return getattr(parsed, 'state', None) or parsed.pattern
+
+
+def _literal(sequence) -> Optional[str]:
+    chars = list()
+    for op, av in sequence:
+        if op != sre_constants.LITERAL:
+            return None
+        chars.append(chr(av))
+    return ''.join(chars) if chars else None
+
+
+def _anchored_prefix(sequence) -> Tuple[str, list]:
+    nodes = list(sequence)
+    if not nodes or nodes[0][0] != sre_constants.AT or \
+            nodes[0][1] not in (sre_constants.AT_BEGINNING, sre_constants.AT_BEGINNING_STRING):
+        return '', nodes
+    chars = list()
+    rest = nodes[1:]
+    while rest and rest[0][0] == sre_constants.LITERAL:
+        chars.append(chr(rest[0][1]))
+        rest = rest[1:]
+    # Quantifiers wrap the repeated characters, so `^ab+` yields just `a`.
+    return ''.join(chars), rest
+
+
+_CATEGORY_ESCAPES = {
+    sre_constants.CATEGORY_DIGIT: r'\d',
+    sre_constants.CATEGORY_NOT_DIGIT: r'\D',
+    sre_constants.CATEGORY_SPACE: r'\s',
+    sre_constants.CATEGORY_NOT_SPACE: r'\S',
+    sre_constants.CATEGORY_WORD: r'\w',
+    sre_constants.CATEGORY_NOT_WORD: r'\W',
+}
+
+
+def _quantifier(min_count: int, max_count: int) -> str:
+    unbounded = max_count == sre_constants.MAXREPEAT
+    if (min_count, unbounded) == (0, True):
+        return '*'
+    elif (min_count, unbounded) == (1, True):
+        return '+'
+    elif (min_count, max_count) == (0, 1):
+        return '?'
+    elif unbounded:
+        return f'{{{min_count},}}'
+    elif min_count == max_count:
+        return f'{{{min_count}}}'
+    return f'{{{min_count},{max_count}}}'
+
+
+def _is_atom(sequence) -> bool:
+    if len(sequence) != 1:
+        return False
+    op = sequence[0][0]
+    return op in (sre_constants.LITERAL, sre_constants.NOT_LITERAL, sre_constants.ANY,
+                  sre_constants.IN, sre_constants.CATEGORY, sre_constants.SUBPATTERN)
+
+# region PCRE
+
+
+def _escape_pcre(c: str, in_set=False) -> str:
+    if c == '\n':
+        return r'\n'
+    elif c == '\t':
+        return r'\t'
+    elif c in ('\\]^-[' if in_set else '\\.^$*+?()[]{}|'):
+        return '\\' + c
+    return c
+
+
+def _pcre_set(items) -> str:
+    if len(items) == 1 and items[0][0] == sre_constants.CATEGORY:
+        # Python parses `\d` outside of brackets as `[\d]`.
+        return _CATEGORY_ESCAPES[items[0][1]]
+    parts = list()
+    for op, av in items:
+        if op == sre_constants.NEGATE:
+            parts.insert(0, '^')
+        elif op == sre_constants.LITERAL:
+            parts.append(_escape_pcre(chr(av), in_set=True))
+        elif op == sre_constants.RANGE:
+            parts.append(_escape_pcre(chr(av[0]), in_set=True) +
+                         '-' + _escape_pcre(chr(av[1]), in_set=True))
+        elif op == sre_constants.CATEGORY:
+            parts.append(_CATEGORY_ESCAPES[av])
+        else:
+            raise ValueError(f'Unsupported set item: {op}')
+    return '[' + ''.join(parts) + ']'
+
+
+def _check_pcre_flags(flags: int):
+    c = sre_constants
+    if flags & (c.SRE_FLAG_ASCII | c.SRE_FLAG_LOCALE):
+        raise ValueError('ASCII and locale-dependent classes have no PCRE equivalent')
+
+
+def _pcre_flag_letters(flags: int) -> str:
+    c = sre_constants
+    return ''.join(letter for flag, letter in (
+        (c.SRE_FLAG_IGNORECASE, 'i'),
+        (c.SRE_FLAG_DOTALL, 's'),
+    ) if flags & flag)
+
+
+def _to_pcre(sequence, names: Dict[int, str], multiline: bool) -> str:
+    c = sre_constants
+    parts = list()
+    for op, av in sequence:
+        if op == c.LITERAL:
+            parts.append(_escape_pcre(chr(av)))
+        elif op == c.NOT_LITERAL:
+            parts.append('[^' + _escape_pcre(chr(av), in_set=True) + ']')
+        elif op == c.ANY:
+            parts.append('.')
+        elif op == c.IN:
+            parts.append(_pcre_set(av))
+        elif op == c.CATEGORY:
+            parts.append(_CATEGORY_ESCAPES[av])
+        elif op == c.AT:
+            # MongoDB queries are sent with the `m` option, so the anchors
+            # are spelled out to keep the Python meaning without `re.M`.
+            parts.append({
+                c.AT_BEGINNING: '^' if multiline else r'\A',
+                c.AT_BEGINNING_STRING: r'\A',
+                c.AT_END: '$' if multiline else r'(?=\n?\z)',
+                c.AT_END_STRING: r'\z',
+                c.AT_BOUNDARY: r'\b',
+                c.AT_NON_BOUNDARY: r'\B',
+            }[av])
+        elif op == c.SUBPATTERN:
+            group, add_flags, del_flags, inner = av
+            _check_pcre_flags(add_flags | del_flags)
+            # Anchors are spelled out, so the scoped `m` only changes them.
+            inner_multiline = bool(add_flags & c.SRE_FLAG_MULTILINE) or \
+                (multiline and not del_flags & c.SRE_FLAG_MULTILINE)
+            if len(inner) == 1 and inner[0][0] == c.BRANCH:
+                body = '|'.join(_to_pcre(b, names, inner_multiline) for b in inner[0][1][1])
+            else:
+                body = _to_pcre(inner, names, inner_multiline)
+            on = _pcre_flag_letters(add_flags)
+            off = _pcre_flag_letters(del_flags)
+            if on or off:
+                body = f'(?{on}{"-" + off if off else ""}:{body})'
+            if group is None:
+                parts.append(body if on or off else f'(?:{body})')
+            elif group in names:
+                parts.append(f'(?<{names[group]}>{body})')
+            else:
+                parts.append(f'({body})')
+        elif op in (c.MAX_REPEAT, c.MIN_REPEAT, getattr(c, 'POSSESSIVE_REPEAT', None)):
+            min_count, max_count, inner = av
+            body = _to_pcre(inner, names, multiline)
+            if not _is_atom(inner):
+                body = f'(?:{body})'
+            suffix = {c.MAX_REPEAT: '', c.MIN_REPEAT: '?'}.get(op, '+')
+            parts.append(body + _quantifier(min_count, max_count) + suffix)
+        elif op == c.BRANCH:
+            branches = [_to_pcre(b, names, multiline) for b in av[1]]
+            parts.append('(?:' + '|'.join(branches) + ')')
+        elif op == c.GROUPREF:
+            parts.append(f'\\g{{{av}}}')
+        elif op == c.GROUPREF_EXISTS:
+            group, yes, no = av
+            no = _to_pcre(no, names, multiline) if no else ''
+            parts.append(f'(?({group}){_to_pcre(yes, names, multiline)}|{no})')
+        elif op in (c.ASSERT, c.ASSERT_NOT):
+            direction, inner = av
+            kind = ('=' if op == c.ASSERT else '!')
+            behind = '<' if direction < 0 else ''
+            parts.append(f'(?{behind}{kind}{_to_pcre(inner, names, multiline)})')
+        elif op == getattr(c, 'ATOMIC_GROUP', None):
+            parts.append(f'(?>{_to_pcre(av, names, multiline)})')
+        else:
+            raise ValueError(f'Unsupported operator: {op}')
+    return ''.join(parts)
+
+# region Lucene
+
+
+def _is_term_char(c: str) -> bool:
+    return c.isascii() and c.isalnum()
+
+
+def _lucene_set(items) -> str:
+    parts = list()
+    for op, av in items:
+        if op == sre_constants.LITERAL and _is_term_char(chr(av)):
+            parts.append(chr(av).lower())
+        elif op == sre_constants.RANGE:
+            low, high = chr(av[0]), chr(av[1])
+            if not any(low >= a and high <= b for a, b in (('0', '9'), ('a', 'z'), ('A', 'Z'))):
+                raise ValueError(f'range {low}-{high} may include separators')
+            parts.append(f'{low.lower()}-{high.lower()}')
+        elif op == sre_constants.CATEGORY and av == sre_constants.CATEGORY_DIGIT:
+            parts.append('0-9')
+        else:
+            raise ValueError('the set may include separators')
+    return '[' + ''.join(parts) + ']'
+
+
+def _to_lucene(sequence) -> str:
+    """
+        Translates patterns, that only match alphanumeric characters,
+        so every match lies within one token. The result is wrapped into
+        `.*` on both sides, as Lucene matches the whole term. Even the
+        word boundaries keep the padding, as `\\b` may be a `TOKEN_JOINERS`
+        character inside of a token, like in "foo.bar" or "foo's".
+        Those are checked by the verification of the candidates.
+    """
+    c = sre_constants
+    nodes = list(sequence)
+    if nodes and nodes[0] == (c.AT, c.AT_BOUNDARY):
+        nodes = nodes[1:]
+    if nodes and nodes[-1] == (c.AT, c.AT_BOUNDARY):
+        nodes = nodes[:-1]
+    if not nodes:
+        raise ValueError('the pattern is empty')
+    return '.*' + _lucene_body(nodes) + '.*'
+
+
+def _lucene_body(sequence) -> str:
+    c = sre_constants
+    parts = list()
+    for op, av in sequence:
+        if op == c.LITERAL:
+            if not _is_term_char(chr(av)):
+                raise ValueError(f'{chr(av)!r} separates tokens')
+            parts.append(chr(av).lower())
+        elif op == c.IN:
+            parts.append(_lucene_set(av))
+        elif op == c.CATEGORY and av == c.CATEGORY_DIGIT:
+            parts.append('[0-9]')
+        elif op == c.SUBPATTERN:
+            parts.append('(' + _lucene_body(av[-1]) + ')')
+        elif op in (c.MAX_REPEAT, c.MIN_REPEAT, getattr(c, 'POSSESSIVE_REPEAT', None)):
+            min_count, max_count, inner = av
+            body = _lucene_body(inner)
+            if not _is_atom(inner):
+                body = f'({body})'
+            parts.append(body + _quantifier(min_count, max_count))
+        elif op == c.BRANCH:
+            parts.append('(' + '|'.join(_lucene_body(b) for b in av[1]) + ')')
+        else:
+            raise ValueError(f'{op} has no term-level equivalent')
+    return ''.join(parts)
+
+
+def _splits_tokens(op, av) -> bool:
+    """ Checks, if a node can only match characters, that end tokens. """
+    c = sre_constants
+    if op == c.LITERAL:
+        ch = chr(av)
+        return not ch.isalnum() and ch not in TOKEN_JOINERS
+    elif op == c.AT:
+        return av in (c.AT_BEGINNING, c.AT_BEGINNING_STRING, c.AT_END, c.AT_END_STRING)
+    elif op == c.CATEGORY:
+        return av == c.CATEGORY_SPACE
+    elif op == c.IN:
+        return all(_splits_tokens(*item) for item in av)
+    return False
+
+
+def _lucene_terms(sequence) -> List[str]:
+    """
+        Collects the mandatory alphanumeric literals of the pattern, like
+        the random word in `\\d{2}/\\d{2}/\\d{4} word`, into `regexp` queries.
+        Literals, that may continue a longer token, are padded with `.*`.
+    """
+    nodes = list(sequence)
+    terms = list()
+    i = 0
+    while i < len(nodes):
+        op, av = nodes[i]
+        if op != sre_constants.LITERAL or not _is_term_char(chr(av)):
+            i += 1
+            continue
+        j = i
+        while j < len(nodes) and nodes[j][0] == sre_constants.LITERAL and _is_term_char(chr(nodes[j][1])):
+            j += 1
+        word = ''.join(chr(av).lower() for _, av in nodes[i:j])
+        left_closed = i > 0 and _splits_tokens(*nodes[i - 1])
+        right_closed = j < len(nodes) and _splits_tokens(*nodes[j])
+        if len(word) >= MIN_TERM_LENGTH or (word and left_closed and right_closed):
+            terms.append(('' if left_closed else '.*') +
+                         word + ('' if right_closed else '.*'))
+        i = j
+    return terms
@@ -1,13 +1,27 @@
 import os
+import sys
 import hashlib
-from dataclasses import dataclass
+from array import array
+from dataclasses import dataclass, field
+from typing import List, Optional, Sequence, Iterable, Generator, Tuple
 
+# Sections of one document get consecutive IDs starting from `parent_id * MAX_SECTIONS_PER_TEXT`,
+# so search results can be mapped back to parents without extra lookups.
+MAX_SECTIONS_PER_TEXT = 1 << 16
 
-@dataclass
+# Without `__dict__` every object is a few times smaller,
+# but `slots` are only supported by `dataclass` since Python 3.10.
+_dataclass_options = {'slots': True} if sys.version_info >= (3, 10) else {}
+
+
+@dataclass(**_dataclass_options)
 class Text:
     _id: int = -1
     content: str = ''
 
+    def to_dict(self) -> dict:
+        return {'_id': self._id, 'content': self.content}
+
     @staticmethod
     def from_file(path: str, _id: int = None):
         text = Text()
@@ -21,6 +35,191 @@ class Text:
         return text
 
 
-@dataclass
+@dataclass(**_dataclass_options)
+class TextSection(Text):
+    """
+        A part of a bigger document. Stored just like any other `Text`,
+        but its parent and position are encoded in the `_id`.
+    """
+
+    @staticmethod
+    def make(parent_id: int, section: int, content: str):
+        return TextSection(section_id(parent_id, section), content)
+
+    @property
+    def parent_id(self) -> int:
+        return self._id // MAX_SECTIONS_PER_TEXT
+
+    @property
+    def section(self) -> int:
+        return self._id % MAX_SECTIONS_PER_TEXT
+
+
+def trim_text(text: Optional[Text], include_text=True, max_length: Optional[int] = None) -> Optional[Text]:
+    if text is None or (include_text and max_length is None):
+        return text
+    return Text(text._id, text.content[:max_length] if include_text else '')
+
+
+def snippet_start(match_start: int, snippet_length: int) -> int:
+    """ Snippets start `snippet_length / 2` characters before the match. """
+    return max(0, match_start - snippet_length // 2)
+
+
+def make_snippet(content: str, match_start: int, snippet_length: int) -> str:
+    start = snippet_start(match_start, snippet_length)
+    return content[start:start + snippet_length]
+
+
+def section_id(parent_id: int, section: int) -> int:
+    if section >= MAX_SECTIONS_PER_TEXT:
+        raise ValueError(
+            f'Document {parent_id} has over {MAX_SECTIONS_PER_TEXT} sections')
+    return int(parent_id) * MAX_SECTIONS_PER_TEXT + section
+
+
+@dataclass(**_dataclass_options)
 class TextMatch(Text):
     rating: float = 1
+    # Indexes of matched sections, if the match was collapsed into a parent.
+    sections: List[int] = field(default_factory=list)
+    # Character offsets `(start, end)` of the matches within `content`, if known.
+    spans: List[Tuple[int, int]] = field(default_factory=list)
+    # Windows of `content` around the matches, if only those were requested.
+    snippets: List[str] = field(default_factory=list)
+
+
+def collapse_sections(matches: Sequence[TextMatch]) -> List[TextMatch]:
+    """
+        Merges matches of sections imported with `sections=True` into matches
+        of their parent documents, keeping the order of first appearances.
+        Ratings are summed up, the content and `spans` of the first matched
+        section are kept, while the `snippets` of all of them are joined.
+    """
+    parents = dict()
+    for m in matches:
+        parent_id = m._id // MAX_SECTIONS_PER_TEXT
+        section = m._id % MAX_SECTIONS_PER_TEXT
+        parent = parents.get(parent_id, None)
+        if parent is None:
+            parents[parent_id] = TextMatch(
+                _id=parent_id,
+                content=m.content,
+                rating=m.rating,
+                sections=[section],
+                spans=list(m.spans),
+                snippets=list(m.snippets),
+            )
+        else:
+            parent.rating += m.rating
+            parent.sections.append(section)
+            parent.snippets.extend(m.snippets)
+    return list(parents.values())
+
+
+class TextBatch(object):
+    """
+        Columnar alternative to a list of `Text` objects for ingestion paths.
+        IDs are kept in a 64-bit integer array, contents - in one UTF-8
+        buffer, where the i-th document spans `offsets[i]:offsets[i+1]`.
+        Cheap to pickle between processes and backends can serialize
+        it without creating an object per document.
+    """
+    __slots__ = ['ids', 'buffer', 'offsets']
+
+    def __init__(self, ids: array = None, buffer: bytearray = None, offsets: array = None):
+        self.ids = ids if ids is not None else array('q')
+        self.buffer = buffer if buffer is not None else bytearray()
+        self.offsets = offsets if offsets is not None else array('q', [0])
+
+    @staticmethod
+    def from_texts(texts: Iterable[Text]):
+        batch = TextBatch()
+        for t in texts:
+            batch.append(t._id, t.content)
+        return batch
+
+    def append(self, _id: int, content: str):
+        self.append_encoded(_id, content.encode('utf-8'))
+
+    def append_encoded(self, _id: int, content: bytes):
+        self.ids.append(_id)
+        self.buffer += content
+        self.offsets.append(len(self.buffer))
+
+    def extend(self, other, start: int = 0, end: int = None):
+        """ Appends the `[start, end)` range of documents from another batch. """
+        end = len(other) if end is None else end
+        if start >= end:
+            return
+        first = other.offsets[start]
+        shift = len(self.buffer) - first
+        self.ids.extend(other.ids[start:end])
+        self.buffer += other.buffer[first:other.offsets[end]]
+        self.offsets.extend(o + shift for o in other.offsets[start+1:end+1])
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def encoded(self, i: int) -> memoryview:
+        if i < 0:
+            i += len(self)
+        return memoryview(self.buffer)[self.offsets[i]:self.offsets[i+1]]
+
+    def content(self, i: int) -> str:
+        return str(self.encoded(i), 'utf-8')
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            start, end, step = i.indices(len(self))
+            assert step == 1, 'Only contiguous slices are supported'
+            part = TextBatch()
+            part.extend(self, start, end)
+            return part
+        if i < 0:
+            i += len(self)
+        return Text(self.ids[i], self.content(i))
+
+    def __iter__(self) -> Generator[Text, None, None]:
+        for i in range(len(self)):
+            yield Text(self.ids[i], self.content(i))
+
+    def items(self) -> Generator[Tuple[int, str], None, None]:
+        for i in range(len(self)):
+            yield self.ids[i], self.content(i)
+
+    def without_empty(self):
+        if all(self.offsets[i] != self.offsets[i+1] for i in range(len(self))):
+            return self
+        result = TextBatch()
+        for i in range(len(self)):
+            if self.offsets[i] != self.offsets[i+1]:
+                result.append_encoded(self.ids[i], self.encoded(i))
+        return result
+
+    def split(self, size: int) -> Generator[object, None, None]:
+        if len(self) <= size:
+            yield self
+            return
+        for start in range(0, len(self), size):
+            yield self[start:start+size]
+
+
+def rechunk_batches(batches: Iterable[TextBatch], size: int) -> Generator[TextBatch, None, None]:
+    """ Merges or splits incoming batches into ones of exactly `size` documents, except the last. """
+    pending = TextBatch()
+    for batch in batches:
+        start = 0
+        while start < len(batch):
+            if len(pending) == 0 and (len(batch) - start) >= size:
+                yield batch[start:start+size] if (start or len(batch) > size) else batch
+                start += size
+                continue
+            taken = min(size - len(pending), len(batch) - start)
+            pending.extend(batch, start, start + taken)
+            start += taken
+            if len(pending) == size:
+                yield pending
+                pending = TextBatch()
+    if len(pending):
+        yield pending
@@ -0,0 +1,335 @@
+import zlib
+from typing import List, Optional, Dict, Generator, Set, Tuple, Sequence, Iterable
+try:
+    from re import _parser as sre_parse
+    from re import _constants as sre_constants
+except ImportError:
+    import sre_parse
+    import sre_constants
+
+# Queries are nested tuples, so they are cheap to build, hash and compare:
+#   ('all',) - every document is a candidate,
+#   ('none',) - no document can match,
+#   ('trigram', 'abc') - documents containing the trigram,
+#   ('and', (...)) and ('or', (...)) - combinations of the above.
+QUERY_ALL = ('all',)
+QUERY_NONE = ('none',)
+
+# Limits on the sizes of string sets tracked during the analysis.
+# Bigger sets make more precise queries, but those take longer to evaluate.
+MAX_EXACT_STRINGS = 16
+MAX_SET_STRINGS = 32
+
+
+def trigrams(text: str) -> Set[str]:
+    """
+        Case-folded trigrams of a document.
+        The same folding is applied to queries, so case-sensitive searches
+        get a superset of candidates, later narrowed by verification.
+    """
+    text = text.lower()
+    return {text[i:i+3] for i in range(len(text) - 2)}
+
+
+def trigram_hash(trigram: str) -> int:
+    """ Stable across processes, unlike `hash()`, and fits into a signed 32-bit integer. """
+    return zlib.crc32(trigram.encode('utf-8')) & 0x7FFFFFFF
+
+
+def trigram_hashes(text: str) -> List[int]:
+    return sorted({trigram_hash(t) for t in trigrams(text)})
+
+
+def query_trigram(trigram: str) -> tuple:
+    return ('trigram', trigram)
+
+
+def query_and(*queries) -> tuple:
+    args = list()
+    for q in queries:
+        if q == QUERY_NONE:
+            return QUERY_NONE
+        elif q == QUERY_ALL:
+            continue
+        elif q[0] == 'and':
+            args.extend(a for a in q[1] if a not in args)
+        elif q not in args:
+            args.append(q)
+    if len(args) == 0:
+        return QUERY_ALL
+    if len(args) == 1:
+        return args[0]
+    return ('and', tuple(args))
+
+
+def query_or(*queries) -> tuple:
+    args = list()
+    for q in queries:
+        if q == QUERY_ALL:
+            return QUERY_ALL
+        elif q == QUERY_NONE:
+            continue
+        elif q[0] == 'or':
+            args.extend(a for a in q[1] if a not in args)
+        elif q not in args:
+            args.append(q)
+    if len(args) == 0:
+        return QUERY_NONE
+    if len(args) == 1:
+        return args[0]
+    return ('or', tuple(args))
+
+
+def query_for_string(s: str) -> tuple:
+    if len(s) < 3:
+        return QUERY_ALL
+    return query_and(*[query_trigram(t) for t in sorted(trigrams(s))])
+
+
+def query_for_strings(strings: Iterable[str]) -> tuple:
+    return query_or(*[query_for_string(s) for s in sorted(strings)])
+
+# region Regex Analysis
+#
+# Follows "Regular Expression Matching with a Trigram Index" by Russ Cox.
+# Every sub-expression is summarized by: whether it can match an empty string,
+# the exact set of strings it matches (if small), the sets of prefixes and
+# suffixes of its matches and a trigram query that every match satisfies.
+# https://swtch.com/~rsc/regexp/regexp4.html
+
+
+class _Info(object):
+    __slots__ = ['emptyable', 'exact', 'prefix', 'suffix', 'match']
+
+    def __init__(self, emptyable, exact=None, prefix=None, suffix=None, match=QUERY_ALL):
+        self.emptyable = emptyable
+        self.exact = exact
+        self.prefix = prefix if prefix is not None else {''}
+        self.suffix = suffix if suffix is not None else {''}
+        self.match = match
+
+
+def _cross(lefts: Set[str], rights: Set[str]) -> Set[str]:
+    return {l + r for l in lefts for r in rights}
+
+
+def _info_empty() -> _Info:
+    return _Info(emptyable=True, exact={''})
+
+
+def _info_any() -> _Info:
+    return _Info(emptyable=False)
+
+
+def _info_unknown() -> _Info:
+    return _Info(emptyable=True)
+
+
+def _info_chars(chars: Set[str]) -> _Info:
+    if len(chars) == 0 or len(chars) > MAX_EXACT_STRINGS:
+        return _info_any()
+    return _Info(emptyable=False, exact={c.lower() for c in chars})
+
+
+def _demote(info: _Info) -> _Info:
+    """ Replaces the exact set with prefixes, suffixes and the trigram query. """
+    if info.exact is None:
+        return info
+    return _Info(
+        emptyable=info.emptyable,
+        prefix=info.exact,
+        suffix=info.exact,
+        match=query_and(info.match, query_for_strings(info.exact)),
+    )
+
+
+def _simplify(info: _Info) -> _Info:
+    if info.exact is not None:
+        if len(info.exact) <= MAX_EXACT_STRINGS:
+            return info
+        info = _demote(info)
+
+    # Before trimming sets to shorter strings, save their trigrams.
+    for length in (2, 1, 0):
+        if len(info.prefix) <= MAX_SET_STRINGS:
+            break
+        info.match = query_and(info.match, query_for_strings(info.prefix))
+        info.prefix = {s[:length] for s in info.prefix}
+    for length in (2, 1, 0):
+        if len(info.suffix) <= MAX_SET_STRINGS:
+            break
+        info.match = query_and(info.match, query_for_strings(info.suffix))
+        info.suffix = {s[len(s)-length:] for s in info.suffix}
+    return info
+
+
+def _concat(left: _Info, right: _Info) -> _Info:
+    match = query_and(left.match, right.match)
+    if left.exact is not None and right.exact is not None:
+        return _simplify(_Info(
+            emptyable=left.emptyable and right.emptyable,
+            exact=_cross(left.exact, right.exact),
+            match=match,
+        ))
+
+    left_ends = left.exact if left.exact is not None else left.suffix
+    right_starts = right.exact if right.exact is not None else right.prefix
+    return _simplify(_Info(
+        emptyable=left.emptyable and right.emptyable,
+        prefix=_cross(left.exact, right.prefix) if left.exact is not None else left.prefix,
+        suffix=_cross(left.suffix, right.exact) if right.exact is not None else right.suffix,
+        match=query_and(match, query_for_strings(
+            _cross(left_ends, right_starts))),
+    ))
+
+
+def _alternate(left: _Info, right: _Info) -> _Info:
+    if left.exact is not None and right.exact is not None:
+        return _simplify(_Info(
+            emptyable=left.emptyable or right.emptyable,
+            exact=left.exact | right.exact,
+            match=query_or(left.match, right.match),
+        ))
+    left = _demote(left)
+    right = _demote(right)
+    return _simplify(_Info(
+        emptyable=left.emptyable or right.emptyable,
+        prefix=left.prefix | right.prefix,
+        suffix=left.suffix | right.suffix,
+        match=query_or(left.match, right.match),
+    ))
+
+
+def _repeat(info: _Info, min_count: int, max_count: int) -> _Info:
+    if min_count == 0:
+        if max_count == 1:
+            return _alternate(info, _info_empty())
+        return _info_unknown()
+    if min_count == max_count and min_count <= 3:
+        result = info
+        for _ in range(min_count - 1):
+            result = _concat(result, info)
+        return result
+    # At least one repetition is mandatory, but the count is unknown.
+    info = _demote(info)
+    return _Info(
+        emptyable=info.emptyable,
+        prefix=info.prefix,
+        suffix=info.suffix,
+        match=info.match,
+    )
+
+
+def _analyze_set(items) -> _Info:
+    chars = set()
+    for op, av in items:
+        if op == sre_constants.LITERAL:
+            chars.add(chr(av))
+        elif op == sre_constants.RANGE:
+            low, high = av
+            if high - low >= MAX_EXACT_STRINGS:
+                return _info_any()
+            chars.update(chr(c) for c in range(low, high + 1))
+        else:
+            # Negations and categories like `\d` or `\w`.
+            return _info_any()
+    return _info_chars(chars)
+
+
+def _analyze_sequence(sequence) -> _Info:
+    result = _info_empty()
+    for op, av in sequence:
+        result = _concat(result, _analyze_node(op, av))
+    return result
+
+
+def _analyze_node(op, av) -> _Info:
+    c = sre_constants
+    if op == c.LITERAL:
+        return _info_chars({chr(av)})
+    elif op in (c.NOT_LITERAL, c.ANY, c.CATEGORY):
+        return _info_any()
+    elif op == c.IN:
+        return _analyze_set(av)
+    elif op == c.BRANCH:
+        branches = [_analyze_sequence(b) for b in av[1]]
+        result = branches[0]
+        for b in branches[1:]:
+            result = _alternate(result, b)
+        return result
+    elif op == c.SUBPATTERN:
+        return _analyze_sequence(av[-1])
+    elif op in (c.MAX_REPEAT, c.MIN_REPEAT, getattr(c, 'POSSESSIVE_REPEAT', None)):
+        min_count, max_count, sequence = av
+        return _repeat(_analyze_sequence(sequence), min_count, max_count)
+    elif op == getattr(c, 'ATOMIC_GROUP', None):
+        return _analyze_sequence(av)
+    elif op == c.GROUPREF_EXISTS:
+        _, yes, no = av
+        return _alternate(
+            _analyze_sequence(yes),
+            _analyze_sequence(no) if no else _info_empty(),
+        )
+    elif op in (c.AT, c.ASSERT, c.ASSERT_NOT):
+        # Anchors and lookarounds don't consume characters.
+        return _info_empty()
+    return _info_unknown()
+
+
+def regex_to_trigram_query(pattern: str) -> tuple:
+    """
+        Returns the trigram query, that every document matching
+        the `pattern` must satisfy, regardless of letter case.
+        For example, `hello|world` becomes `(ell AND hel AND llo) OR (orl AND ...)`.
+    """
+    info = _analyze_sequence(sre_parse.parse(pattern))
+    if info.exact is not None:
+        return query_and(info.match, query_for_strings(info.exact))
+    return query_and(
+        info.match,
+        query_for_strings(info.prefix),
+        query_for_strings(info.suffix),
+    )
+
+
+def format_trigram_query(query: tuple) -> str:
+    """ Renders a query for humans, like `(ell AND hel) OR orl`. """
+    kind = query[0]
+    if kind == 'trigram':
+        return query[1]
+    elif kind in ('all', 'none'):
+        return kind.upper()
+    joiner = ' AND ' if kind == 'and' else ' OR '
+    return '(' + joiner.join(map(format_trigram_query, query[1])) + ')'
+
+
+def evaluate_trigram_query(query: tuple, postings: Dict[str, Set[int]], universe: Set[int]) -> Set[int]:
+    """
+        Intersects and merges posting lists, starting from the shortest ones.
+    """
+    kind = query[0]
+    if kind == 'all':
+        return set(universe)
+    elif kind == 'none':
+        return set()
+    elif kind == 'trigram':
+        return set(postings.get(query[1], ()))
+    elif kind == 'or':
+        result = set()
+        for q in query[1]:
+            result |= evaluate_trigram_query(q, postings, universe)
+        return result
+
+    # Plain trigrams are cheap to size up, so intersect those first.
+    leaves = sorted(
+        [q for q in query[1] if q[0] == 'trigram'],
+        key=lambda q: len(postings.get(q[1], ())),
+    )
+    nested = [q for q in query[1] if q[0] != 'trigram']
+    result = None
+    for q in leaves + nested:
+        ids = evaluate_trigram_query(q, postings, universe)
+        result = ids if result is None else (result & ids)
+        if not result:
+            break
+    return result if result is not None else set(universe)
@@ -0,0 +1,89 @@
+import re
+import concurrent.futures
+from typing import List, Optional, Dict, Generator, Set, Tuple, Sequence
+
+from PyStorageHelpers.Text import TextMatch, make_snippet
+
+# Batches with less content are verified in the calling thread,
+# as sending them to other processes costs more, than matching.
+PARALLEL_VERIFICATION_MIN_CHARS = 4 * 1024 * 1024
+
+
+def compile_query(query: str, is_regex: bool, case_sensitive: bool = True) -> re.Pattern:
+    if not is_regex:
+        query = re.escape(query)
+    return re.compile(query, 0 if case_sensitive else re.IGNORECASE)
+
+
+def find_spans(pattern: re.Pattern, content: str, max_spans: Optional[int] = None) -> List[Tuple[int, int]]:
+    """ Character offsets of non-overlapping matches, like `re.finditer`. """
+    spans = list()
+    for m in pattern.finditer(content):
+        spans.append(m.span())
+        if max_spans and len(spans) >= max_spans:
+            break
+    return spans
+
+
+def find_spans_many(pattern: str, flags: int, contents: Sequence[str], max_spans: Optional[int] = None) -> List[List[Tuple[int, int]]]:
+    """ Picklable entry point for worker processes. """
+    compiled = re.compile(pattern, flags)
+    return [find_spans(compiled, c, max_spans=max_spans) for c in contents]
+
+
+def add_snippets(matches: Sequence[TextMatch], pattern: re.Pattern, snippet_length: int) -> List[TextMatch]:
+    """
+        Replaces the `content` of every match with a window around the first
+        occurrence of the `pattern`, for backends, that can't do it on the server.
+    """
+    for m in matches:
+        found = pattern.search(m.content)
+        if found is not None:
+            m.spans = [found.span()]
+            m.snippets = [make_snippet(m.content, found.start(), snippet_length)]
+        m.content = ''
+    return list(matches)
+
+
+def verify_matches(
+    matches: Sequence[TextMatch],
+    pattern: re.Pattern,
+    executor: Optional[concurrent.futures.Executor] = None,
+    max_spans: Optional[int] = None,
+    processes: int = 1,
+) -> List[TextMatch]:
+    """
+        Drops the matches, which `content` doesn't actually match the `pattern`,
+        and fills `spans` of the others. Heavy batches are split between
+        `processes` jobs of the `executor`, only contents are sent there.
+    """
+    contents = [m.content for m in matches]
+    total_chars = sum(map(len, contents))
+    if executor is None or processes <= 1 or total_chars < PARALLEL_VERIFICATION_MIN_CHARS:
+        spans_per_match = find_spans_many(
+            pattern.pattern, pattern.flags, contents, max_spans=max_spans)
+    else:
+        # Balance the jobs by the number of characters, not documents.
+        jobs = list()
+        job = list()
+        job_chars = 0
+        for c in contents:
+            job.append(c)
+            job_chars += len(c)
+            if job_chars >= total_chars / processes:
+                jobs.append(job)
+                job = list()
+                job_chars = 0
+        if job:
+            jobs.append(job)
+        futures = [executor.submit(find_spans_many, pattern.pattern, pattern.flags, job, max_spans)
+                   for job in jobs]
+        spans_per_match = [s for f in futures for s in f.result()]
+
+    verified = list()
+    for m, spans in zip(matches, spans_per_match):
+        if not spans:
+            continue
+        m.spans = spans
+        verified.append(m)
+    return verified
@@ -5,3 +5,6 @@ from PyStorageHelpers.GraphDegree import *
 from PyStorageHelpers.Text import *
 from PyStorageHelpers.Algorithms import *
 from PyStorageHelpers.Parsing import *
+from PyStorageHelpers.Trigrams import *
+from PyStorageHelpers.Verification import *
+from PyStorageHelpers.Regex import *
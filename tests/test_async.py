@@ -0,0 +1,249 @@
+import copy
+import asyncio
+
+import bson
+import pytest
+
+import PyStorageTexts.Registry as Registry
+from PyStorageHelpers import *
+
+mongomock = pytest.importorskip('mongomock')
+pytest.importorskip('elasticsearch')
+
+
+# region Stand-in Servers
+
+
+class AsyncCursor(object):
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def batch_size(self, size: int):
+        return self
+
+    def limit(self, count: int):
+        self.cursor = self.cursor.limit(count)
+        return self
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self.cursor)
+        except StopIteration:
+            raise StopAsyncIteration
+
+    async def close(self):
+        pass
+
+
+def decoded(doc) -> dict:
+    return bson.decode(doc.raw) if hasattr(doc, 'raw') else doc
+
+
+class AsyncCollection(object):
+    """ Motor-like coroutines over a `mongomock` collection. """
+
+    def __init__(self, collection):
+        self.collection = collection
+
+    def find(self, *args, **kwargs):
+        return AsyncCursor(self.collection.find(*args, **kwargs))
+
+    async def insert_many(self, docs, ordered=True, **kwargs):
+        return self.collection.insert_many([decoded(d) for d in docs], ordered=ordered)
+
+    async def bulk_write(self, requests, ordered=True, **kwargs):
+        cnt = 0
+        for op in requests:
+            doc = decoded(op._doc)
+            self.collection.replace_one({'_id': doc['_id']}, doc, upsert=True)
+            cnt += 1
+        return type('Result', (), {'upserted_count': cnt, 'matched_count': 0})()
+
+    def __getattr__(self, name: str):
+        method = getattr(self.collection, name)
+
+        async def call(*args, **kwargs):
+            return method(*args, **kwargs)
+        return call
+
+
+class AsyncMongoClient(object):
+
+    def __init__(self, address: str, pool_size=None):
+        self.client = mongomock.MongoClient()
+        self.closed = False
+
+    def __getitem__(self, db_name: str):
+        db = self.client[db_name]
+        return type('Database', (), {'__getitem__': lambda _, name: AsyncCollection(db[name])})()
+
+    def close(self):
+        self.closed = True
+
+
+class AsyncIndices(object):
+
+    async def exists(self, **kwargs):
+        return True
+
+    async def create(self, **kwargs):
+        pass
+
+    async def put_settings(self, **kwargs):
+        pass
+
+    async def refresh(self, **kwargs):
+        pass
+
+
+class AsyncElasticClient(object):
+    """
+        Returns every stored document as a candidate of any query,
+        so only the verification can drop the false positives.
+    """
+
+    def __init__(self, address: str, pool_size=None):
+        self.docs = dict()
+        self.queries = list()
+        self.indices = AsyncIndices()
+        self.closed = False
+
+    def hits(self, body: dict) -> list:
+        hits = [{'_id': str(i), '_source': {'content': c}, '_score': 1.0, 'sort': [1.0, i]}
+                for i, c in sorted(self.docs.items())]
+        if 'search_after' in body:
+            hits = [h for h in hits if h['sort'][1] > body['search_after'][1]]
+        return copy.deepcopy(hits[body.get('from', 0):][:body.get('size', 10)])
+
+    async def search(self, index=None, body=None):
+        self.queries.append(body['query'])
+        return {'hits': {'hits': self.hits(body)}}
+
+    async def get(self, index=None, id=None, ignore=None):
+        if id not in self.docs:
+            return {'found': False}
+        return {'found': True, '_id': str(id), '_source': {'content': self.docs[id]}}
+
+    async def open_point_in_time(self, **kwargs):
+        return {'id': 'pit'}
+
+    async def close_point_in_time(self, **kwargs):
+        pass
+
+    async def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def stand_ins(monkeypatch):
+    monkeypatch.setitem(Registry.CLIENT_FACTORIES, 'motor', AsyncMongoClient)
+    monkeypatch.setitem(Registry.CLIENT_FACTORIES, 'elasticsearch_async', AsyncElasticClient)
+    Registry.forget_clients()
+    yield
+    Registry.forget_clients()
+
+
+def make_elastic(url='http://localhost:9200/test', **kwargs):
+    from PyStorageTexts.ElasticSearchAsync import ElasticSearchAsync
+    db = ElasticSearchAsync(url=url, **kwargs)
+    db.elastic.docs.update({1: 'foo bar', 2: 'food', 3: 'bar foo.baz', 4: 'Bar 42'})
+    return db
+
+
+def ids_of(matches) -> list:
+    return sorted(m._id for m in matches)
+
+# region ElasticSearch
+
+
+def test_elastic_regex_is_translated_and_verified(stand_ins):
+    db = make_elastic()
+
+    async def run():
+        assert ids_of(await db.find_regex(r'\bfoo\b')) == [1, 3]
+        assert ids_of(await db.find_regex(r'^bar')) == [3]
+        assert ids_of(await db.find_regex(r'^bar', case_sensitive=False)) == [3, 4]
+        assert ids_of(await db.find_regex(r'\d+')) == [4]
+        assert ids_of(await db.find_regex(r'fo+d', max_matches=1)) == [2]
+        return db.elastic.queries
+
+    queries = asyncio.run(run())
+    regexps = [q['bool']['must'][0]['regexp']['content']['value']
+               for q in queries if 'bool' in q]
+    assert '.*foo.*' in regexps
+
+
+def test_elastic_batches_match_single_queries(stand_ins):
+    db = make_elastic(page_size=2)
+    queries = [r'\bfoo\b', 'bar', r'\d']
+
+    async def run():
+        batched = await db.find_regex_many(queries)
+        single = [await db.find_regex(q) for q in queries]
+        return batched, single
+
+    batched, single = asyncio.run(run())
+    assert list(map(ids_of, batched)) == list(map(ids_of, single)) == [[1, 3], [1, 3], [4]]
+
+
+def test_elastic_scans_need_to_be_allowed(stand_ins):
+    with pytest.raises(ValueError, match='allow_scan'):
+        asyncio.run(make_elastic().find_regex(r'\d+ \d+'))
+    db = make_elastic(allow_scan=True)
+    assert ids_of(asyncio.run(db.find_regex(r'r \d+'))) == [4]
+
+
+def test_elastic_get_many(stand_ins):
+    db = make_elastic()
+    texts = asyncio.run(db.get_many([2, 7, 1], max_length=3))
+    assert [t and (t._id, t.content) for t in texts] == [(2, 'foo'), None, (1, 'foo')]
+
+
+def test_elastic_shares_and_releases_clients(stand_ins):
+    first = make_elastic('http://localhost:9200/first')
+    second = make_elastic('http://localhost:9200/second')
+    assert first.elastic is second.elastic
+    asyncio.run(first.close())
+    assert not first.elastic.closed
+    asyncio.run(second.close())
+    assert second.elastic.closed
+
+
+def test_sync_helpers_are_blocked(stand_ins):
+    db = make_elastic()
+    with pytest.raises(TypeError):
+        db.add_batches([Text(1, 'foo')])
+
+# region MongoDB
+
+
+def test_mongo_roundtrip(stand_ins):
+    from PyStorageTexts.MongoDBAsync import MongoDBAsync
+    db = MongoDBAsync(url='mongodb://localhost:27017/test')
+    texts = [Text(i, f'document number {i}') for i in range(10)]
+
+    async def run():
+        async with db:
+            assert await db.add_stream(texts) == 10
+            assert await db.count_texts() == 10
+            assert ids_of(await db.find_regex(r'number [3-5]')) == [3, 4, 5]
+            assert list(map(ids_of, await db.find_regex_many(['r 1', 'r [89]']))) == [[1], [8, 9]]
+            found = await db.get_many([4, 42], include_text=False)
+            assert found[0]._id == 4 and found[0].content == '' and found[1] is None
+            async with db.bulk_load():
+                assert await db.add(Text(10, 'late number 10'))
+            assert await db.count_texts() == 11
+
+    asyncio.run(run())
+    assert db.db.closed
+
+
+def test_mongo_regex_reads_create_indexes(stand_ins):
+    from PyStorageTexts.MongoDBAsync import MongoDBAsync
+    db = MongoDBAsync(url='mongodb://localhost:27017/test')
+    assert asyncio.run(db.find_regex('anything')) == []
+    assert db.indexes_ready
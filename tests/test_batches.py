@@ -0,0 +1,76 @@
+import asyncio
+import threading
+
+import pytest
+
+from PyStorageTexts.BaseAPI import BaseAPI
+from PyStorageTexts.BaseAsyncAPI import BaseAsyncAPI
+from PyStorageHelpers import *
+
+
+class Memory(BaseAPI):
+    """ Fails to write the batches, that contain any of the `failing` IDs. """
+    __max_batch_size__ = 2
+    __max_writers__ = 4
+
+    def __init__(self, failing=()):
+        BaseAPI.__init__(self)
+        self.contents = dict()
+        self.failing = set(failing)
+        self.lock = threading.Lock()
+
+    def add(self, one_or_many_texts, upsert=True) -> int:
+        texts = list(one_or_many_texts)
+        if any(t._id in self.failing for t in texts):
+            raise ConnectionError('server is down')
+        with self.lock:
+            self.contents.update((t._id, t.content) for t in texts)
+        return len(texts)
+
+    def add_stream(self, stream, upsert=False, **kwargs) -> int:
+        return super().add_stream(stream, upsert=upsert, **kwargs)
+
+
+class MemoryAsync(BaseAsyncAPI):
+    __max_batch_size__ = 2
+
+    def __init__(self, failing=()):
+        self.contents = dict()
+        self.failing = set(failing)
+
+    async def add(self, one_or_many_texts, upsert=True) -> int:
+        texts = list(one_or_many_texts)
+        await asyncio.sleep(0)
+        if any(t._id in self.failing for t in texts):
+            raise ConnectionError('server is down')
+        self.contents.update((t._id, t.content) for t in texts)
+        return len(texts)
+
+
+def texts(count: int) -> list:
+    return [Text(i, f'text {i}') for i in range(count)]
+
+
+@pytest.mark.parametrize('writers', [1, 4])
+def test_add_stream_counts_writes(writers: int):
+    db = Memory()
+    assert db.add_stream(texts(9), writers=writers) == 9
+    assert sorted(db.contents) == list(range(9))
+    assert list(db.add_batches(texts(5), ordered=True)) == [2, 2, 1]
+
+
+@pytest.mark.parametrize('writers', [1, 4])
+def test_add_stream_raises_after_draining(writers: int):
+    db = Memory(failing={4})
+    with pytest.raises(ConnectionError):
+        db.add_stream(texts(100), writers=writers)
+    # Reading stops after the failure, but started batches are finished.
+    assert 4 not in db.contents and len(db.contents) < 100
+
+
+def test_async_add_stream_raises_after_draining():
+    db = MemoryAsync(failing={4})
+    with pytest.raises(ConnectionError):
+        asyncio.run(db.add_stream(texts(100)))
+    assert 4 not in db.contents and len(db.contents) < 100
+    assert asyncio.run(MemoryAsync().add_stream(texts(9))) == 9
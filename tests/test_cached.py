@@ -0,0 +1,37 @@
+import pytest
+
+from PyStorageTexts.Cached import Cached
+from PyStorageTexts.SuffixArray import SuffixArray
+from PyStorageHelpers import *
+
+
+def test_hits_are_independent_copies():
+    db = Cached(SuffixArray())
+    db.add([Text(1, 'foo bar'), Text(2, 'bar')])
+    first = db.find_substring('bar', snippet_length=3)
+    first[0].rating = -1
+    first[0].snippets.append('changed')
+    second = db.find_substring('bar', snippet_length=3)
+    second[1].spans.clear()
+    third = db.find_substring('bar', snippet_length=3)
+    assert db.hits == 2
+    assert third == db.backend.find_substring('bar', snippet_length=3)
+    assert all(a is not b for a, b in zip(second, third))
+
+
+@pytest.mark.parametrize('invalidation', ['conservative', 'precise'])
+def test_results_older_than_writes_are_not_cached(invalidation: str):
+    db = Cached(SuffixArray(), invalidation=invalidation)
+    db.add(Text(1, 'foo'))
+    find_substring = db.backend.find_substring
+
+    def racing_find_substring(*args, **kwargs):
+        # A write lands between the backend query and storing its results.
+        matches = find_substring(*args, **kwargs)
+        db.backend.find_substring = find_substring
+        db.add(Text(2, 'foo too'))
+        return matches
+
+    db.backend.find_substring = racing_find_substring
+    assert [m._id for m in db.find_substring('foo')] == [1]
+    assert sorted(m._id for m in db.find_substring('foo')) == [1, 2]
@@ -0,0 +1,372 @@
+import re
+import copy
+import json
+import time
+import threading
+
+import pytest
+
+import PyStorageTexts.Registry as Registry
+from PyStorageHelpers import *
+
+pytest.importorskip('elasticsearch')
+
+
+# region Stand-in Server
+
+
+class Indices(object):
+
+    def __init__(self):
+        self.settings = dict()
+        self.refreshes = 0
+        self.blocked = None
+
+    def exists(self, *args, **kwargs):
+        return True
+
+    def create(self, *args, **kwargs):
+        pass
+
+    def delete(self, *args, **kwargs):
+        pass
+
+    def refresh(self, *args, **kwargs):
+        if self.blocked is not None:
+            self.blocked.wait()
+        self.refreshes += 1
+
+    def put_settings(self, index=None, body=None):
+        self.settings.update(body['index'])
+
+    def get_settings(self, index=None):
+        return {index: {'settings': {'index': dict(self.settings)}}}
+
+
+class ElasticClient(object):
+    """
+        Returns every stored document as a candidate of any query,
+        so only the verification can drop the false positives.
+        Contents are only returned, if the query asks for the `_source`.
+        Queries of `msearch` at positions listed in `failing` fail,
+        just like the exports of such slices and the bulk writes
+        of documents with `rejected` IDs.
+    """
+
+    def __init__(self, address: str, pool_size=None):
+        self.docs = dict()
+        self.bulk_bodies = list()
+        self.searches = list()
+        self.write_params = list()
+        self.failing = set()
+        self.rejected = set()
+        self.indices = Indices()
+        self.open_pits = 0
+        self.closed = False
+
+    def hits(self, body: dict) -> list:
+        source = body.get('_source', 'stored_fields' not in body)
+        hits = [{'_id': str(i), '_source': {'content': c if source else ''}, '_score': 1.0, 'sort': [1.0, i]}
+                for i, c in sorted(self.docs.items())]
+        if 'slice' in body:
+            hits = [h for h in hits if int(h['_id']) % body['slice']['max'] == body['slice']['id']]
+        if 'ids' in body.get('query', {}):
+            hits = [h for h in hits if int(h['_id']) in body['query']['ids']['values']]
+        if 'highlight' in body:
+            fragment_size = body['highlight']['fields']['content']['fragment_size']
+            for h in hits:
+                h['highlight'] = {'content': [self.docs[int(h['_id'])][:fragment_size]]}
+        if 'script_fields' in body:
+            max_length = body['script_fields']['content']['script']['params']['max_length']
+            for h in hits:
+                h['fields'] = {'content': [self.docs[int(h['_id'])][:max_length]]}
+        if 'search_after' in body:
+            hits = [h for h in hits if h['sort'][1] > body['search_after'][1]]
+        return copy.deepcopy(hits[body.get('from', 0):][:body.get('size', 10)])
+
+    def search(self, index=None, body=None, **kwargs):
+        self.searches.append(copy.deepcopy(body))
+        if body.get('slice', {}).get('id') in self.failing:
+            raise RuntimeError('Slice failed')
+        return {'hits': {'hits': self.hits(body)}}
+
+    def msearch(self, body=None, **kwargs):
+        return {'responses': [
+            {'error': {'type': 'search_phase_execution_exception'}} if i in self.failing
+            else {'hits': {'hits': self.hits(b)}}
+            for i, b in enumerate(body[1::2])
+        ]}
+
+    def mget(self, index=None, body=None, _source=True):
+        return {'docs': [
+            {'_id': str(i), 'found': True, '_source': {'content': self.docs[i] if _source else ''}}
+            if i in self.docs else {'_id': str(i), 'found': False}
+            for i in body['ids']
+        ]}
+
+    def index(self, index=None, id=None, body=None, **kwargs):
+        self.write_params.append(kwargs)
+        self.docs[id] = body['content']
+        return {'result': 'created'}
+
+    def bulk(self, index=None, body=None, **kwargs):
+        self.write_params.append(kwargs)
+        self.bulk_bodies.append(body)
+        lines = body.decode('utf-8').splitlines()
+        items = list()
+        for action, source in zip(lines[0::2], lines[1::2]):
+            op_type, meta = next(iter(json.loads(action).items()))
+            if meta['_id'] in self.rejected:
+                items.append({op_type: {'_id': str(meta['_id']), 'status': 400}})
+                continue
+            self.docs[meta['_id']] = json.loads(source)['content']
+            items.append({op_type: {'_id': str(meta['_id']), 'status': 201}})
+        return {'items': items}
+
+    def open_point_in_time(self, **kwargs):
+        self.open_pits += 1
+        return {'id': 'pit'}
+
+    def close_point_in_time(self, **kwargs):
+        self.open_pits -= 1
+
+    def count(self, **kwargs):
+        return {'count': len(self.docs)}
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def make_db(monkeypatch):
+    from PyStorageTexts.ElasticSearch import ElasticSearch
+    monkeypatch.setitem(Registry.CLIENT_FACTORIES, 'elasticsearch', ElasticClient)
+    Registry.forget_clients()
+    yield lambda **kwargs: ElasticSearch(url='http://localhost:9200/test', **kwargs)
+    Registry.forget_clients()
+
+
+@pytest.fixture
+def db(make_db):
+    return make_db(page_size=2)
+
+
+def test_close_releases_the_shared_client(db):
+    from PyStorageTexts.ElasticSearch import ElasticSearch
+    with ElasticSearch(url='http://localhost:9200/other') as other:
+        assert other.elastic is db.elastic
+    assert not db.elastic.closed
+    db.close()
+    assert db.elastic.closed
+
+# region Bulk Writes
+
+
+def test_add_stream_overwrites_like_index(db):
+    texts = TextBatch.from_texts(Text(i, f'text {i}') for i in range(5))
+    assert db.add_stream(texts, writers=2, processes=None) == 5
+    assert db.add_stream(TextBatch.from_texts([Text(3, 'updated')])) == 1
+    assert db.elastic.docs[3] == 'updated'
+    actions = [json.loads(line) for body in db.elastic.bulk_bodies
+               for line in body.decode('utf-8').splitlines()[0::2]]
+    assert all(list(a) == ['index'] for a in actions)
+
+
+def test_bulk_errors_are_collected(db, capsys):
+    db.elastic.rejected = {2}
+    texts = TextBatch.from_texts(Text(i, f'text {i}') for i in range(4))
+    assert db.add_stream(texts) == 3
+    assert [next(iter(e.values()))['_id'] for e in db.bulk_errors] == ['2']
+    assert capsys.readouterr().out == ''
+
+# region Refresh Policies
+
+
+@pytest.mark.parametrize('refresh, refreshes, params', [
+    ('immediate', 1, {}),
+    ('wait_for', 0, {'refresh': 'wait_for'}),
+    ('interval', 0, {}),
+    ('manual', 0, {}),
+])
+def test_refresh_policies(make_db, refresh: str, refreshes: int, params: dict):
+    db = make_db(refresh=refresh, refresh_interval='5s')
+    assert db.add(Text(1, 'foo'))
+    assert db.elastic.indices.refreshes == refreshes
+    assert db.elastic.write_params == [params]
+    assert db.elastic.indices.settings.get('refresh_interval') == ('5s' if refresh == 'interval' else None)
+    db.commit_all()
+    assert db.elastic.indices.refreshes == refreshes + 1
+
+
+@pytest.mark.parametrize('refresh, refreshes', [('immediate', 1), ('wait_for', 1), ('manual', 0)])
+def test_streams_refresh_once(make_db, refresh: str, refreshes: int):
+    db = make_db(refresh=refresh)
+    texts = TextBatch.from_texts(Text(i, f'text {i}') for i in range(10))
+    assert db.add_stream(texts, writers=2, processes=None) == 10
+    assert db.elastic.indices.refreshes == refreshes
+    assert all(params == {} for params in db.elastic.write_params)
+
+
+def test_unknown_refresh_policy(make_db):
+    with pytest.raises(ValueError, match='refresh policy'):
+        make_db(refresh='sometimes')
+
+
+def test_concurrent_refreshes_are_coalesced(db):
+    db.elastic.indices.blocked = threading.Event()
+    first = threading.Thread(target=db.commit_all)
+    first.start()
+    while not db.refresh_running:
+        time.sleep(0.001)
+    waiting = [threading.Thread(target=db.commit_all) for _ in range(4)]
+    for t in waiting:
+        t.start()
+    while db.refresh_requested < 5:
+        time.sleep(0.001)
+    db.elastic.indices.blocked.set()
+    for t in [first] + waiting:
+        t.join()
+    assert db.elastic.indices.refreshes == 2
+    assert db.refresh_completed == 5
+
+# region Bulk Loads
+
+
+@pytest.mark.parametrize('refresh, previous', [('immediate', None), ('interval', '5s')])
+def test_bulk_loads_pause_refreshes_and_replicas(make_db, refresh: str, previous):
+    db = make_db(refresh=refresh, refresh_interval='5s')
+    with db.bulk_load():
+        assert db.elastic.indices.settings == {'refresh_interval': '-1', 'number_of_replicas': 0}
+        db.add_stream(TextBatch.from_texts(Text(i, f'text {i}') for i in range(5)))
+    assert db.index_settings('refresh_interval', 'number_of_replicas') == {
+        'refresh_interval': previous, 'number_of_replicas': None}
+    refreshes = db.elastic.indices.refreshes
+    with pytest.raises(RuntimeError):
+        with db.bulk_load():
+            raise RuntimeError('Import failed')
+    assert db.index_settings('refresh_interval')['refresh_interval'] == previous
+    assert db.elastic.indices.refreshes == refreshes + 1
+
+# region Streaming Reads
+
+
+def test_streams_page_through_a_point_in_time(db):
+    db.elastic.docs.update({i: f'text {i}' for i in range(5)})
+    assert [m._id for m in db.iter_substring('text')] == [0, 1, 2, 3, 4]
+    assert [m._id for m in db.iter_substring('text', max_matches=3)] == [0, 1, 2]
+    assert db.elastic.open_pits == 0
+
+
+def test_abandoned_streams_close_the_point_in_time(db):
+    db.elastic.docs.update({i: f'text {i}' for i in range(5)})
+    stream = db.indexes('text')
+    assert next(stream)._id == 0
+    assert db.elastic.open_pits == 1
+    stream.close()
+    assert db.elastic.open_pits == 0
+
+
+def test_indexes_accept_compiled_patterns(db):
+    db.elastic.docs.update({1: 'foo bar', 2: 'Foo', 3: 'bar'})
+    assert [m._id for m in db.indexes(re.compile(r'foo'))] == [1]
+    assert [m._id for m in db.indexes(re.compile(r'foo', re.IGNORECASE))] == [1, 2]
+    assert db.index(re.compile(r'baz')) is None
+
+# region Bulk Reads
+
+
+def test_export_pages_with_search_after(db):
+    db.elastic.docs.update({i: f'text {i}' for i in range(7)})
+    assert [(t._id, t.content) for t in db.texts] == [(i, f'text {i}') for i in range(7)]
+    assert len(db.elastic.searches) == 4
+    assert all('from' not in body and body['pit']['id'] == 'pit' for body in db.elastic.searches)
+    assert [b.get('search_after') for b in db.elastic.searches] == [None, [1.0, 1], [1.0, 3], [1.0, 5]]
+    assert db.elastic.open_pits == 0
+
+
+def test_sliced_export(db):
+    db.elastic.docs.update({i: f'text {i}' for i in range(10)})
+    assert sorted(t._id for t in db.export(slices=3)) == list(range(10))
+    assert {b['slice']['id'] for b in db.elastic.searches} == {0, 1, 2}
+    assert db.elastic.open_pits == 0
+
+
+def test_failed_slices_stop_the_export(db):
+    db.elastic.docs.update({i: f'text {i}' for i in range(10)})
+    db.elastic.failing = {1}
+    with pytest.raises(RuntimeError, match='Slice failed'):
+        list(db.export(slices=3))
+    assert db.elastic.open_pits == 0
+
+# region Snippets
+
+
+def test_substring_snippets_are_highlighted_on_the_server(db):
+    db.elastic.docs.update({1: 'foo bar baz', 2: 'bar'})
+    matches = db.find_substring('bar', snippet_length=5)
+    assert [(m._id, m.content, m.snippets) for m in matches] == [(1, '', ['foo b']), (2, '', ['bar'])]
+    body = db.elastic.searches[-1]
+    assert body['_source'] is False and body['highlight']['fields']['content']['fragment_size'] == 5
+
+
+def test_regex_snippets_are_cut_after_verification(db):
+    db.elastic.docs.update({1: 'foo bar baz', 2: 'bar'})
+    matches = db.find_regex(r'ba[rz]', snippet_length=4)
+    assert [(m._id, m.content, m.snippets, m.spans) for m in matches] == [
+        (1, '', ['o ba'], [(4, 7)]), (2, '', ['bar'], [(0, 3)])]
+
+# region Random Reads
+
+
+def test_get_many_keeps_the_order_of_ids(db):
+    db.elastic.docs.update({i: f'text number {i}' for i in range(5)})
+    texts = db.get_many([4, 42, 0, 2])
+    assert [t and (t._id, t.content) for t in texts] == [
+        (4, 'text number 4'), None, (0, 'text number 0'), (2, 'text number 2')]
+    assert [t.content for t in db.get_many([1, 3], include_text=False)] == ['', '']
+
+
+def test_get_many_truncates_with_scripts(db):
+    db.elastic.docs.update({i: f'text number {i}' for i in range(5)})
+    texts = db.get_many([3, 42, 1], max_length=6)
+    assert [t and (t._id, t.content) for t in texts] == [(3, 'text n'), None, (1, 'text n')]
+    assert all('script_fields' in b and b['size'] <= 2 for b in db.elastic.searches)
+
+# region Batched Reads
+
+
+def test_msearch_errors_are_collected(db, capsys):
+    db.elastic.docs.update({1: 'foo', 2: 'bar'})
+    db.elastic.failing = {1}
+    query_dicts = [db.substring_query(q) for q in ['foo', 'bar', 'baz']]
+    results = db.msearch(query_dicts)
+    assert [len(r) for r in results] == [2, 0, 2]
+    assert list(db.search_errors) == [1]
+    assert capsys.readouterr().out == ''
+
+
+def test_failed_msearch_queries_are_retried(db):
+    db.elastic.docs.update({1: 'foo', 2: 'bar', 3: 'foo bar'})
+    db.elastic.failing = {0}
+    results = db.find_regex_many(['foo', 'bar'])
+    assert [sorted(m._id for m in r) for r in results] == [[1, 3], [2, 3]]
+
+
+def test_verified_substrings(db):
+    from PyStorageTexts.Verified import Verified
+    db.elastic.docs.update({1: 'foo bar', 2: 'food', 3: 'Foo'})
+    with Verified(db, processes=1) as verified:
+        matches = verified.find_substring('foo')
+        assert [(m._id, m.spans) for m in matches] == [(1, [(0, 3)]), (2, [(0, 3)])]
+        assert [m.content for m in verified.find_substring('foo', include_text=False)] == ['', '']
+    assert [m.content for m in db.find_substring('foo', include_text=False)] == ['', '', '']
+
+
+def test_scans_need_to_be_allowed(db):
+    db.elastic.docs.update({1: 'on 12/05', 2: 'none'})
+    with pytest.raises(ValueError, match='allow_scan'):
+        db.find_regex(r'\d+/\d+')
+    with pytest.raises(ValueError, match='allow_scan'):
+        db.find_regex_many(['none', r'\d+/\d+'])
+    db.allow_scan = True
+    assert [m._id for m in db.find_regex(r'\d+/\d+')] == [1]
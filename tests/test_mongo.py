@@ -0,0 +1,269 @@
+import re
+import types
+
+import pytest
+
+import PyStorageTexts.Registry as Registry
+from PyStorageHelpers import *
+
+mongomock = pytest.importorskip('mongomock')
+pymongo = pytest.importorskip('pymongo')
+bson = pytest.importorskip('bson')
+
+
+# region Stand-in Server
+
+
+class MongoClient(mongomock.MongoClient):
+
+    def __init__(self, address: str, pool_size=None):
+        super().__init__()
+
+
+insert_many = mongomock.collection.Collection.insert_many
+
+
+def insert_raw_many(self, documents, ordered=True, **kwargs):
+    """
+        `mongomock` only accepts dictionaries, not `RawBSONDocument`s.
+        Just like the server, it doesn't report errors of unacknowledged writes.
+    """
+    documents = [bson.decode(d.raw) if hasattr(d, 'raw') else d for d in documents]
+    try:
+        inserted_ids = insert_many(self, documents, ordered=ordered, **kwargs).inserted_ids
+    except pymongo.errors.BulkWriteError:
+        if self.write_concern.acknowledged:
+            raise
+        inserted_ids = []
+    return types.SimpleNamespace(
+        acknowledged=self.write_concern.acknowledged,
+        inserted_ids=inserted_ids,
+    )
+
+
+def bulk_write(self, requests, ordered=True, **kwargs):
+    """
+        `mongomock` rejects the arguments, that newer `pymongo` operations
+        pass to it, so replacements and updates are applied one by one.
+    """
+    cnt_matched, cnt_modified, cnt_upserted = 0, 0, 0
+    for op in requests:
+        if isinstance(op, pymongo.ReplaceOne):
+            result = self.replace_one(op._filter, op._doc, upsert=op._upsert)
+        else:
+            result = self.update_one(op._filter, op._doc, upsert=op._upsert)
+        cnt_matched += result.matched_count
+        cnt_modified += result.modified_count
+        cnt_upserted += result.upserted_id is not None
+    return types.SimpleNamespace(
+        acknowledged=self.write_concern.acknowledged,
+        matched_count=cnt_matched,
+        modified_count=cnt_modified,
+        upserted_count=cnt_upserted,
+    )
+
+
+@pytest.fixture
+def make_db(monkeypatch):
+    from PyStorageTexts.MongoDB import MongoDB
+    monkeypatch.setitem(Registry.CLIENT_FACTORIES, 'mongodb', MongoClient)
+    monkeypatch.setattr(mongomock.collection.Collection, 'insert_many', insert_raw_many)
+    monkeypatch.setattr(mongomock.collection.Collection, 'bulk_write', bulk_write)
+    Registry.forget_clients()
+    yield lambda url='mongodb://localhost:27017/test', **kwargs: MongoDB(url=url, **kwargs)
+    Registry.forget_clients()
+
+
+@pytest.fixture
+def db(make_db):
+    db = make_db()
+    db.add_stream([Text(i, f'document number {i}') for i in range(10)])
+    return db
+
+
+def ids_of(matches) -> list:
+    return sorted(m._id for m in matches)
+
+
+def spy_on_aggregations(db, monkeypatch) -> list:
+    pipelines = list()
+    aggregate = db.texts_collection.aggregate
+
+    def spy(pipeline, *args, **kwargs):
+        pipelines.append(pipeline)
+        return aggregate(pipeline, *args, **kwargs)
+    monkeypatch.setattr(db.texts_collection, 'aggregate', spy)
+    return pipelines
+
+# region Random Reads
+
+
+def test_get_many_keeps_the_order_of_ids(db):
+    db.batch_size = 2
+    texts = db.get_many([7, 42, 1, 3])
+    assert [t and (t._id, t.content) for t in texts] == [
+        (7, 'document number 7'), None, (1, 'document number 1'), (3, 'document number 3')]
+    assert [t.content for t in db.get_many([2, 4], include_text=False)] == ['', '']
+
+# region Batched Reads
+
+
+def test_unbounded_regex_batches_use_cursors(db, monkeypatch):
+    pipelines = spy_on_aggregations(db, monkeypatch)
+    queries = [r'number [1-3]', r'r 5', r'missing']
+    results = db.find_regex_many(queries)
+    assert list(map(ids_of, results)) == [[1, 2, 3], [5], []]
+    assert pipelines == []
+
+
+def test_regex_facets_are_capped(db, monkeypatch):
+    pipelines = spy_on_aggregations(db, monkeypatch)
+    monkeypatch.setattr(type(db), '__max_facet_ids__', 4)
+    queries = [r'number [1-3]', r'r 5', r'number', r'missing']
+    results = db.find_regex_many(queries, max_matches=2)
+    assert [len(r) for r in results] == [2, 1, 2, 0]
+    assert [len(p[0]['$facet']) for p in pipelines] == [2, 2]
+    assert all(s['$limit'] == 2 for p in pipelines
+               for stages in p[0]['$facet'].values() for s in stages if '$limit' in s)
+    assert results[1][0].content == 'document number 5'
+
+# region Streaming Reads
+
+
+def test_indexes_accept_compiled_patterns(db):
+    assert [m._id for m in db.indexes(re.compile(r'number [2-4]'))] == [2, 3, 4]
+    assert [m._id for m in db.indexes(re.compile(r'DOCUMENT 5', re.IGNORECASE))] == []
+    assert [m._id for m in db.indexes(re.compile(r'DOCUMENT NUMBER 5', re.IGNORECASE))] == [5]
+    assert db.index(re.compile(r'number \d'), include_text=False).content == ''
+    assert db.index(re.compile(r'missing')) is None
+
+
+def test_abandoned_streams_close_cursors(db, monkeypatch):
+    closed = list()
+    find = db.texts_collection.find
+
+    def spy(*args, **kwargs):
+        cursor = find(*args, **kwargs)
+        cursor.close = lambda: closed.append(True)
+        return cursor
+    monkeypatch.setattr(db.texts_collection, 'find', spy)
+    stream = db.iter_regex(r'number', max_matches=5)
+    assert next(stream)._id == 0
+    assert closed == []
+    stream.close()
+    assert closed == [True]
+
+# region Trigrams
+
+
+CORPUS = ['the big brown fox', 'as.the.day;passes', 'along the:way', 'Brown bear', 'ox', '']
+PATTERNS = [r'brown', r'b[a-z]+n', r'the[.:]', r'fox|bear', r'\w;\w', r'o', r'^B', r'(?!)']
+
+
+def test_trigrams_match_full_scans(make_db):
+    plain = make_db()
+    indexed = make_db(trigrams=True, url='mongodb://localhost:27017/indexed')
+    texts = [Text(i, c) for i, c in enumerate(CORPUS)]
+    assert plain.add(texts) == indexed.add(texts) == len(texts)
+    for pattern in PATTERNS:
+        for case_sensitive in (True, False):
+            expected = [i for i, c in enumerate(CORPUS)
+                        if re.search(pattern, c, 0 if case_sensitive else re.IGNORECASE)]
+            assert ids_of(plain.find_regex(pattern, case_sensitive=case_sensitive)) == expected
+            assert ids_of(indexed.find_regex(pattern, case_sensitive=case_sensitive)) == expected
+    assert list(map(ids_of, indexed.find_regex_many(PATTERNS[:3]))) == [[0], [0], [1, 2]]
+
+
+def test_trigrams_are_stored_and_indexed(make_db):
+    db = make_db(trigrams=True)
+    db.add_stream(TextBatch.from_texts([Text(1, 'abcd')]), processes=None)
+    db.add(Text(2, 'xyz'))
+    stored = {d['_id']: d['trigrams'] for d in db.texts_collection.find()}
+    assert stored == {1: trigram_hashes('abcd'), 2: trigram_hashes('xyz')}
+    assert any(list(dict(info['key'])) == ['trigrams'] for info in db.texts_collection.index_information().values())
+    assert 'trigrams' in db.explain(r'abc|xyz').notes[-1]
+    assert db.search_filter(r'abc', is_regex=True)['$and'][0] == {'trigrams': trigram_hash('abc')}
+
+
+def test_trigram_filters():
+    from PyStorageTexts.MongoDB import trigrams_filter
+    assert trigrams_filter(QUERY_ALL) == {}
+    assert trigrams_filter(QUERY_NONE) is None
+    query = ('and', [('trigram', 'abc'), ('trigram', 'bcd'), ('or', [('trigram', 'xyz'), ('trigram', 'uvw')])])
+    assert trigrams_filter(query) == {'$and': [
+        {'trigrams': {'$all': [trigram_hash('abc'), trigram_hash('bcd')]}},
+        {'$or': [{'trigrams': trigram_hash('xyz')}, {'trigrams': trigram_hash('uvw')}]},
+    ]}
+
+
+def test_trigrams_are_backfilled(make_db):
+    make_db().add([Text(i, c) for i, c in enumerate(CORPUS)])
+    db = make_db(trigrams=True)
+    assert db.backfill_trigrams() == len(CORPUS)
+    assert db.backfill_trigrams() == 0
+    assert ids_of(db.find_regex(r'b[a-z]+n')) == [0]
+
+# region Write Profiles
+
+
+@pytest.mark.parametrize('profile, write_concern, bypass', [
+    ('default', {}, False),
+    ('import', {'w': 1, 'j': False}, True),
+    ('unacknowledged', {'w': 0}, False),
+])
+def test_write_profiles(make_db, monkeypatch, profile: str, write_concern: dict, bypass: bool):
+    db = make_db(write_profile=profile)
+    assert db.writes_collection.write_concern.document == write_concern
+    assert db.texts_collection.write_concern.document == {}
+    calls = list()
+    monkeypatch.setattr(db.writes_collection, 'insert_many', lambda docs, **kwargs: calls.append(
+        kwargs) or insert_raw_many(db.writes_collection, docs, **kwargs))
+    assert db.add_stream([Text(i, f'text {i}') for i in range(3)]) == 3
+    assert all(c['bypass_document_validation'] is bypass for c in calls)
+    assert db.count_texts() == 3
+
+
+def test_unknown_write_profile(make_db):
+    with pytest.raises(ValueError, match='write profile'):
+        make_db(write_profile='reckless')
+
+
+def test_partial_failures_are_counted(db):
+    texts = [Text(i, f'new {i}') for i in range(8, 13)]
+    assert db.add(texts, upsert=False) == 3
+    assert db.get(8).content == 'document number 8'
+    assert db.add_stream(TextBatch.from_texts(Text(i, f'newer {i}') for i in range(12, 16))) == 3
+    assert db.count_texts() == 16
+
+
+def test_upserts_count_replaced_and_inserted(db):
+    assert db.add([Text(9, 'replaced'), Text(10, 'inserted')]) == 2
+    assert db.add(Text(9, 'replaced')) is True
+    assert [t.content for t in db.get_many([9, 10])] == ['replaced', 'inserted']
+
+
+def test_unacknowledged_writes_are_assumed_successful(make_db):
+    db = make_db(write_profile='unacknowledged')
+    assert db.add([Text(1, 'foo'), Text(2, 'bar')]) == 2
+    assert db.add([Text(1, 'foo'), Text(3, 'baz')], upsert=False) == 2
+
+# region Bulk Loads
+
+
+def indexed_fields(db) -> set:
+    return {field for info in db.texts_collection.index_information().values() for field, _ in info['key']}
+
+
+def test_bulk_loads_rebuild_the_indexes(make_db):
+    db = make_db(trigrams=True)
+    indexed = indexed_fields(db)
+    assert indexed == {'_id', 'content', 'trigrams'}
+    with db.bulk_load():
+        assert indexed_fields(db) <= {'_id'}
+        db.add_stream([Text(i, f'text {i}') for i in range(5)])
+    assert indexed_fields(db) == indexed
+    with pytest.raises(RuntimeError):
+        with db.bulk_load():
+            raise RuntimeError('Import failed')
+    assert indexed_fields(db) == indexed
+    assert db.count_texts() == 5
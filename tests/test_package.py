@@ -0,0 +1,28 @@
+import sys
+import json
+import subprocess
+
+import PyStorageTexts
+
+DRIVERS = ['elasticsearch', 'pymongo', 'bson', 'motor', 'sqlalchemy', 'numpy']
+
+
+def loaded_drivers(statement: str) -> list:
+    script = f'import sys, json\n{statement}\n' \
+        f'print(json.dumps([d for d in {DRIVERS!r} if d in sys.modules]))'
+    output = subprocess.run([sys.executable, '-c', script], check=True,
+                            stdout=subprocess.PIPE).stdout
+    return json.loads(output)
+
+
+def test_package_imports_no_drivers():
+    assert loaded_drivers('import PyStorageTexts') == []
+    assert loaded_drivers('import PyStorageTexts; PyStorageTexts.SuffixArray') == ['numpy']
+
+
+def test_backends_stay_classes_after_submodule_imports():
+    from PyStorageTexts.SuffixArray import SuffixArray
+    from PyStorageTexts.Cached import Cached
+    assert PyStorageTexts.SuffixArray is SuffixArray
+    assert PyStorageTexts.Cached is Cached
+    assert 'SuffixArray' in dir(PyStorageTexts)
@@ -0,0 +1,92 @@
+import random
+
+import pytest
+
+from PyStorageHelpers import *
+
+
+def write_csv(tmp_path, ids=('7', '7', '9')) -> str:
+    path = tmp_path / 'texts.csv'
+    contents = ['"foo, "', 'bar', 'baz']
+    path.write_text('id,content\n' + ''.join(f'{i},{c}\n' for i, c in zip(ids, contents)))
+    return str(path)
+
+
+def read_both(path: str, **kwargs):
+    texts = [(t._id, t.content) for t in yield_texts_from_csv(path, **kwargs)]
+    batches = [(t._id, t.content) for b in yield_text_batches_from_csv(
+        path, processes=1, range_bytes=8, **kwargs) for t in b]
+    return texts, batches
+
+
+def test_both_readers_produce_integer_ids(tmp_path):
+    texts, batches = read_both(write_csv(tmp_path), id_column='id')
+    assert texts == batches == [(7, 'foo, bar'), (9, 'baz')]
+    assert all(type(i) is int for i, _ in texts + batches)
+
+
+def parse_hex(value: str) -> int:
+    return int(value, 16)
+
+
+def test_ids_are_parsed_with_id_parser(tmp_path):
+    path = write_csv(tmp_path, ids=('a', 'a', 'f'))
+    texts, batches = read_both(path, id_column='id', id_parser=parse_hex)
+    assert texts == batches == [(10, 'foo, bar'), (15, 'baz')]
+
+
+def test_non_integer_ids_are_rejected_by_both_readers(tmp_path):
+    path = write_csv(tmp_path, ids=('x', 'x', 'y'))
+    with pytest.raises(TypeError):
+        list(yield_texts_from_csv(path, id_column='id', id_parser=str))
+    with pytest.raises(TypeError):
+        list(yield_text_batches_from_csv(path, id_column='id', id_parser=str, processes=1))
+
+
+def write_random_csv(tmp_path, seed: int) -> str:
+    random.seed(seed)
+    pieces = ['foo', 'bar, baz', 'line\nbreak', 'say "hi"', '', '"', 'ü']
+    rows = list()
+    _id = 1
+    for _ in range(200):
+        _id += random.random() < 0.4
+        content = ''.join(random.choice(pieces) for _ in range(random.randint(0, 4)))
+        if any(c in content for c in ',\n"'):
+            content = '"' + content.replace('"', '""') + '"'
+        rows.append(f'{_id},{content}\n')
+    path = tmp_path / f'random_{seed}.csv'
+    path.write_text('id,content\n' + ''.join(rows), encoding='utf-8')
+    return str(path)
+
+
+@pytest.mark.parametrize('seed', range(4))
+@pytest.mark.parametrize('range_bytes', [1, 16, 97, 1 << 20])
+def test_parallel_reader_matches_sequential(tmp_path, seed: int, range_bytes: int):
+    path = write_random_csv(tmp_path, seed)
+    for kwargs in [dict(id_column='id'), dict(), dict(id_column='id', sections=True)]:
+        texts = [(t._id, t.content) for t in yield_texts_from_csv(path, **kwargs)]
+        batches = [(t._id, t.content) for b in yield_text_batches_from_csv(
+            path, processes=1, range_bytes=range_bytes, **kwargs) for t in b]
+        assert texts == batches
+        assert len(texts) > 0
+
+
+def test_ranges_start_outside_of_quotes(tmp_path):
+    path = write_random_csv(tmp_path, seed=42)
+    with open(path, 'rb') as f:
+        header = f.readline()
+        data = header + f.read()
+    boundaries = find_csv_boundaries(path, len(header), range_bytes=32)
+    assert boundaries[0] == len(header) and boundaries[-1] == len(data)
+    assert len(boundaries) > 10
+    for start in boundaries[1:-1]:
+        assert data[start - 1:start] == b'\n'
+        assert data[:start].count(b'"') % 2 == 0
+
+
+def test_worker_processes_preserve_order(tmp_path):
+    path = write_random_csv(tmp_path, seed=7)
+    texts = [(t._id, t.content) for t in yield_texts_from_csv(path, id_column='id')]
+    batches = [(t._id, t.content) for b in yield_text_batches_from_csv(
+        path, id_column='id', processes=2, range_bytes=64) for t in b]
+    assert texts == batches
@@ -0,0 +1,25 @@
+import pytest
+
+from PyStorageHelpers import *
+
+
+@pytest.mark.parametrize('pattern', [r'\bfoo\b', r'foo\b', r'\bfoo'])
+def test_lucene_keeps_padding_around_word_boundaries(pattern: str):
+    # The standard tokenizer keeps "foo.bar" and "foo's" as single tokens.
+    assert translate_regex(pattern, 'lucene') == '.*foo.*'
+
+
+@pytest.mark.parametrize('pattern, expected', [
+    (r'(?s:a.b)c', r'(?s:a.b)c'),
+    (r'(?i:ab)(?-i:c)', r'(?i:ab)(?-i:c)'),
+    (r'x(?m:^a$)y', r'x(?:^a$)y'),
+    (r'(?m)a(?-m:^b$)', r'(?m)a(?:\Ab(?=\n?\z))'),
+])
+def test_pcre_scoped_flags(pattern: str, expected: str):
+    assert translate_regex(pattern, 'pcre') == expected
+
+
+@pytest.mark.parametrize('pattern', [r'(?a:\w+)', r'(?a)\w'])
+def test_pcre_rejects_ascii_classes(pattern: str):
+    with pytest.raises(ValueError):
+        translate_regex(pattern, 'pcre')
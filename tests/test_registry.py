@@ -0,0 +1,116 @@
+import os
+import pathlib
+import importlib
+
+import pytest
+
+import PyStorageTexts.Registry as Registry
+from PyStorageTexts.Registry import connect
+
+# region Connect
+
+
+def test_connect_uses_classes_of_its_package(monkeypatch):
+    # The same sources, imported under the name of the distribution.
+    monkeypatch.syspath_prepend(str(pathlib.Path(__file__).parents[1]))
+    regexum = importlib.import_module('regexum')
+    db = regexum.connect('memory://texts')
+    assert isinstance(db, regexum.SuffixArray)
+    assert type(db).__module__ == 'regexum.SuffixArray'
+
+
+def test_connect_rejects_unknown_schemes():
+    with pytest.raises(ValueError, match='ftp'):
+        connect('ftp://localhost/texts')
+
+# region Shared Clients
+
+
+class Client(object):
+
+    def __init__(self, address: str, pool_size=None):
+        self.address = address
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def clients(monkeypatch):
+    monkeypatch.setitem(Registry.CLIENT_FACTORIES, 'test', Client)
+    Registry.forget_clients()
+    yield
+    Registry.forget_clients()
+
+
+def test_clients_are_shared_per_server(clients):
+    first = Registry.shared_client('test', 'test://host:1/first')
+    second = Registry.shared_client('test', 'test://host:1/second')
+    other = Registry.shared_client('test', 'test://host:2/first')
+    assert first is second and first is not other
+    assert first.address == 'test://host:1'
+    assert Registry.release_client('test', 'test://host:1/first') is None
+    assert Registry.release_client('test', 'test://host:1/second') is first
+    assert Registry.shared_client('test', 'test://host:1/first') is not first
+
+
+def test_sync_backends_release_clients(clients, monkeypatch):
+    mongomock = pytest.importorskip('mongomock')
+
+    class MongoClient(mongomock.MongoClient):
+
+        def __init__(self, address: str, pool_size=None):
+            super().__init__()
+            self.closed = False
+
+        def close(self):
+            self.closed = True
+
+    from PyStorageTexts.MongoDB import MongoDB
+    monkeypatch.setitem(Registry.CLIENT_FACTORIES, 'mongodb', MongoClient)
+    first = MongoDB(url='mongodb://localhost:27017/first')
+    with MongoDB(url='mongodb://localhost:27017/second') as second:
+        assert second.db is first.db
+    assert not first.db.closed
+    first.close()
+    assert first.db.closed
+
+
+# region Fork
+
+
+class Backend(Registry.ForkSafeClients):
+    __client_attributes__ = ('client',)
+
+    def __init__(self, url: str):
+        self.url = url
+        self.reconnect()
+        Registry.reconnect_after_fork(self)
+
+    def reconnect(self):
+        self.client = Registry.shared_client('test', self.url)
+
+
+def run_in_child(check) -> int:
+    pid = os.fork()
+    if pid == 0:
+        try:
+            os._exit(0 if check() else 1)
+        finally:
+            os._exit(2)
+    return os.waitstatus_to_exitcode(os.waitpid(pid, 0)[1])
+
+
+@pytest.mark.skipif(not hasattr(os, 'register_at_fork'), reason='needs fork')
+def test_children_reconnect_lazily(clients):
+    db = Backend('test://host/texts')
+    inherited = db.client
+
+    def check() -> bool:
+        if 'client' in db.__dict__:
+            return False
+        return db.client is not inherited and db.client is Registry.shared_client('test', db.url)
+
+    assert run_in_child(check) == 0
+    assert db.client is inherited
@@ -0,0 +1,42 @@
+from PyStorageTexts.Sectioned import Sectioned
+from PyStorageTexts.SuffixArray import SuffixArray
+from PyStorageHelpers import *
+
+
+def make_db(tmp_path) -> Sectioned:
+    path = tmp_path / 'texts.csv'
+    rows = [(7, 'foo bar'), (7, 'no match'), (7, 'bar foo'), (9, 'foo'), (12, 'bar')]
+    path.write_text('id,content\n' + ''.join(f'{i},{c}\n' for i, c in rows))
+    db = Sectioned(SuffixArray())
+    db.add_stream(yield_texts_from_csv(str(path), id_column='id', sections=True))
+    return db
+
+
+def test_sections_are_collapsed_into_parents(tmp_path):
+    db = make_db(tmp_path)
+    assert db.count_texts() == 5
+    matches = sorted(db.find_substring('foo'), key=lambda m: m._id)
+    assert [(m._id, m.sections, m.rating) for m in matches] == [(7, [0, 2], 2), (9, [0], 1)]
+    assert matches[0].content in ('foo bar', 'bar foo')
+    assert sorted(m._id for m in db.find_regex(r'^bar')) == [7, 12]
+
+
+def test_max_matches_counts_parents(tmp_path):
+    db = make_db(tmp_path)
+    sections = [m._id for m in db.backend.find_regex('o|b')]
+    parents = list(dict.fromkeys(i // MAX_SECTIONS_PER_TEXT for i in sections))
+    matches = db.find_regex('o|b', max_matches=2)
+    assert [m._id for m in matches] == parents[:2]
+    assert [len(m.sections) for m in matches] == [
+        sum(i // MAX_SECTIONS_PER_TEXT == p for i in sections) for p in parents[:2]]
+
+
+def test_collapse_sections_joins_snippets():
+    matches = [
+        TextMatch(section_id(3, 1), 'first', rating=1, spans=[(0, 2)], snippets=['fi']),
+        TextMatch(section_id(4, 0), 'other', rating=1),
+        TextMatch(section_id(3, 4), 'second', rating=2, spans=[(1, 3)], snippets=['ec']),
+    ]
+    collapsed = collapse_sections(matches)
+    assert [(m._id, m.sections, m.rating) for m in collapsed] == [(3, [1, 4], 3), (4, [0], 1)]
+    assert (collapsed[0].content, collapsed[0].spans, collapsed[0].snippets) == ('first', [(0, 2)], ['fi', 'ec'])
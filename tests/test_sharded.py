@@ -0,0 +1,102 @@
+import contextlib
+
+import pytest
+
+from PyStorageTexts.Sharded import Sharded, shard_of, merge_by_rating
+from PyStorageTexts.SuffixArray import SuffixArray
+from PyStorageHelpers import *
+
+
+@pytest.fixture
+def db():
+    db = Sharded([SuffixArray() for _ in range(3)])
+    yield db
+    db.close()
+
+
+def test_shard_of_is_stable_and_checks_types():
+    assert [shard_of(i, 4) for i in range(8)] == [shard_of(i, 4) for i in range(8)]
+    assert all(0 <= shard_of(i, 3) < 3 for i in range(-50, 50))
+    with pytest.raises(TypeError, match='integers'):
+        shard_of('42', 3)
+    with pytest.raises(TypeError, match='integers'):
+        shard_of(4.2, 3)
+
+
+def test_texts_are_partitioned_by_id(db):
+    texts = [Text(i, f'text {i}') for i in range(30)]
+    assert db.add(texts[:15]) == 15
+    assert db.add(TextBatch.from_texts(texts[15:])) == 15
+    assert db.count_texts() == 30
+    for i, shard in enumerate(db.shards):
+        assert all(shard_of(t._id, 3) == i for t in shard.texts)
+    parts = db.partition(list(range(30)))
+    assert [len(p) for p in parts] == [s.count_texts() for s in db.shards]
+    found = db.get_many([29, 100, 0])
+    assert [t and t.content for t in found] == ['text 29', None, 'text 0']
+    assert db.remove([0, 1, 2]) == 3
+    assert db.count_texts() == 27
+
+
+def test_scatter_skips_empty_parts(db):
+    calls = list()
+    parts = [[1], [], [2, 3]]
+    results = db.scatter(parts, lambda s, part: calls.append(s) or len(part))
+    assert results == [1, 2]
+    assert calls.count(db.shards[1]) == 0
+
+
+def test_merge_by_rating():
+    results = [
+        [TextMatch(1, rating=1), TextMatch(2, rating=5)],
+        [TextMatch(3, rating=3)],
+        [],
+    ]
+    assert [m._id for m in merge_by_rating(results)] == [2, 3, 1]
+    assert [m._id for m in merge_by_rating(results, max_matches=2)] == [2, 3]
+
+
+def test_merged_searches_respect_max_matches(db):
+    db.add([Text(i, 'ab' * i) for i in range(1, 20)])
+    assert [m._id for m in db.find_substring('ab')] == list(range(19, 0, -1))
+    matches = db.find_substring('ab', max_matches=5)
+    assert len(matches) == 5
+    assert [m.rating for m in matches] == sorted((m.rating for m in matches), reverse=True)
+    assert [len(r) for r in db.find_regex_many(['ab', 'b' * 3], max_matches=2)] == [2, 0]
+
+
+def test_merge_streams_stops_reading_after_max_matches(db):
+    consumed = [0, 0, 0]
+    closed = set()
+
+    def stream(i: int, ratings: list):
+        try:
+            for r in ratings:
+                consumed[i] += 1
+                yield TextMatch(i, rating=r)
+        finally:
+            closed.add(i)
+
+    streams = [stream(0, [9, 8, 7, 6]), stream(1, [5, 4]), stream(2, [10, 1, 0])]
+    merged = list(db.merge_streams(streams, max_matches=3))
+    assert [m.rating for m in merged] == [10, 9, 8]
+    assert consumed == [2, 1, 2]
+    assert closed == {0, 1, 2}
+
+
+def test_bulk_loads_enter_every_shard(db, monkeypatch):
+    events = list()
+
+    def recording(i: int):
+        @contextlib.contextmanager
+        def bulk_load():
+            events.append(('enter', i))
+            yield
+            events.append(('exit', i))
+        return bulk_load
+    for i, s in enumerate(db.shards):
+        monkeypatch.setattr(s, 'bulk_load', recording(i))
+    with db.bulk_load() as loaded:
+        assert loaded is db
+        assert events == [('enter', 0), ('enter', 1), ('enter', 2)]
+    assert events[3:] == [('exit', 2), ('exit', 1), ('exit', 0)]
@@ -0,0 +1,182 @@
+import pytest
+
+from PyStorageHelpers import *
+
+sa = pytest.importorskip('sqlalchemy')
+
+
+@pytest.fixture
+def db():
+    from PyStorageTexts.SQLite import SQLite
+    db = SQLite(url='sqlite:///:memory:')
+    db.add([
+        Text(1, 'the big brown fox'),
+        Text(2, 'as.the.day;passes'),
+        Text(3, 'along the:way'),
+    ])
+    yield db
+    db.close()
+
+
+def ids_of(matches) -> list:
+    return sorted(m._id for m in matches)
+
+# region Random Reads
+
+
+def test_get_many_keeps_the_order_of_ids(db, monkeypatch):
+    monkeypatch.setattr(type(db), '__max_batch_size__', 2)
+    texts = db.get_many([3, 42, 1, 2])
+    assert [t and (t._id, t.content) for t in texts] == [
+        (3, 'along the:way'), None, (1, 'the big brown fox'), (2, 'as.the.day;passes')]
+
+
+def test_get_many_truncates_on_the_server(db):
+    assert [t.content for t in db.get_many([1, 3], max_length=5)] == ['the b', 'along']
+    assert [t.content for t in db.get_many([1, 3], include_text=False)] == ['', '']
+    assert [t.content for t in db.get_many([1], max_length=100)] == ['the big brown fox']
+
+# region Search Queries
+
+
+def test_triggers_keep_the_trigram_index_in_sync(db):
+    assert ids_of(db.find_substring('brown')) == [1]
+    assert db.add(Text(1, 'the big red fox'))
+    assert ids_of(db.find_substring('brown')) == []
+    assert ids_of(db.find_substring('red fox')) == [1]
+    assert db.remove(3)
+    assert ids_of(db.find_substring('the')) == [1, 2]
+    assert db.count_texts() == 2
+
+
+def test_substrings_of_any_length_and_case(db):
+    assert ids_of(db.find_substring('he')) == [1, 2, 3]
+    assert ids_of(db.find_substring('.')) == [2]
+    assert ids_of(db.find_substring('THE', case_sensitive=False)) == [1, 2, 3]
+    assert ids_of(db.find_substring('THE')) == []
+    assert len(db.find_substring('the', max_matches=2)) == 2
+    assert [m.content for m in db.find_substring('fox', include_text=False)] == ['']
+
+
+def test_regex_queries(db):
+    assert ids_of(db.find_regex(r'b[a-z]+n')) == [1]
+    assert ids_of(db.find_regex(r'the[.:]')) == [2, 3]
+    assert ids_of(db.find_regex(r'\w;\w')) == [2]
+    assert ids_of(db.find_regex(r'BIG|WAY', case_sensitive=False)) == [1, 3]
+    assert ids_of(db.find_regex(r'(?!)')) == []
+
+
+def test_anchored_patterns_scan_a_range_of_the_index(db):
+    db.add([Text(4, 'along'), Text(5, 'alonf'), Text(6, 'alonh the way')])
+    plan = db.explain(r'^along.+way')
+    assert plan.operation == 'prefix' and plan.query == 'along'
+    assert ids_of(db.find_regex(r'^along.+way')) == [3]
+    assert ids_of(db.find_regex(r'^along')) == [3, 4]
+
+# region Snippets
+
+
+@pytest.mark.parametrize('method, query, case_sensitive', [
+    ('find_substring', 'the', True),
+    ('find_substring', 'THE', False),
+    ('find_substring', 'e', True),
+    ('find_regex', r'b[a-z]+n', True),
+    ('find_regex', r'DAY|WAY', False),
+    ('find_regex', r'^along', True),
+])
+def test_snippets_match_the_in_memory_backend(db, method: str, query: str, case_sensitive: bool):
+    from PyStorageTexts.SuffixArray import SuffixArray
+    reference = SuffixArray()
+    reference.add(list(db.texts))
+
+    def snippets_of(backend) -> list:
+        matches = getattr(backend, method)(query, case_sensitive=case_sensitive, snippet_length=6)
+        assert all(m.content == '' for m in matches)
+        return sorted((m._id, m.snippets, m.spans) for m in matches)
+
+    assert snippets_of(db) == snippets_of(reference)
+    assert len(snippets_of(db)) > 0
+
+
+def test_snippets_start_half_a_window_before_the_match(db):
+    matches = db.find_substring('fox', snippet_length=8)
+    assert [(m.snippets, m.spans) for m in matches] == [(['own fox'], [(14, 17)])]
+    matches = db.find_substring('the', snippet_length=100)
+    assert sorted(m.snippets[0] for m in matches) == sorted(t.content for t in db.texts)
+
+# region Bulk Writes
+
+
+def test_inserts_skip_existing_rows_and_upserts_replace_them(db, monkeypatch):
+    monkeypatch.setattr(type(db), '__max_batch_size__', 2)
+    texts = [Text(3, 'changed'), Text(4, 'new one'), Text(5, 'new two')]
+    assert db.add(texts, upsert=False) == 2
+    assert db.get(3).content == 'along the:way'
+    assert db.add(TextBatch.from_texts([Text(3, 'changed'), Text(6, 'new three')]), upsert=True) == 2
+    assert [t.content for t in db.get_many([3, 6])] == ['changed', 'new three']
+    assert db.count_texts() == 6
+
+
+def test_streams_are_inserted_in_batches(db, monkeypatch):
+    batches = list()
+    monkeypatch.setattr(type(db), '__max_batch_size__', 10)
+    insert_rows = db.insert_rows
+
+    def spy(rows, upsert=True):
+        batches.append(len(rows))
+        return insert_rows(rows, upsert=upsert)
+    monkeypatch.setattr(db, 'insert_rows', spy)
+    texts = [Text(i, f'text {i}') for i in range(10, 45)]
+    assert db.add_stream(texts) == 35
+    assert sum(batches) == 35 and max(batches) <= 10
+    assert db.count_texts() == 38
+
+
+def test_orm_fallback_for_other_dialects(db, monkeypatch):
+    monkeypatch.setattr(db, 'insert_statement', lambda upsert=True: None)
+    assert db.add([Text(1, 'replaced'), Text(7, 'added')]) == 2
+    assert [t.content for t in db.get_many([1, 7])] == ['replaced', 'added']
+
+
+def schema_of(db) -> set:
+    with db.engine.connect() as connection:
+        rows = connection.execute(sa.text("SELECT name FROM sqlite_master WHERE type IN ('index', 'trigger')"))
+        return {row[0] for row in rows}
+
+
+def test_bulk_loads_rebuild_the_indexes_once(db):
+    indexed = schema_of(db)
+    assert {'content_index', 'table_texts_ai', 'table_texts_ad', 'table_texts_au'} <= indexed
+    with db.bulk_load():
+        assert not schema_of(db) & {'content_index', 'table_texts_ai', 'table_texts_ad', 'table_texts_au'}
+        db.add_stream([Text(i, f'imported text {i}') for i in range(10, 20)])
+        assert ids_of(db.find_substring('imported')) == []
+    assert schema_of(db) == indexed
+    assert ids_of(db.find_substring('imported')) == list(range(10, 20))
+    assert ids_of(db.find_regex(r'^imported text 1[25]')) == [12, 15]
+
+
+def test_bulk_loads_restore_the_indexes_on_failures(db):
+    indexed = schema_of(db)
+    with pytest.raises(RuntimeError):
+        with db.bulk_load():
+            db.add(Text(10, 'half imported'))
+            raise RuntimeError('Import failed')
+    assert schema_of(db) == indexed
+    assert ids_of(db.find_substring('half')) == [10]
+
+
+def test_imports_defer_the_indexes(db, tmp_path, monkeypatch):
+    loads = list()
+    bulk_load = db.bulk_load
+
+    def spy():
+        loads.append(True)
+        return bulk_load()
+    monkeypatch.setattr(db, 'bulk_load', spy)
+    path = tmp_path / 'texts.csv'
+    path.write_text('id,content\n10,"imported, once"\n11,imported twice\n')
+    assert import_texts(db, str(path), id_column='id') == 2
+    assert db.add_stream([Text(12, 'imported again')], defer_indexes=True) == 1
+    assert loads == [True, True]
+    assert ids_of(db.find_substring('imported')) == [10, 11, 12]
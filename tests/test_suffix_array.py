@@ -0,0 +1,37 @@
+import re
+
+import pytest
+
+from PyStorageTexts.SuffixArray import SuffixArray
+from PyStorageHelpers import *
+
+
+def counts_of(matches) -> dict:
+    return {m._id: m.rating for m in matches}
+
+
+@pytest.mark.parametrize('repeats', [32, 64, 128, 192])
+def test_ranges_ending_on_block_boundaries(repeats: int):
+    # Matching ranges of exactly 64, 128, ... suffixes end
+    # on the edges of the blocks, scanned by `count_matches`.
+    db = SuffixArray()
+    db.add([Text(1, 'ab' * repeats), Text(2, 'zzz')])
+    assert counts_of(db.find_substring('a')) == {1: repeats}
+    assert counts_of(db.find_substring('b')) == {1: repeats}
+    assert counts_of(db.find_regex('ab')) == {1: repeats}
+    assert counts_of(db.find_substring('z')) == {2: 3}
+
+
+def test_matches_across_documents():
+    db = SuffixArray()
+    db.add([Text(i, 'x' * i) for i in range(1, 100)])
+    assert counts_of(db.find_substring('xx')) == {i: i - 1 for i in range(2, 100)}
+
+
+def test_indexes_accept_substrings_and_patterns():
+    db = SuffixArray()
+    db.add([Text(1, 'Needle in a haystack'), Text(2, 'no needles here')])
+    assert counts_of(db.indexes('needle')) == {2: 1}
+    assert counts_of(db.indexes(re.compile('needle', re.IGNORECASE))) == {1: 1, 2: 1}
+    assert db.index('haystack')._id == 1
+    assert db.index('thread') is None
@@ -0,0 +1,72 @@
+import re
+import random
+
+import pytest
+
+from PyStorageTexts.TrigramIndex import TrigramIndex
+from PyStorageTexts.SuffixArray import SuffixArray
+from PyStorageHelpers import *
+
+
+class Flaky(SuffixArray):
+    """ Silently skips writes and removals of the `rejected` IDs. """
+
+    def __init__(self, rejected=()):
+        SuffixArray.__init__(self)
+        self.rejected = set(rejected)
+
+    def add(self, one_or_many_texts, upsert=True) -> int:
+        if isinstance(one_or_many_texts, Text) and one_or_many_texts._id in self.rejected:
+            return False
+        return super().add(one_or_many_texts, upsert=upsert)
+
+    def remove(self, one_or_many_texts) -> int:
+        if isinstance(one_or_many_texts, int) and one_or_many_texts in self.rejected:
+            return False
+        return super().remove(one_or_many_texts)
+
+
+def brute_force(db: TrigramIndex, query: str) -> list:
+    pattern = re.compile(query)
+    return sorted(i for i, c in db.backend.contents.items() if pattern.search(c))
+
+
+def found(db: TrigramIndex, query: str) -> list:
+    return sorted(m._id for m in db.find_regex(query))
+
+
+def test_failed_upserts_keep_old_contents_findable():
+    db = TrigramIndex(Flaky())
+    db.add([Text(1, 'hello world'), Text(2, 'hello there')])
+    db.backend.rejected = {1}
+    assert db.add([Text(1, 'goodbye'), Text(2, 'goodbye')]) == 1
+    assert found(db, 'hello') == brute_force(db, 'hello') == [1]
+    assert db.remove([1, 2]) == 1
+    assert found(db, 'hello') == [1]
+
+
+def test_successful_upserts_drop_old_trigrams():
+    db = TrigramIndex(SuffixArray())
+    db.add(Text(1, 'hello world'))
+    db.add(Text(1, 'goodbye'))
+    assert db.candidates('hello') == set()
+    assert found(db, 'good') == [1]
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_matches_brute_force(seed: int):
+    rng = random.Random(seed)
+    alphabet = 'abc '
+
+    def random_text() -> str:
+        return ''.join(rng.choice(alphabet) for _ in range(rng.randint(0, 30)))
+
+    db = TrigramIndex(Flaky())
+    db.add_stream([Text(i, random_text()) for i in range(50)])
+    db.backend.rejected = set(rng.sample(range(60), 20))
+    for _ in range(5):
+        db.add([Text(rng.randrange(60), random_text()) for _ in range(10)])
+        db.remove([rng.randrange(60) for _ in range(3)])
+    queries = ['abc', 'a+b', 'ab|ca', '^ab', 'c a', 'b[ac]{2}c', '(ab)+c', 'a.c', 'x']
+    for query in queries:
+        assert found(db, query) == brute_force(db, query), query
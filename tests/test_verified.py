@@ -0,0 +1,16 @@
+import pytest
+
+from PyStorageTexts.Verified import Verified
+from PyStorageTexts.SuffixArray import SuffixArray
+from PyStorageHelpers import *
+
+
+def test_close_stops_the_process_pool():
+    with Verified(SuffixArray(), processes=2) as db:
+        db.add([Text(1, 'foo bar'), Text(2, 'bar')])
+        assert [m._id for m in db.find_substring('foo')] == [1]
+        pool = db.executor
+        assert pool is not None
+    assert db.executor is None
+    with pytest.raises(RuntimeError):
+        pool.submit(len, 'foo')